@@ -46,8 +46,8 @@ admin.site.register(models.ProfileCoverPhoto, ProfileCoverPhotoAdmin)
 
 # Prekey bundle model admin panel
 class PreKeyBundleAdmin(admin.ModelAdmin):
-    list_display = ('user', 'reg_id')
-    readonly_fields = ('reg_id', 'device_id', 'prekeys', 'signed_prekey', 'identity_key')
+    list_display = ('user', 'reg_id', 'prekeys_left')
+    readonly_fields = ('reg_id', 'device_id', 'prekeys', 'signed_prekey', 'identity_key', 'prekeys_left', 'is_low_signaled')
 
 admin.site.register(models.PreKeyBundle, PreKeyBundleAdmin)
 
@@ -0,0 +1,67 @@
+import functools
+import user_agents
+
+from django.conf import settings
+from django.core.cache import cache
+from .models import User
+
+
+# User Agent
+@functools.lru_cache(maxsize=1024)
+def user_agent_families(user_agent_header):
+    '''(browser, device, os) families of a user agent header, memoized as clients repeat the same header.'''
+    user_agent = user_agents.parse(user_agent_header)
+    return user_agent.browser.family, user_agent.device.family, user_agent.os.family
+
+
+
+# Authentication Cache
+class AuthCache:
+    '''
+        Login state and user row of authenticated requests read in a single cache round trip.
+        1. user rows are cached for settings.AUTH_USER_CACHE_SECONDS.
+        2. cached user is dropped by User.save and User.delete, so profile and settings changes are seen on next request.
+        3. database is queried only when login state exists and user is not cached.
+    '''
+
+    @staticmethod
+    def __user_key(uid):
+        return f'{uid}:user'
+
+    @staticmethod
+    def __login_state_key(uid):
+        return f'{uid}:lst'
+
+    @staticmethod
+    def get(uid):
+        '''returns (user, login_state), both None if user is not logged in.'''
+        user_key = AuthCache.__user_key(uid)
+        login_state_key = AuthCache.__login_state_key(uid)
+
+        values = cache.get_many([user_key, login_state_key])
+        login_state = values.get(login_state_key)
+        if login_state is None:
+            return None, None
+
+        user = values.get(user_key)
+        if user is None:
+            user = User.objects.get(uid=uid)
+            cache.set(user_key, user, timeout=settings.AUTH_USER_CACHE_SECONDS)
+
+        return user, login_state
+
+    @staticmethod
+    def get_user(uid):
+        '''returns cached user, fetching it from database on miss.'''
+        user_key = AuthCache.__user_key(uid)
+
+        user = cache.get(user_key)
+        if user is None:
+            user = User.objects.get(uid=uid)
+            cache.set(user_key, user, timeout=settings.AUTH_USER_CACHE_SECONDS)
+
+        return user
+
+    @staticmethod
+    def invalidate(uid):
+        cache.delete(AuthCache.__user_key(uid))
@@ -1,9 +1,9 @@
-import user_agents
 from rest_framework import authentication
 from rest_framework import exceptions
 from .models import User
 from .jwt_token import Jwt, EncryptedJwt
-from .services import LoginStateTokenService, WebLoginStateTokenService
+from .auth_cache import AuthCache, user_agent_families
+from .services import WebLoginStateTokenService
 from channels.middleware import BaseMiddleware
 from channels.db import database_sync_to_async
 from urllib.parse import parse_qs
@@ -22,22 +22,20 @@ class UserAuthentication(authentication.BaseAuthentication):
                 return None
 
             try:
-                # fetching user from database
-                user = User.objects.get(uid=payload_data['uid'])
+                # fetching user and login state in a single cache round trip
+                user, login_state = AuthCache.get(payload_data['uid'])
             except User.DoesNotExist:
                 raise exceptions.AuthenticationFailed('No such Account found.')
 
             try:
-                login_state = LoginStateTokenService.get(user=user)
-
                 if login_state['login_token'] != request.META['HTTP_LST']:
                     return None
 
                 # passing user agent data
-                ua = user_agents.parse(request.META['HTTP_USER_AGENT'])
+                browser, device, os = user_agent_families(request.META['HTTP_USER_AGENT'])
 
                 # validing login state token data with user agent
-                if login_state['browser'] != ua.browser.family or login_state['device'] != ua.device.family or login_state['os'] != ua.os.family:
+                if login_state['browser'] != browser or login_state['device'] != device or login_state['os'] != os:
                     return None
             except:
                 raise exceptions.AuthenticationFailed('No Login user found.')
@@ -61,8 +59,8 @@ class UserWebAuthentication(authentication.BaseAuthentication):
                 return None
 
             try:
-                # fetching user from database
-                user = User.objects.get(uid=payload_data['uid'])
+                # fetching user from cache
+                user = AuthCache.get_user(payload_data['uid'])
             except User.DoesNotExist:
                 raise exceptions.AuthenticationFailed('No such Account found.')
 
@@ -70,10 +68,10 @@ class UserWebAuthentication(authentication.BaseAuthentication):
                 login_state = WebLoginStateTokenService.get(user=user, token=request.META['HTTP_LST'])
 
                 # passing user agent data
-                ua = user_agents.parse(request.META['HTTP_USER_AGENT'])
+                browser, device, os = user_agent_families(request.META['HTTP_USER_AGENT'])
 
                 # validing login state token data with user agent
-                if login_state.browser != ua.browser.family or login_state.device != ua.device.family or login_state.os != ua.os.family:
+                if login_state.browser != browser or login_state.device != device or login_state.os != os:
                     return None
             except:
                 raise exceptions.AuthenticationFailed('No Login user found.')
@@ -100,18 +98,17 @@ class WebSocketUserAuthenticationMiddleware(BaseMiddleware):
                 return None
 
             try:
-                # fetching user from database
-                user = User.objects.get(uid=payload_data['uid'])
+                # fetching user and login state in a single cache round trip
+                user, login_state = AuthCache.get(payload_data['uid'])
             except User.DoesNotExist:
                 raise exceptions.AuthenticationFailed('No such Account found.')
 
             try:
-                login_state = LoginStateTokenService.get(user=user)
-                if login_state['login_token'] != lst:
-                    return None
-                
                 if not login_state:
                     return None
+
+                if login_state['login_token'] != lst:
+                    return None
             except:
                 raise exceptions.AuthenticationFailed('No Login user found.')
 
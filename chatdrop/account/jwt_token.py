@@ -35,7 +35,7 @@ class EncryptedJwt:
     def validate(token: str):
         base64_token = base64.b64decode(token.encode('ascii'))
         token = base64_token.decode('ascii')
-        aes = AES256(settings.SERVER_ENC_KEY)
+        aes = AES256(settings.SERVER_ENC_KEY, cached=True)
         token = aes.decrypt(token)
         return Jwt.validate(token)
     
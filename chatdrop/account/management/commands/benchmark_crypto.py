@@ -0,0 +1,67 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from utils import generator
+from utils.security import AES256, TTLCache, cached_derive_key_and_iv
+
+
+# Crypto benchmark
+class Command(BaseCommand):
+    help = 'Reports crypto cost of a normal chat message, two user key decryptions and a message re-encryption, before and after key caching.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=10000, help='messages re-encrypted by each path.')
+
+    def __report(self, name, seconds, messages):
+        self.stdout.write(f'{name}: {seconds * 1000000 / messages:.1f} us per message.')
+
+    def handle(self, *args, **options):
+        messages = options['messages']
+        server = AES256(settings.SERVER_ENC_KEY, cached=True)
+        sender_key, receiver_key = generator.generate_password_key(), generator.generate_password_key()
+        enc_keys = {'sender': server.encrypt(sender_key), 'receiver': server.encrypt(receiver_key)}
+
+        # every message has its own salt as in real chats
+        contents = [AES256(sender_key).encrypt('hello, how are you doing today?') for _ in range(messages)]
+
+        # AesEverywhere, keys decrypted and derived on every message
+        try:
+            from AesEverywhere import aes256
+
+            started = time.perf_counter()
+            for content in contents:
+                sender = aes256.decrypt(enc_keys['sender'].encode('utf-8'), settings.SERVER_ENC_KEY).decode('utf-8')
+                receiver = aes256.decrypt(enc_keys['receiver'].encode('utf-8'), settings.SERVER_ENC_KEY).decode('utf-8')
+                raw = aes256.decrypt(content.encode('utf-8'), sender).decode('utf-8')
+                aes256.encrypt(raw, receiver)
+            self.__report('aes everywhere', time.perf_counter() - started, messages)
+        except ImportError:
+            self.stdout.write('aes everywhere: not installed, skipped.')
+
+        # cryptography without caches
+        started = time.perf_counter()
+        for content in contents:
+            cached_derive_key_and_iv.cache_clear()
+            sender = server.decrypt(enc_keys['sender'])
+            receiver = server.decrypt(enc_keys['receiver'])
+            raw = AES256(sender).decrypt(content)
+            AES256(receiver).encrypt(raw)
+        self.__report('uncached', time.perf_counter() - started, messages)
+
+        # cryptography with user key cache, as UserService.get_user_enc_key
+        cache = TTLCache(settings.USER_ENC_KEY_CACHE_SIZE, settings.USER_ENC_KEY_CACHE_SECONDS)
+        started = time.perf_counter()
+        for content in contents:
+            keys = []
+            for uid in ('sender', 'receiver'):
+                cached = cache.get(uid)
+                if cached is None or cached[0] != enc_keys[uid]:
+                    cached = (enc_keys[uid], server.decrypt(enc_keys[uid]))
+                    cache.set(uid, cached)
+                keys.append(cached[1])
+            raw = AES256(keys[0]).decrypt(content)
+            AES256(keys[1]).encrypt(raw)
+        self.__report('cached', time.perf_counter() - started, messages)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark done.'))
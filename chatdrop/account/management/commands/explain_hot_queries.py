@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from account.models import User
+from friends.models import Friend
+from fanfollowing.models import Following
+from privacy.models import BlockedUser
+from post.models import Post, PostLike, PostHashTag
+from reel.models import Reel, ReelLike, ReelView
+from stories.models import Story, StoryView
+from notifier.models import Notification
+
+
+# Query plan report
+class Command(BaseCommand):
+    help = 'Prints database query plans of the hot lookups, run before and after migrating to compare index usage.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uid', type=str, default=None, help='user whose rows are looked up, defaults to any user.')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(uid=options['uid']).first() if options['uid'] else User.objects.first()
+        if user is None:
+            raise CommandError('No user found to look up.')
+
+        post = Post.objects.first()
+        reel = Reel.objects.first()
+        story = Story.objects.first()
+
+        queries = {
+            'friend': Friend.objects.filter(user=user, friend=user),
+            'following': Following.objects.filter(user=user, follow=user),
+            'blocked user': BlockedUser.objects.filter(user=user, blocked_user=user),
+            'post like': PostLike.objects.filter(post=post, by=user),
+            'reel like': ReelLike.objects.filter(reel=reel, by=user),
+            'reel view': ReelView.objects.filter(reel=reel, seen_by=user),
+            'story view': StoryView.objects.filter(story=story, seen_by=user),
+            'notifications': Notification.objects.filter(to_user=user).order_by('-id')[:20],
+            'posts of user': Post.objects.filter(user=user).order_by('-posted_on')[:20],
+            'reels of user': Reel.objects.filter(user=user).order_by('-posted_on')[:20],
+            'stories of user': Story.objects.filter(user=user).order_by('-posted_on')[:20],
+            'posts by tag': PostHashTag.objects.filter(tag='chatdrop'),
+        }
+
+        for name, queryset in queries.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain())
+            self.stdout.write('')
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from account.auth_cache import AuthCache
+from account.models import User
+from search.index import ProfileIndex
+from utils.counters import Counters
+from utils.debug import debug_print
+
+
+# Counter flusher
+class Command(BaseCommand):
+    help = 'Writes pending like, comment, view and user counters from redis to database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='flushes once and exits.')
+        parser.add_argument('--interval', type=float, default=5, help='seconds between flushes.')
+
+    def handle(self, *args, **options):
+        count = 0
+        while True:
+            try:
+                updated = Counters.flush()
+            except Exception as e:
+                # pending deltas are kept and flushed on next run
+                debug_print(e)
+                updated = {}
+
+            # dropping cached users holding old counts, follower counts rank search results
+            for uid in updated.get('account.User', []):
+                AuthCache.invalidate(uid)
+            if len(updated.get('account.User', [])) > 0:
+                ProfileIndex.add_many(User.objects.filter(uid__in=updated['account.User']))
+
+            count += sum(len(pks) for pks in updated.values())
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'{count} rows updated.'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from account.models import PreKeyBundle
+from account.services import PreKeyBundleService
+
+
+# Legacy prekeys migration
+class Command(BaseCommand):
+    help = 'Moves one-time prekeys held in PreKeyBundle.prekeys JSON lists to PreKey rows and counts prekeys left.'
+
+    def handle(self, *args, **options):
+        count = 0
+        for prekey_bundle in PreKeyBundle.objects.select_related('user').iterator(chunk_size=500):
+            if len(prekey_bundle.prekeys) == 0:
+                continue
+
+            PreKeyBundleService.move_legacy_prekeys(prekey_bundle.user)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'{count} bundles migrated.'))
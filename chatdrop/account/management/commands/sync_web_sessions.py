@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from account.models import WebLoginState
+from account.web_sessions import WebSessionStore
+from utils.debug import debug_print
+
+
+# Web session writer
+class Command(BaseCommand):
+    help = 'Writes web login sessions created and removed in redis to WebLoginState rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drain', action='store_true', help='exits once all queued changes are written.')
+        parser.add_argument('--interval', type=float, default=1, help='seconds to wait when queue is empty.')
+
+    def handle(self, *args, **options):
+        count = 0
+        while True:
+            try:
+                applied = WebSessionStore.sync()
+            except Exception as e:
+                debug_print(e)
+                applied = 0
+
+            count += applied
+            if applied == 0:
+                # dropping expired sessions while idle
+                WebLoginState.objects.filter(active_until__lt=timezone.now()).delete()
+
+                if options['drain']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'{count} session changes written.'))
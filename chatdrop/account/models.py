@@ -4,6 +4,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 from utils import generator, security
 from django.conf import settings
+from django.core.cache import cache
 from firebase_admin import auth
 from django.utils import timezone
 
@@ -130,6 +131,17 @@ class User(AbstractBaseUser):
     def __str__(self):
         return f'{self.email} [ {self.uid} ]'
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # dropping user cached by account.auth_cache.AuthCache
+        cache.delete(f'{self.uid}:user')
+
+    def delete(self, *args, **kwargs):
+        uid = self.uid
+        result = super().delete(*args, **kwargs)
+        cache.delete(f'{uid}:user')
+        return result
+
     def has_perm(self, perm, obj=None):
         return self.is_admin
 
@@ -168,6 +180,8 @@ class ProfilePhoto(models.Model):
     
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     photo = models.ImageField(upload_to=_upload_to_path)
+    variants = models.JSONField(default=list, blank=True)
+    placeholder = models.TextField(default='', blank=True)
 
     def __str__(self):
         return self.user.email
@@ -189,6 +203,8 @@ class ProfileCoverPhoto(models.Model):
     
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     cover_photo = models.ImageField(upload_to=_upload_to_path)
+    variants = models.JSONField(default=list, blank=True)
+    placeholder = models.TextField(default='', blank=True)
 
     def __str__(self):
         return self.user.email
@@ -207,9 +223,11 @@ class PreKeyBundle(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, editable=False)
     reg_id = models.IntegerField(default=0)
     device_id = models.IntegerField(default=0)
-    prekeys = models.JSONField(default=list)
+    prekeys = models.JSONField(default=list) # legacy one-time prekeys, moved to PreKey rows by migrate_prekeys command
     signed_prekey = models.JSONField(default=dict)
     identity_key = models.TextField(default='')
+    prekeys_left = models.IntegerField(default=0)
+    is_low_signaled = models.BooleanField(default=False)
     
     def __str__(self):
         return self.user.email
@@ -217,6 +235,21 @@ class PreKeyBundle(models.Model):
 
 
 
+# One-time prekey model
+class PreKey(models.Model):
+    '''One-time prekey of a user, every key is handed out once and deleted.'''
+    user = models.ForeignKey(User, on_delete=models.CASCADE, editable=False)
+    key_id = models.IntegerField(default=0)
+    key = models.TextField(default='')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key_id'], name='unique_prekey'),
+        ]
+
+
+
+
 # Web Login State
 class WebLoginState(models.Model):
     '''Web Login State Model Class'''
@@ -228,6 +261,13 @@ class WebLoginState(models.Model):
     created_on = models.DateTimeField(default=None)
     active_until = models.DateTimeField(default=None)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['token']),
+            models.Index(fields=['user', '-created_on']),
+            models.Index(fields=['active_until']),
+        ]
+
     @property
     def is_active(self):
         return self.active_until >= timezone.now()
@@ -235,6 +275,20 @@ class WebLoginState(models.Model):
 
 
 
+# Counter Flush
+class CounterFlush(models.Model):
+    '''Batch of counter deltas applied to database, see utils.counters.Counters.flush.'''
+    batch = models.CharField(max_length=32, unique=True)
+    flushed_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['flushed_on']),
+        ]
+
+
+
+
 # OAuth Client Id Model
 class GoogleOAuthClientId(models.Model):
     '''Google O-Auth Client Id'''
@@ -263,6 +263,20 @@ class UserPreKeyBundleSerializer(serializers.ModelSerializer):
         if validators.is_empty(reg_id) or validators.is_empty(device_id) or validators.is_empty(prekeys) or validators.is_empty(signed_prekey) or validators.is_empty(identity_key):
             raise serializers.ValidationError({'preKeyBundle': 'Invalid PreKey Bundle.'})
 
+        if not validators.is_prekeys(prekeys):
+            raise serializers.ValidationError({'prekeys': 'Invalid PreKeys.'})
+
+        return attrs
+
+
+# user one-time prekeys serializer
+class UserPreKeysSerializer(serializers.Serializer):
+    prekeys = serializers.ListField(child=serializers.DictField(), allow_empty=False, max_length=1000)
+
+    def validate(self, attrs):
+        if not validators.is_prekeys(attrs.get('prekeys')):
+            raise serializers.ValidationError({'prekeys': 'Invalid PreKeys.'})
+
         return attrs
 
 
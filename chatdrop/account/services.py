@@ -1,15 +1,20 @@
-import user_agents
+import json
 
 from django.conf import settings
 from django.core.cache import cache
-from utils import otp, generator, security
+from utils import otp, generator, security, validators
 from utils.platform import Platform
+from utils.derivatives import ImageDerivatives, ImageDerivativeQueue
+from utils.counters import Counters
 from utils.messenger import Mailer
 from .jwt_token import Jwt, EncryptedJwt
-from .models import User, PreKeyBundle, ProfilePhoto, ProfileCoverPhoto, GoogleOAuthClientId, WebLoginState
-from friends.models import Friend, FriendRequest
-from fanfollowing.models import Following, FollowRequest
-from privacy.models import BlockedUser
+from .auth_cache import user_agent_families
+from .web_sessions import WebSessionStore
+from .models import User, PreKeyBundle, PreKey, ProfilePhoto, ProfileCoverPhoto, GoogleOAuthClientId, WebLoginState
+from friends.models import FriendRequest
+from fanfollowing.models import FollowRequest
+from friends.graph import SocialGraph
+from search.index import ProfileIndex
 from .exceptions import UserNotFoundError, PreKeyBundleNotFoundError, NoCacheDataError, NoDataError, ProfileError
 from django.contrib.auth import authenticate
 from firebase_admin.auth import create_custom_token
@@ -17,6 +22,10 @@ from google.oauth2 import id_token
 from google.auth.transport import requests
 from django.utils import timezone
 from datetime import timedelta
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from notifier.outbox import NotificationOutbox
 
 
 
@@ -26,7 +35,7 @@ class UserService:
 
     @staticmethod
     def create_user(data) -> User:
-        return User.objects.create_user_with_profile(
+        user = User.objects.create_user_with_profile(
             first_name=data.get('first_name'),
             last_name=data.get('last_name'),
             gender=data.get('gender'),
@@ -35,6 +44,8 @@ class UserService:
             email=data.get('email'),
             password=data.get('password'),
         )
+        ProfileIndex.add(user)
+        return user
     
     @staticmethod
     def get_user(uid) -> User:
@@ -53,25 +64,39 @@ class UserService:
     def delete_user(uid):
         if User.objects.filter(uid=uid).exists():
             User.objects.get(uid=uid).delete()
+            ProfileIndex.remove(uid)
+            UserService.invalidate_user_enc_key(uid)
         raise UserNotFoundError()
 
 
     @staticmethod
     def update_fcm_token(user, token=''):
         user.msg_token = token
-        user.save()
+        user.save(update_fields=['msg_token'])
     
     @staticmethod
     def change_password(user, password):
         user.set_password(password)
-        user.save()
+        user.save(update_fields=['password'])
     
+    # decrypted user keys with the encrypted key they belong to, a changed enc_key misses the cache
+    __enc_keys = security.TTLCache(settings.USER_ENC_KEY_CACHE_SIZE, settings.USER_ENC_KEY_CACHE_SECONDS)
+
     @staticmethod
     def get_user_enc_key(user):
-        aes = security.AES256(settings.SERVER_ENC_KEY)
+        cached = UserService.__enc_keys.get(user.uid)
+        if cached is not None and cached[0] == user.enc_key:
+            return cached[1]
+
+        aes = security.AES256(settings.SERVER_ENC_KEY, cached=True)
         enc_key = aes.decrypt(user.enc_key)
+        UserService.__enc_keys.set(user.uid, (user.enc_key, enc_key))
         return enc_key
 
+    @staticmethod
+    def invalidate_user_enc_key(uid):
+        UserService.__enc_keys.delete(uid)
+
     @staticmethod
     def check_username_availability(username):
         return not User.objects.filter(username=username).exists()
@@ -83,66 +108,130 @@ class UserService:
         
         user.first_name = first_name.lower()
         user.last_name = last_name.lower()
-        user.save()
+        user.save(update_fields=['username', 'first_name', 'last_name'])
+        ProfileIndex.add(user)
 
 
 class PreKeyBundleService:
-    '''PreKeyBundle Service for pre-key bundle model crud operations'''
+    '''
+        PreKeyBundle Service for pre-key bundle model crud operations
+        1. one-time prekeys are PreKey rows claimed with skip locked, concurrent senders never get the same key.
+        2. prekeys_left of bundle is a counter updated on every claim and upload.
+        3. owner is signalled once when prekeys_left falls below PREKEY_LOW_WATERMARK, again only after next upload.
+    '''
     @staticmethod
     def is_prekey_bundle_exists(user):
         return PreKeyBundle.objects.filter(user=user).exists()
-
-    @staticmethod
-    def __create_prekey_bundle(user, data):
-        return PreKeyBundle.objects.create(
-            user = user,
-            reg_id = data.get('reg_id'),
-            device_id = data.get('device_id'),
-            prekeys = data.get('prekeys'),
-            signed_prekey = data.get('signed_prekey'),
-            identity_key = data.get('identity_key'),
-        )
     
     @staticmethod
     def __get_prekey_bundle(user):
-        if PreKeyBundleService.is_prekey_bundle_exists(user):
-            return PreKeyBundle.objects.get(user=user)
-        raise PreKeyBundleNotFoundError()
+        prekey_bundle = PreKeyBundle.objects.filter(user=user).first()
+        if prekey_bundle is None:
+            raise PreKeyBundleNotFoundError()
+        return prekey_bundle
+
+    @staticmethod
+    def __store_prekeys(user, prekeys, replace=False):
+        '''stores one-time prekeys given as [{id, key}], returns prekeys left.'''
+        with transaction.atomic():
+            if replace:
+                PreKey.objects.filter(user=user).delete()
+
+            PreKey.objects.bulk_create([
+                PreKey(user=user, key_id=prekey['id'], key=prekey['key']) for prekey in prekeys
+            ], ignore_conflicts=True)
+
+            prekeys_left = PreKey.objects.filter(user=user).count()
+            PreKeyBundle.objects.filter(user=user).update(prekeys_left=prekeys_left, is_low_signaled=False)
+
+        return prekeys_left
     
     @staticmethod
     def create_or_update_prekey_bundle(user, data):
-        try:
-            # fetching prekey_bundle
-            prekey_bundle = PreKeyBundleService.__get_prekey_bundle(user)
-
-            # updading prekey_bundle if already exists
-            prekey_bundle.reg_id = data.get('reg_id')
-            prekey_bundle.device_id = data.get('device_id')
-            prekey_bundle.prekeys = data.get('prekeys')
-            prekey_bundle.signed_prekey = data.get('signed_prekey')
-            prekey_bundle.identity_key = data.get('identity_key')
-            prekey_bundle.save()
-
-            return prekey_bundle
-        except:
-            # creating new one
-            PreKeyBundleService.__create_prekey_bundle(user, data) 
+        '''saves bundle of a newly logged in device, one-time prekeys of old device are replaced.'''
+        prekey_bundle, _ = PreKeyBundle.objects.update_or_create(user=user, defaults={
+            'reg_id': data.get('reg_id'),
+            'device_id': data.get('device_id'),
+            'prekeys': [],
+            'signed_prekey': data.get('signed_prekey'),
+            'identity_key': data.get('identity_key'),
+        })
+        prekey_bundle.prekeys_left = PreKeyBundleService.__store_prekeys(user, data.get('prekeys'), replace=True)
+        return prekey_bundle
+
+    @staticmethod
+    def add_prekeys(user, prekeys):
+        '''adds one-time prekeys to the pool of existing bundle, returns prekeys left.'''
+        if not PreKeyBundleService.is_prekey_bundle_exists(user):
+            raise PreKeyBundleNotFoundError()
+        return PreKeyBundleService.__store_prekeys(user, prekeys)
+
+    @staticmethod
+    def move_legacy_prekeys(user):
+        '''moves one-time prekeys of the legacy prekeys list of bundle to PreKey rows, returns number of prekeys moved.'''
+        with transaction.atomic():
+            prekey_bundle = PreKeyBundle.objects.select_for_update().filter(user=user).first()
+            if prekey_bundle is None or len(prekey_bundle.prekeys or []) == 0:
+                return 0
+
+            prekeys = [prekey for prekey in prekey_bundle.prekeys if validators.is_prekeys([prekey])]
+            PreKeyBundle.objects.filter(id=prekey_bundle.id).update(prekeys=[])
+            PreKeyBundleService.__store_prekeys(user, prekeys)
+
+        return len(prekeys)
+
+    @staticmethod
+    def __signal_low(user, prekeys_left):
+        '''returns True for the one claim taking prekeys below the low watermark, pushing owner a data message.'''
+        if prekeys_left >= settings.PREKEY_LOW_WATERMARK:
+            return False
+
+        signalled = PreKeyBundle.objects.filter(
+            user=user, 
+            prekeys_left__lt=settings.PREKEY_LOW_WATERMARK, 
+            is_low_signaled=False
+        ).update(is_low_signaled=True) == 1
+
+        if signalled:
+            NotificationOutbox.push(
+                to_user=user,
+                type='PREKEYS_REQUIRED',
+                data={
+                    'content': json.dumps({'type': 'PREKEYS_REQUIRED', 'prekeys_left': prekeys_left}),
+                    'extras': json.dumps({}),
+                },
+                alert=False,
+            )
+
+        return signalled
     
     @staticmethod
     def get_one_prekey_bundle(user):
-        preKey_bundle_data = {}
+        '''claims one one-time prekey of user, returns (bundle, is_prekeys_required) where is_prekeys_required is True once per low watermark.'''
         preKey_bundle = PreKeyBundleService.__get_prekey_bundle(user)
-        preKeys = preKey_bundle.prekeys
         signed_prekey = preKey_bundle.signed_prekey
-        prekey = preKeys.pop()
+
+        with transaction.atomic():
+            prekey = PreKey.objects.select_for_update(skip_locked=True).filter(user=user).order_by('id').first()
+
+            # moving legacy prekeys of a bundle not migrated yet
+            if prekey is None and PreKeyBundleService.move_legacy_prekeys(user) > 0:
+                preKey_bundle = PreKeyBundleService.__get_prekey_bundle(user)
+                prekey = PreKey.objects.select_for_update(skip_locked=True).filter(user=user).order_by('id').first()
+
+            if prekey is None:
+                raise PreKeyBundleNotFoundError('No prekeys left.')
+
+            PreKey.objects.filter(id=prekey.id).delete()
+            PreKeyBundle.objects.filter(user=user).update(prekeys_left=Greatest(F('prekeys_left') - 1, 0))
 
         preKey_bundle_data = {
             'reg_id': preKey_bundle.reg_id,
             'device_id': preKey_bundle.device_id,
             'prekeys': [
                     {
-                    'id': prekey['id'],
-                    'key': prekey['key'],
+                    'id': prekey.key_id,
+                    'key': prekey.key,
                 }
             ],
             'signed_prekey': {
@@ -153,18 +242,18 @@ class PreKeyBundleService:
             'identity_key': preKey_bundle.identity_key,
         }
 
-        prekeys_left = len(preKeys)
-        preKey_bundle.prekeys = preKeys
-        preKey_bundle.save()
+        is_prekeys_required = PreKeyBundleService.__signal_low(user, max(preKey_bundle.prekeys_left - 1, 0))
 
-        return preKey_bundle_data, prekeys_left
+        return preKey_bundle_data, is_prekeys_required
     
     @staticmethod
     def delete_prekey_bundle(user):
         if not PreKeyBundleService.is_prekey_bundle_exists(user):
             raise PreKeyBundleNotFoundError()
         
-        PreKeyBundle.objects.get(user=user).delete()
+        with transaction.atomic():
+            PreKeyBundle.objects.get(user=user).delete()
+            PreKey.objects.filter(user=user).delete()
 
 
 
@@ -174,15 +263,15 @@ class LoginStateTokenService:
     '''Login State Token Service for creating, fetching and deleting login token and it's state'''
     @staticmethod
     def create(user, user_agent_header, timeout):
-        user_agent = user_agents.parse(user_agent_header)
+        browser, device, os = user_agent_families(user_agent_header)
         login_token = generator.generate_token()
 
         cache.set(f'{user.uid}:lst', {
             'login_token': login_token,
             'uid': user.uid,
-            'device': user_agent.device.family,
-            'os': user_agent.os.family,
-            'browser': user_agent.browser.family
+            'device': device,
+            'os': os,
+            'browser': browser
         }, timeout=timeout)
 
         return login_token
@@ -203,35 +292,33 @@ class WebLoginStateTokenService:
     '''Web Login State Token Service for creating, fetching and deleting login token and it's state'''
     @staticmethod
     def create(user, user_agent_header, timeout):
-        user_agent = user_agents.parse(user_agent_header)
+        browser, device, os = user_agent_families(user_agent_header)
         login_token = generator.generate_token()
 
-        login_states = WebLoginState.objects.filter(user=user).order_by('-created_on')
-        if len(login_states) == 5:
-            login_states[0].delete()
-        
         created_on = timezone.now()
         active_until = created_on + timedelta(seconds=timeout)
             
-        login_state = WebLoginState.objects.create(
+        login_state = WebLoginState(
             user=user,
             token=login_token,
-            device=user_agent.device.family,
-            os=user_agent.os.family,
-            browser=user_agent.browser.family,
+            device=device,
+            os=os,
+            browser=browser,
             created_on=created_on,
             active_until=active_until,
         )
+        WebSessionStore.add(login_state)
 
         return login_state
     
     @staticmethod
     def get(user, token):
-        return WebLoginState.objects.get(user=user, token=token)
+        return WebSessionStore.get(user.uid, token)
 
     @staticmethod
     def delete(user, token):
-        WebLoginStateTokenService.get(user=user, token=token).delete()
+        WebSessionStore.get(user.uid, token)
+        WebSessionStore.remove(user.uid, token)
 
 
 
@@ -680,13 +767,13 @@ class ProfileService:
     @staticmethod
     def list_profile_photos(user):
         profile_photos = ProfilePhoto.objects.filter(user=user)
-        photos = [{ 'id': model.id, 'photo': model.cdn_url } for model in profile_photos]
+        photos = [{ 'id': model.id, 'photo': model.cdn_url, 'variants': ImageDerivatives.to_json(model.variants), 'placeholder': model.placeholder } for model in profile_photos]
         return photos
     
     @staticmethod
     def list_profile_cover_photos(user):
         profile_cover_photos = ProfileCoverPhoto.objects.filter(user=user)
-        cover_photos = [{'id': model.id, 'cover': model.cdn_url} for model in profile_cover_photos]
+        cover_photos = [{'id': model.id, 'cover': model.cdn_url, 'variants': ImageDerivatives.to_json(model.variants), 'placeholder': model.placeholder} for model in profile_cover_photos]
         return cover_photos
     
     @staticmethod
@@ -695,7 +782,7 @@ class ProfileService:
 
         user = UserService.get_user(uid)
 
-        if BlockedUser.objects.filter(user=user, blocked_user=auth_user).exists():
+        if SocialGraph.is_blocked(user, auth_user):
             raise ProfileError('Profile not available as auth user is blocked.')
 
         # listing all photos
@@ -706,6 +793,9 @@ class ProfileService:
             photos = ProfileService.list_profile_photos(user)
             cover_photos = ProfileService.list_profile_cover_photos(user)
 
+        # merging counts not yet flushed
+        Counters.merge([user])
+
         # profile json response
         response = {
             'message': 'profile',
@@ -750,7 +840,7 @@ class ProfileService:
             is_blocked = False
                 
             # finding out whether the user is friend or not
-            if Friend.objects.filter(user=auth_user, friend=user).exists():
+            if SocialGraph.is_friend(auth_user, user):
                 is_friend = True
             else:
                 try:
@@ -762,7 +852,7 @@ class ProfileService:
                     pass
             
             # finding out whether the logged in user is a follower of the user
-            if Following.objects.filter(user=auth_user, follow=user).exists():
+            if SocialGraph.is_following(auth_user, user):
                 is_following = True
 
             try:
@@ -774,7 +864,7 @@ class ProfileService:
                 pass
                 
             # adding is blocked property if requested profile user is blocked by the logged in user
-            if BlockedUser.objects.filter(user=auth_user, blocked_user=user).exists():
+            if SocialGraph.is_blocked(auth_user, user):
                 is_blocked = True
                     
             # response fields from other users to logged in user
@@ -797,7 +887,9 @@ class ProfileService:
         user.website = data.get('website')
 
         # saving profile
-        user.save()
+        user.save(update_fields=['message', 'location', 'interest', 'bio', 'website'])
+        Counters.merge([user])
+        ProfileIndex.add(user)
 
         return {
             'message': 'Profile Updated.',
@@ -822,8 +914,9 @@ class ProfileService:
     @staticmethod
     def update_profile_photo(user: User, data):
         profile_photo = ProfilePhoto.objects.create(user=user, photo=data.get('photo'))
+        ImageDerivativeQueue.push(profile_photo)
         user.photo = profile_photo.photo.name
-        user.save()
+        user.save(update_fields=['photo'])
         return {
             'message': 'Profile Photo Updated.',
             'photo': profile_photo.cdn_url,
@@ -837,7 +930,7 @@ class ProfileService:
         
         profile_photo = ProfilePhoto.objects.get(id=profile_photo_id, user=user)
         user.photo = profile_photo.photo.name
-        user.save()
+        user.save(update_fields=['photo'])
         
         # sending response
         return {
@@ -855,7 +948,7 @@ class ProfileService:
         # removing profile photo if it seems to be deleted
         if user.photo == profile_photo.photo.name:
             user.photo = ''
-            user.save()
+            user.save(update_fields=['photo'])
 
         # deleting profile photo
         profile_photo.delete()
@@ -866,8 +959,9 @@ class ProfileService:
     @staticmethod
     def update_profile_cover(user: User, data):
         profile_cover_photo = ProfileCoverPhoto.objects.create(user=user, cover_photo=data.get('cover_photo'))
+        ImageDerivativeQueue.push(profile_cover_photo)
         user.cover_photo = profile_cover_photo.cover_photo.name
-        user.save()
+        user.save(update_fields=['cover_photo'])
         return {
             'message': 'Profile Cover Photo Updated.',
             'cover': profile_cover_photo.cdn_url,
@@ -881,7 +975,7 @@ class ProfileService:
         
         cover_photo = ProfileCoverPhoto.objects.get(id=profile_cover_id, user=user)
         user.cover_photo = cover_photo.cover_photo.name
-        user.save()
+        user.save(update_fields=['cover_photo'])
         
         # sending response
         return {
@@ -899,7 +993,7 @@ class ProfileService:
         # removing profile photo if it seems to be deleted
         if user.cover_photo == cover_photo.cover_photo.name:
             user.cover_photo = ''
-            user.save()
+            user.save(update_fields=['cover_photo'])
 
         # deleting profile photo
         cover_photo.delete()
@@ -30,6 +30,9 @@ class AuthenticatedUserThrottling(UserRateThrottle):
 class ChangeNamesThrottling(UserRateThrottle):
     scope = 'change_names'
 
+class TypeaheadThrottling(UserRateThrottle):
+    scope = 'typeahead'
+
 class ChatGptThrottling(UserRateThrottle):
     scope = 'chatgpt'
 
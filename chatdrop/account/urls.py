@@ -15,6 +15,7 @@ urlpatterns = [
     path('v1/account/password/change/', views.ChangePassword.as_view(), name='password-change'),
     path('v1/account/names/change/', views.ChangeUserNames.as_view(), name='user-names-change'),
     path('v1/keys/prekeybundle/', views.UserPrekeyBundle.as_view(), name='user-prekey-bundle'),
+    path('v1/keys/prekeys/', views.UserPrekeys.as_view(), name='user-prekeys'),
     path('v1/fcm/token/', views.UserFCMessagingToken.as_view(), name='fcm-token'),
     path('v1/login/check/', views.LoginCheck.as_view(), name='login-check'),
     path('v1/logout/', views.Logout.as_view(), name='logout'),
@@ -453,7 +453,7 @@ class UserPrekeyBundle(APIView):
     def get(self, request):
         try:
             user = UserService.get_user(request.query_params.get('of'))
-            prekey_bundle, prekeys_left = PreKeyBundleService.get_one_prekey_bundle(user=user)
+            prekey_bundle, _ = PreKeyBundleService.get_one_prekey_bundle(user=user)
             
             return Response.success({
                 'message': 'prekeybundle',
@@ -466,6 +466,35 @@ class UserPrekeyBundle(APIView):
 
 
 
+# User one-time prekeys
+class UserPrekeys(APIView):
+    parser_classes = [JSONParser]
+    permission_classes = [IsRequestValid, IsAuthenticated]
+    throttle_classes = [AuthenticatedUserThrottling]
+
+    def post(self, request):
+        try:
+            serializer = serializers.UserPreKeysSerializer(data=request.data)
+
+            # validating prekeys
+            if serializer.is_valid():
+
+                # adding prekeys to pool
+                prekeys_left = PreKeyBundleService.add_prekeys(request.user, serializer.validated_data.get('prekeys'))
+
+                return Response.success({
+                    'message': 'PreKeys saved successfully.',
+                    'prekeys_left': prekeys_left,
+                })
+
+            return Response.errors(serializer.errors)
+        except Exception as e:
+            debug_print(e)
+            return Response.something_went_wrong()
+
+
+
+
 # User FCM Token
 class UserFCMessagingToken(APIView):
     parser_classes = [JSONParser]
@@ -728,7 +757,7 @@ class ProfileSettings(APIView):
                 user.allow_chatgpt_info_access = value
             
             # saving profile
-            user.save()
+            user.save(update_fields=['is_private', 'default_post_visibility', 'default_reel_visibility', 'allow_chatgpt_info_access'])
             
             return Response.success({
                 'message': 'profile settings updated',
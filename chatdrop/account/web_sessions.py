@@ -0,0 +1,163 @@
+import json
+import time
+
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+from .models import WebLoginState
+
+
+# Web Session Store
+class WebSessionStore:
+    '''
+        Web login states held in redis, WebLoginState rows are written later by sync_web_sessions command.
+        1. every session is a key by its token expiring at active_until, so checking a session is a single GET.
+        2. sessions of a user are indexed in a sorted set scored by active_until, capped at settings.WEB_LOGIN_MAX_SESSIONS.
+        3. sessions not found in redis are looked up in database once and cached back, for sessions made before the store.
+        4. removed and evicted sessions leave a revoked marker under their key, so database rows awaiting deletion are never read back.
+        5. queued changes are moved to a processing list while written and dropped only once the database commits.
+    '''
+
+    KEY = 'websessions:sync'
+    PROCESSING_KEY = 'websessions:sync:processing'
+    REVOKED = b'REVOKED'
+
+    @staticmethod
+    def __session_key(token):
+        return f'websession:{token}'
+
+    @staticmethod
+    def __index_key(uid):
+        return f'{uid}:websessions'
+
+    @staticmethod
+    def __dump(login_state: WebLoginState):
+        return {
+            'uid': login_state.user_id,
+            'token': login_state.token,
+            'device': login_state.device,
+            'os': login_state.os,
+            'browser': login_state.browser,
+            'created_on': login_state.created_on.timestamp(),
+            'active_until': login_state.active_until.timestamp(),
+        }
+
+    @staticmethod
+    def __load(session):
+        return WebLoginState(
+            user_id=session['uid'],
+            token=session['token'],
+            device=session['device'],
+            os=session['os'],
+            browser=session['browser'],
+            created_on=datetime.fromtimestamp(session['created_on'], tz=dt_timezone.utc),
+            active_until=datetime.fromtimestamp(session['active_until'], tz=dt_timezone.utc),
+        )
+
+    @staticmethod
+    def __cache(pipe, login_state: WebLoginState, nx=False):
+        ttl = int(login_state.active_until.timestamp() - time.time())
+        if ttl <= 0:
+            return
+
+        index_key = WebSessionStore.__index_key(login_state.user_id)
+        pipe.set(WebSessionStore.__session_key(login_state.token), json.dumps(WebSessionStore.__dump(login_state)), ex=ttl, nx=nx)
+        pipe.zadd(index_key, {login_state.token: login_state.active_until.timestamp()})
+        pipe.expire(index_key, settings.AUTH_EXPIRE_SECONDS)
+
+    @staticmethod
+    def __revoke(pipe, tokens):
+        # outliving any session, so rows not yet deleted by sync are never cached back
+        for token in tokens:
+            pipe.set(WebSessionStore.__session_key(token), WebSessionStore.REVOKED, ex=settings.AUTH_EXPIRE_SECONDS)
+
+    @staticmethod
+    def __sync(redis, op, **data):
+        redis.rpush(WebSessionStore.KEY, json.dumps({'op': op, **data}))
+
+    @staticmethod
+    def add(login_state: WebLoginState):
+        '''stores a new session, evicting oldest sessions of user over the limit.'''
+        redis = get_redis_connection('default')
+        index_key = WebSessionStore.__index_key(login_state.user_id)
+
+        pipe = redis.pipeline()
+        pipe.zremrangebyscore(index_key, '-inf', time.time())
+        WebSessionStore.__cache(pipe, login_state)
+        pipe.execute()
+
+        # evicting sessions expiring first
+        evicted = []
+        excess = redis.zcard(index_key) - settings.WEB_LOGIN_MAX_SESSIONS
+        if excess > 0:
+            evicted = [token.decode('utf-8') for token, _ in redis.zpopmin(index_key, excess)]
+            pipe = redis.pipeline()
+            WebSessionStore.__revoke(pipe, evicted)
+            pipe.execute()
+
+        WebSessionStore.__sync(redis, 'create', session=WebSessionStore.__dump(login_state))
+        for token in evicted:
+            WebSessionStore.__sync(redis, 'delete', token=token)
+
+    @staticmethod
+    def get(uid, token):
+        '''returns active session of user by token, raises WebLoginState.DoesNotExist otherwise.'''
+        session = get_redis_connection('default').get(WebSessionStore.__session_key(token))
+        if session == WebSessionStore.REVOKED:
+            raise WebLoginState.DoesNotExist()
+        if session is not None:
+            login_state = WebSessionStore.__load(json.loads(session))
+            if login_state.user_id != uid:
+                raise WebLoginState.DoesNotExist()
+            return login_state
+
+        # database fallback, never caching over a revoked marker set meanwhile
+        login_state = WebLoginState.objects.get(user=uid, token=token, active_until__gte=timezone.now())
+        pipe = get_redis_connection('default').pipeline()
+        WebSessionStore.__cache(pipe, login_state, nx=True)
+        pipe.execute()
+        return login_state
+
+    @staticmethod
+    def remove(uid, token):
+        redis = get_redis_connection('default')
+        pipe = redis.pipeline()
+        WebSessionStore.__revoke(pipe, [token])
+        pipe.zrem(WebSessionStore.__index_key(uid), token)
+        pipe.execute()
+        WebSessionStore.__sync(redis, 'delete', token=token)
+
+    @staticmethod
+    def sync(size=500):
+        '''writes a batch of queued session changes to database, returns number of changes applied.'''
+        redis = get_redis_connection('default')
+
+        # resuming batch of an interrupted sync, otherwise moving next batch to processing list
+        ops = redis.lrange(WebSessionStore.PROCESSING_KEY, 0, -1)
+        if len(ops) == 0:
+            pipe = redis.pipeline()
+            for _ in range(size):
+                pipe.lmove(WebSessionStore.KEY, WebSessionStore.PROCESSING_KEY, 'LEFT', 'RIGHT')
+            ops = [op for op in pipe.execute() if op is not None]
+
+        created = {}
+        deleted = set()
+        for op in ops:
+            op = json.loads(op)
+            if op['op'] == 'create':
+                created[op['session']['token']] = WebSessionStore.__load(op['session'])
+            else:
+                created.pop(op['token'], None)
+                deleted.add(op['token'])
+
+        # batch stays in processing list for the next sync if writing fails, creates of a resumed batch may exist already
+        with transaction.atomic():
+            if len(created) > 0:
+                WebLoginState.objects.bulk_create(created.values(), ignore_conflicts=True)
+            if len(deleted) > 0:
+                WebLoginState.objects.filter(token__in=deleted).delete()
+
+        redis.delete(WebSessionStore.PROCESSING_KEY)
+        return len(ops)
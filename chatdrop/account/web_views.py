@@ -660,7 +660,7 @@ class ProfileSettings(APIView):
                 user.allow_chatgpt_info_access = value
             
             # saving profile
-            user.save()
+            user.save(update_fields=['is_private', 'default_post_visibility', 'default_reel_visibility', 'allow_chatgpt_info_access'])
             
             return Response.success({
                 'message': 'profile settings updated',
@@ -1,9 +1,15 @@
+import time
+
+from django.conf import settings
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from utils.response import get_default_response_json
 from utils.debug import debug_print
 from channels.db import database_sync_to_async
 from account.models import User
 from friends.models import Friend
+from friends.graph import SocialGraph
+from .user_channel import UserChannel
+from .services import PresenceService
 
 class SecretChatConsumer(AsyncJsonWebsocketConsumer):
 
@@ -57,4 +63,130 @@ class SecretChatConsumer(AsyncJsonWebsocketConsumer):
             # removing communication channel
             await self.channel_layer.group_discard(self.group, self.channel_name)
         except:
-            pass
\ No newline at end of file
+            pass
+
+
+
+
+
+class UserConsumer(AsyncJsonWebsocketConsumer):
+    '''
+        Single websocket of a device carrying typed frames of every chat room, see UserChannel.
+        1. connection joins the group of authenticated user only, no database query is made on connect.
+        2. frames of secret chats are {'type': 'SECRET_CHAT' | 'SECRET_READ' | 'SECRET_DEL', 'to': uid, 'data': {}},
+           delivered to every connection of receiver and sender if receiver is in the cached friends set of sender.
+        3. clients send {'type': 'HEARTBEAT'} every PRESENCE_HEARTBEAT_SECONDS to stay online, see PresenceService.
+        4. typing frames {'type': 'TYPING', 'to': uid, 'data': {'typing': bool}} are coalesced per receiver,
+           a started typing is forwarded once per TYPING_COALESCE_SECONDS and a stopped typing only after a forwarded one.
+    '''
+
+    CHAT_TYPES = ('SECRET_CHAT', 'SECRET_READ', 'SECRET_DEL')
+
+    @database_sync_to_async
+    def is_friend(self, uid):
+        return SocialGraph.is_friend(self.scope['user'], uid)
+
+    @database_sync_to_async
+    def connect_presence(self):
+        return PresenceService.connect(self.scope['user'])
+
+    @database_sync_to_async
+    def heartbeat_presence(self):
+        PresenceService.heartbeat(self.scope['user'])
+
+    @database_sync_to_async
+    def disconnect_presence(self):
+        return PresenceService.disconnect(self.scope['user'])
+
+    async def broadcast_presence(self, friends, online):
+        user = self.scope['user']
+        await UserChannel.group_send_many(friends, 'PRESENCE', {'uid': user.uid, 'online': online}, channel_layer=self.channel_layer)
+
+    async def connect(self):
+        user = self.scope['user']
+
+        # checking user authentication
+        if user is None:
+            await self.close()
+            return
+
+        self.group = UserChannel.group(user.uid)
+        self.typing = {}
+        self.heartbeat_at = time.monotonic()
+
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+        await self.broadcast_presence(await self.connect_presence(), online=True)
+
+    async def receive_json(self, content, **kwargs):
+        try:
+            type = content['type']
+            if type == 'HEARTBEAT':
+                await self.receive_heartbeat()
+            elif type == 'TYPING':
+                await self.receive_typing(str(content['to']), bool(content['data']['typing']))
+            elif type in UserConsumer.CHAT_TYPES:
+                await self.receive_chat(type, str(content['to']), dict(content['data']))
+        except Exception as e:
+            debug_print(e)
+
+    async def receive_heartbeat(self):
+        # refreshing last seen at most twice per heartbeat interval
+        now = time.monotonic()
+        if now - self.heartbeat_at >= settings.PRESENCE_HEARTBEAT_SECONDS / 2:
+            self.heartbeat_at = now
+            await self.heartbeat_presence()
+
+    async def receive_typing(self, to, typing):
+        now = time.monotonic()
+        forwarded_at = self.typing.get(to)
+
+        # coalescing repeated typing frames of receiver
+        if typing and forwarded_at is not None and now - forwarded_at < settings.TYPING_COALESCE_SECONDS:
+            return
+        if not typing and forwarded_at is None:
+            return
+
+        if not await self.is_friend(to):
+            return
+
+        if typing:
+            self.typing[to] = now
+        else:
+            self.typing.pop(to, None)
+
+        await self.channel_layer.group_send(UserChannel.group(to), UserChannel.event('TYPING', {
+            'sender_uid': self.scope['user'].uid,
+            'typing': typing,
+        }))
+
+    async def receive_chat(self, type, to, data):
+        # checking friendship
+        if not await self.is_friend(to):
+            return
+
+        # stopping typing indicator of receiver along with message
+        if type == 'SECRET_CHAT':
+            self.typing.pop(to, None)
+
+        data['sender_uid'] = self.scope['user'].uid
+        event = UserChannel.event(type, data)
+        await self.channel_layer.group_send(UserChannel.group(to), event)
+        await self.channel_layer.group_send(self.group, event)
+
+    async def user_frame(self, event):
+        res = get_default_response_json()
+        res['success'] = True
+        res['data'] = event['frame']
+        await self.send_json(res)
+
+    async def disconnect(self, code):
+        if not hasattr(self, 'group'):
+            return
+
+        try:
+            # removing communication channel
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+            await self.broadcast_presence(await self.disconnect_presence(), online=False)
+        except:
+            pass
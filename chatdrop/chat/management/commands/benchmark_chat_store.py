@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from chat.store import ChatStore
+
+
+# Chat store benchmark
+class Command(BaseCommand):
+    help = 'Compares latency of writing a chat message as four sequential document writes and as a single batch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=50, help='messages written by each path.')
+
+    def __writes(self, message_id):
+        message = {'id': message_id, 'content': 'benchmark', 'content_type': 'TEXT', 'time': time.time(), 'is_read': False}
+        recent = {'uid': 'receiver', 'name': 'Benchmark', 'message': message, 'time': message['time'], 'chatroom': 'benchmark'}
+        return [
+            (('benchmark_chats', 'benchmark', 'sender', message_id), message),
+            (('benchmark_recents', 'sender', 'chats', message_id), recent),
+            (('benchmark_chats', 'benchmark', 'receiver', message_id), message),
+            (('benchmark_recents', 'receiver', 'chats', message_id), recent),
+        ]
+
+    def __report(self, name, timings):
+        timings = sorted(timings)
+        p50 = timings[len(timings) // 2]
+        p95 = timings[min(int(len(timings) * 0.95), len(timings) - 1)]
+        self.stdout.write(f'{name}: mean {sum(timings) / len(timings):.2f} ms, p50 {p50:.2f} ms, p95 {p95:.2f} ms.')
+
+    def handle(self, *args, **options):
+        backend = ChatStore.get_backend()
+        written = []
+
+        # old path, a round trip per document
+        sequential = []
+        for _ in range(options['messages']):
+            writes = self.__writes(backend.new_id())
+            started = time.perf_counter()
+            for write in writes:
+                backend.commit([write])
+            sequential.append((time.perf_counter() - started) * 1000)
+            written.extend(path for path, _ in writes)
+
+        # new path, a single batch
+        batched = []
+        for _ in range(options['messages']):
+            writes = self.__writes(backend.new_id())
+            started = time.perf_counter()
+            backend.commit(writes)
+            batched.append((time.perf_counter() - started) * 1000)
+            written.extend(path for path, _ in writes)
+
+        self.__report('sequential', sequential)
+        self.__report('batched', batched)
+
+        # deleting benchmark documents
+        backend.commit([(path, None) for path in written])
+
+        self.stdout.write(self.style.SUCCESS('Benchmark done.'))
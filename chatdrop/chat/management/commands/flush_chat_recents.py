@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from chat.store import ChatStore
+from utils.debug import debug_print
+
+
+# Recents chats writer
+class Command(BaseCommand):
+    help = 'Writes recents chats queued by chat requests to the chat store in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drain', action='store_true', help='exits once all queued recents are written.')
+        parser.add_argument('--interval', type=float, default=1, help='seconds to wait when queue is empty.')
+
+    def handle(self, *args, **options):
+        count = 0
+        while True:
+            try:
+                taken = ChatStore.flush()
+            except Exception as e:
+                # batch is kept in processing list and written on next run
+                debug_print(e)
+                taken = 0
+
+            count += taken
+            if taken == 0:
+                if options['drain']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'{count} recents written.'))
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from chat.services import PresenceService
+from utils.debug import debug_print
+
+
+# Presence sweeper
+class Command(BaseCommand):
+    help = 'Marks users offline whose websockets were lost without a disconnect, like on a crashed node.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='exits after a single sweep.')
+        parser.add_argument('--interval', type=float, default=settings.PRESENCE_TIMEOUT_SECONDS / 2, help='seconds to wait between sweeps.')
+
+    def handle(self, *args, **options):
+        count = 0
+        while True:
+            try:
+                count += PresenceService.sweep()
+            except Exception as e:
+                debug_print(e)
+
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'{count} users marked offline.'))
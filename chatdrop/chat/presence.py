@@ -0,0 +1,113 @@
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+
+# Presence
+class Presence:
+    '''
+        Online state of users shared by every websocket node through redis.
+        1. last seen times are kept in a single sorted set, refreshed by heartbeats of user websockets.
+        2. open connections of a user are counted, user is online while counted and last seen within PRESENCE_TIMEOUT_SECONDS.
+        3. counters of connections lost with a crashed node are reset by the sweep_presence command or the next connect.
+    '''
+
+    KEY = 'presence:last_seen'
+
+    @staticmethod
+    def __connections_key(uid):
+        return f'{uid}:presence:connections'
+
+    @staticmethod
+    def __is_fresh(last_seen, now):
+        return last_seen is not None and last_seen >= now - settings.PRESENCE_TIMEOUT_SECONDS
+
+    @staticmethod
+    def connect(uid):
+        '''counts a new connection of user, returns True if user came online with it.'''
+        now = time.time()
+        redis = get_redis_connection('default')
+
+        pipe = redis.pipeline()
+        pipe.zscore(Presence.KEY, uid)
+        pipe.incr(Presence.__connections_key(uid))
+        pipe.expire(Presence.__connections_key(uid), settings.PRESENCE_TIMEOUT_SECONDS * 2)
+        pipe.zadd(Presence.KEY, {uid: now})
+        last_seen, count, _, _ = pipe.execute()
+
+        # previous connections are gone if their heartbeats stopped
+        if count > 1 and not Presence.__is_fresh(last_seen, now):
+            redis.set(Presence.__connections_key(uid), 1, ex=settings.PRESENCE_TIMEOUT_SECONDS * 2)
+            count = 1
+
+        return count == 1
+
+    @staticmethod
+    def heartbeat(uid):
+        now = time.time()
+        pipe = get_redis_connection('default').pipeline()
+        pipe.zadd(Presence.KEY, {uid: now})
+        pipe.expire(Presence.__connections_key(uid), settings.PRESENCE_TIMEOUT_SECONDS * 2)
+        pipe.execute()
+
+    @staticmethod
+    def disconnect(uid):
+        '''uncounts a connection of user, returns True if user went offline with it.'''
+        redis = get_redis_connection('default')
+
+        pipe = redis.pipeline()
+        pipe.decr(Presence.__connections_key(uid))
+        pipe.zadd(Presence.KEY, {uid: time.time()})
+        count, _ = pipe.execute()
+
+        if count <= 0:
+            redis.delete(Presence.__connections_key(uid))
+            return True
+        return False
+
+    @staticmethod
+    def statuses(uids):
+        '''returns {uid: {'online': bool, 'last_seen': unix time or None}} of uids in a single round trip.'''
+        uids = list(dict.fromkeys(uids))
+        if len(uids) == 0:
+            return {}
+
+        now = time.time()
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        pipe.zmscore(Presence.KEY, uids)
+        pipe.mget([Presence.__connections_key(uid) for uid in uids])
+        last_seens, counts = pipe.execute()
+
+        return {
+            uid: {
+                'online': Presence.__is_fresh(last_seen, now) and int(count or 0) > 0,
+                'last_seen': int(last_seen) if last_seen is not None else None,
+            }
+            for uid, last_seen, count in zip(uids, last_seens, counts)
+        }
+
+    @staticmethod
+    def is_online(uid):
+        return Presence.statuses([uid])[uid]['online']
+
+    @staticmethod
+    def sweep():
+        '''marks users offline whose heartbeats stopped without a disconnect, returns their uids.'''
+        now = time.time()
+        redis = get_redis_connection('default')
+
+        # users whose heartbeats stopped since the last sweeps
+        uids = redis.zrangebyscore(Presence.KEY, now - settings.PRESENCE_TIMEOUT_SECONDS * 2, now - settings.PRESENCE_TIMEOUT_SECONDS)
+        uids = [uid.decode('utf-8') for uid in uids]
+        if len(uids) == 0:
+            return []
+
+        counts = redis.mget([Presence.__connections_key(uid) for uid in uids])
+        offline = [uid for uid, count in zip(uids, counts) if int(count or 0) > 0]
+        if len(offline) > 0:
+            redis.delete(*[Presence.__connections_key(uid) for uid in offline])
+
+        # forgetting last seen times older than PRESENCE_LAST_SEEN_DAYS
+        redis.zremrangebyscore(Presence.KEY, '-inf', now - settings.PRESENCE_LAST_SEEN_DAYS * 24 * 60 * 60)
+        return offline
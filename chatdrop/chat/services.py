@@ -1,14 +1,17 @@
 import openai
 
+from django.conf import settings
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from friends.models import Friend
-from account.services import UserService, PreKeyBundleService, LoginService
-from friends.services import FriendService
+from account.services import UserService, PreKeyBundleService
+from friends.graph import SocialGraph
 from notifier.services import NotificationChannelService
-from firebase_admin.firestore import firestore
 from utils.security import AES256
 from .models import ChatGptMessageHolder
+from .store import ChatStore
+from .user_channel import UserChannel
+from .presence import Presence
 
 
 # Secret Chat Service
@@ -17,11 +20,15 @@ class SecretChatService:
 
     @staticmethod
     def canChat(auth_user, friend_uid):
-        user = UserService.get_user(uid=friend_uid)
-        return PreKeyBundleService.is_prekey_bundle_exists(user=user) and FriendService.is_friend_exists(user=auth_user, friend=user) and LoginService.retrieve_login_check_cache_data(auth_user) != None
+        '''friend can chat when friendship is in the cached friends set and friend holds a pre-key bundle.'''
+        return SocialGraph.is_friend(auth_user, friend_uid) and PreKeyBundleService.is_prekey_bundle_exists(user=friend_uid)
 
     @staticmethod
-    def push_message(sender, receiver, content):
+    def push_message(sender, receiver, content, type='SECRET_CHAT'):
+        # delivering to user websockets of both users
+        UserChannel.send_many([receiver.uid, sender.uid], type, content)
+
+        # delivering to legacy chat room websockets
         try:
             friend = Friend.objects.get(user=sender, friend=receiver)
 
@@ -47,8 +54,8 @@ class SecretChatService:
         )
         
         # retriving pre-key bundle for another simultaneous message
-        receiver_prekey_bundle, receiver_prekeys_left = PreKeyBundleService.get_one_prekey_bundle(user=receiver)
-        sender_prekey_bundle, sender_prekeys_left = PreKeyBundleService.get_one_prekey_bundle(user=sender)
+        receiver_prekey_bundle, is_receiver_prekeys_required = PreKeyBundleService.get_one_prekey_bundle(user=receiver)
+        sender_prekey_bundle, _ = PreKeyBundleService.get_one_prekey_bundle(user=sender)
 
         # sending user a notification
         NotificationChannelService.push_notification(
@@ -60,7 +67,7 @@ class SecretChatService:
             extras={
                 'message': content,
                 'prekey_bundle': sender_prekey_bundle,
-                'is_prekeys_required': receiver_prekeys_left <= 50,
+                'is_prekeys_required': is_receiver_prekeys_required,
             },
         )
 
@@ -80,7 +87,8 @@ class SecretChatService:
         SecretChatService.push_message(
             sender=sender,
             receiver=receiver,
-            content=content
+            content=content,
+            type='SECRET_READ',
         )
         # sending user a notification
         NotificationChannelService.push_notification(
@@ -108,7 +116,8 @@ class SecretChatService:
         SecretChatService.push_message(
             sender=sender,
             receiver=receiver,
-            content=content
+            content=content,
+            type='SECRET_DEL',
         )
         # sending user a notification
         NotificationChannelService.push_notification(
@@ -126,58 +135,107 @@ class SecretChatService:
 
 
 
+# Presence Service
+class PresenceService:
+    '''
+        Online state and typing indicators of users, pushed to friends over user websockets.
+        1. friends are sent a PRESENCE frame when user comes online on first connection and goes offline on last,
+           frames are sent concurrently by the websocket consumer.
+        2. online state of friends is queried in bulk with a single redis round trip.
+    '''
+
+    @staticmethod
+    def broadcast(uid, online):
+        '''sends PRESENCE frame of user to friends, from sync code.'''
+        UserChannel.send_many(SocialGraph.members(uid, 'friends'), 'PRESENCE', {'uid': uid, 'online': online})
+
+    @staticmethod
+    def connect(user):
+        '''returns uids of friends to be sent a PRESENCE frame, none unless user came online.'''
+        if Presence.connect(user.uid):
+            return SocialGraph.members(user, 'friends')
+        return set()
+
+    @staticmethod
+    def heartbeat(user):
+        Presence.heartbeat(user.uid)
+
+    @staticmethod
+    def disconnect(user):
+        '''returns uids of friends to be sent a PRESENCE frame, none unless user went offline.'''
+        if Presence.disconnect(user.uid):
+            return SocialGraph.members(user, 'friends')
+        return set()
+
+    @staticmethod
+    def get_friends_presence(auth_user, uids):
+        '''returns presence of uids who are friends of auth_user, others are left out.'''
+        uids = list(dict.fromkeys(str(uid) for uid in uids))[:settings.PRESENCE_QUERY_SIZE]
+        friends = SocialGraph.has_members(auth_user, 'friends', uids)
+        statuses = Presence.statuses([uid for uid in uids if uid in friends])
+        return [{'uid': uid, **status} for uid, status in statuses.items()]
+
+    @staticmethod
+    def sweep():
+        '''marks users offline whose websockets were lost without a disconnect, returns number of them.'''
+        uids = Presence.sweep()
+        for uid in uids:
+            PresenceService.broadcast(uid, online=False)
+        return len(uids)
+
+
+
+
+
 # Normal Chat Service
 class NormalChatService:
     '''Chat Service for push message to normal chat firebase channel'''
 
     @staticmethod
     def new_message(sender, receiver_uid, message):
-        receiver = UserService.get_user(receiver_uid)
-        friend = Friend.objects.get(user=sender, friend=receiver)
-
-        store = firestore.Client()
-
-        # saving message at sender side
-        sender_doc = store.collection('normal_chats').document(friend.chat_room).collection(sender.uid).document()
-        message['id'] = sender_doc.id
-        sender_doc.set(message)
-
-        # saving message at sender recents chats
-        message['is_read'] = True
-        sender_recent = store.collection('recents').document(sender.uid).collection('chats').document(receiver.uid)
-        sender_recent.set({
-            'uid': receiver.uid,
-            'photo': receiver.photo_cdn_url,
-            'name': receiver.full_name,
-            'message': message,
-            'gender': receiver.gender,
-            'time': message['time'],
-            'chatroom': friend.chat_room,
-        })
-        message['is_read'] = False
+        friend = Friend.objects.select_related('friend').get(user=sender, friend=receiver_uid)
+        receiver = friend.friend
+
+        message_id = ChatStore.new_id()
+
+        # message at sender side
+        message['id'] = message_id
+        sender_message = dict(message)
 
         # swaping message encryption
         sender_key = UserService.get_user_enc_key(user=sender)
-        message['content'] = AES256(key=sender_key).decrypt(message['content'])
-        body = message['content'] if message['content_type'] == 'TEXT' else message['content_type'].lower()
+        content = AES256(key=sender_key).decrypt(message['content'])
+        body = content if message['content_type'] == 'TEXT' else message['content_type'].lower()
         receiver_key = UserService.get_user_enc_key(user=receiver)
-        message['content'] = AES256(key=receiver_key).encrypt(message['content'])
-
-        # saving message at receiver side
-        receiver_doc = store.collection('normal_chats').document(friend.chat_room).collection(receiver.uid).document(sender_doc.id)
-        receiver_doc.set(message)
-
-        # saving message at receiver recents chats
-        receiver_recent = store.collection('recents').document(receiver.uid).collection('chats').document(sender.uid)
-        receiver_recent.set({
-            'uid': sender.uid,
-            'photo': sender.photo_cdn_url,
-            'name': sender.full_name,
-            'message': message,
-            'gender': sender.gender,
-            'time': message['time'],
-            'chatroom': friend.chat_room,
-        })
+        receiver_message = dict(message, content=AES256(key=receiver_key).encrypt(content), is_read=False)
+
+        # saving message at both sides in a single batch, recents chats are written in background
+        ChatStore.commit(
+            [
+                (ChatStore.message_path(friend.chat_room, sender.uid, message_id), sender_message),
+                (ChatStore.message_path(friend.chat_room, receiver.uid, message_id), receiver_message),
+            ],
+            recents=[
+                (ChatStore.recent_path(sender.uid, receiver.uid), {
+                    'uid': receiver.uid,
+                    'photo': receiver.photo_cdn_url,
+                    'name': receiver.full_name,
+                    'message': dict(sender_message, is_read=True),
+                    'gender': receiver.gender,
+                    'time': message['time'],
+                    'chatroom': friend.chat_room,
+                }),
+                (ChatStore.recent_path(receiver.uid, sender.uid), {
+                    'uid': sender.uid,
+                    'photo': sender.photo_cdn_url,
+                    'name': sender.full_name,
+                    'message': receiver_message,
+                    'gender': sender.gender,
+                    'time': message['time'],
+                    'chatroom': friend.chat_room,
+                }),
+            ],
+        )
 
         # sending user a notification
         NotificationChannelService.push_notification(
@@ -0,0 +1,147 @@
+import copy
+import json
+import secrets
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from django_redis import get_redis_connection
+from firebase_admin.firestore import firestore
+
+
+class FirestoreBackend:
+    '''Chat store backend writing to Firestore with a single long lived client.'''
+
+    BATCH_SIZE = 500 # writes per batch allowed by firestore
+
+    __client = None
+    __lock = threading.Lock()
+
+    @staticmethod
+    def get_client():
+        if FirestoreBackend.__client is None:
+            with FirestoreBackend.__lock:
+                if FirestoreBackend.__client is None:
+                    FirestoreBackend.__client = firestore.Client()
+        return FirestoreBackend.__client
+
+    def new_id(self):
+        '''returns a new document id, generated locally without a round trip.'''
+        return FirestoreBackend.get_client().collection('normal_chats').document().id
+
+    def commit(self, writes: list):
+        '''commits writes given as [(path, data)] in a round trip per 500 writes, data None deletes the document.'''
+        client = FirestoreBackend.get_client()
+
+        for i in range(0, len(writes), FirestoreBackend.BATCH_SIZE):
+            batch = client.batch()
+            for path, data in writes[i:i + FirestoreBackend.BATCH_SIZE]:
+                document = client.document(*path)
+                if data is None:
+                    batch.delete(document)
+                else:
+                    batch.set(document, data)
+            batch.commit()
+
+
+
+class FakeFirestoreBackend:
+    '''Local chat store backend for tests and development, keeps documents in memory.'''
+
+    def __init__(self):
+        self.documents = {}
+        self.commits = 0
+
+    def new_id(self):
+        return secrets.token_urlsafe(15)
+
+    def commit(self, writes: list):
+        self.commits += 1
+        for path, data in writes:
+            if data is None:
+                self.documents.pop('/'.join(path), None)
+            else:
+                self.documents['/'.join(path)] = copy.deepcopy(data)
+
+
+
+
+# Chat Store
+class ChatStore:
+    '''
+        Firestore documents of normal chats written through settings.CHAT_STORE_BACKEND.
+        1. the backend and its client are created once per process.
+        2. writes of a request are committed together in a single batch.
+        3. recents are queued and written by flush_chat_recents command when CHAT_RECENTS_IN_BACKGROUND,
+           writes of the same recent document waiting in queue are coalesced to the latest.
+        4. a flushed batch is moved to a processing list and removed only after it is committed,
+           a batch left by a crashed flush is committed again first, writes of recents are idempotent.
+    '''
+
+    KEY = 'chat:recents'
+    PROCESSING_KEY = 'chat:recents:processing'
+
+    __backend = None
+
+    @staticmethod
+    def get_backend():
+        if ChatStore.__backend is None:
+            ChatStore.__backend = import_string(settings.CHAT_STORE_BACKEND)()
+        return ChatStore.__backend
+
+    @staticmethod
+    def set_backend(backend):
+        '''replaces backend of the process, None creates settings.CHAT_STORE_BACKEND again on next use.'''
+        ChatStore.__backend = backend
+
+    @staticmethod
+    def message_path(chat_room, uid, message_id):
+        return ('normal_chats', chat_room, uid, message_id)
+
+    @staticmethod
+    def recent_path(uid, other_uid):
+        return ('recents', uid, 'chats', other_uid)
+
+    @staticmethod
+    def new_id():
+        return ChatStore.get_backend().new_id()
+
+    @staticmethod
+    def commit(writes, recents=[]):
+        '''commits writes in one batch, recents are queued when CHAT_RECENTS_IN_BACKGROUND otherwise committed with writes.'''
+        writes = list(writes)
+        recents = list(recents)
+
+        if settings.CHAT_RECENTS_IN_BACKGROUND and len(recents) > 0:
+            get_redis_connection('default').rpush(ChatStore.KEY, *[json.dumps({'path': path, 'data': data}) for path, data in recents])
+        else:
+            writes.extend(recents)
+
+        if len(writes) > 0:
+            ChatStore.get_backend().commit(writes)
+
+    @staticmethod
+    def flush(size=500):
+        '''commits a batch of queued recents, returns number of recents taken from queue.'''
+        redis = get_redis_connection('default')
+
+        # resuming batch of an interrupted flush, otherwise moving next batch to processing list
+        entries = redis.lrange(ChatStore.PROCESSING_KEY, 0, -1)
+        if len(entries) == 0:
+            pipe = redis.pipeline()
+            for _ in range(size):
+                pipe.lmove(ChatStore.KEY, ChatStore.PROCESSING_KEY, 'LEFT', 'RIGHT')
+            entries = [entry for entry in pipe.execute() if entry is not None]
+
+        # keeping latest write of every document
+        writes = {}
+        for entry in entries:
+            entry = json.loads(entry)
+            writes[tuple(entry['path'])] = entry['data']
+
+        # batch stays in processing list for the next flush if commit fails
+        if len(writes) > 0:
+            ChatStore.get_backend().commit(list(writes.items()))
+
+        redis.delete(ChatStore.PROCESSING_KEY)
+        return len(entries)
@@ -1,3 +1,96 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django_redis import get_redis_connection
+from account.models import User
+from friends.models import Friend
+from utils.security import AES256
+from .services import NormalChatService
+from .store import ChatStore, FakeFirestoreBackend
 
-# Create your tests here.
+
+@override_settings(SERVER_ENC_KEY='chat-tests-server-key')
+class NormalChatServiceTestCase(TestCase):
+    def setUp(self):
+        self.redis = get_redis_connection('default')
+        self.redis.delete(ChatStore.KEY, ChatStore.PROCESSING_KEY)
+
+        self.backend = FakeFirestoreBackend()
+        ChatStore.set_backend(self.backend)
+
+        server = AES256('chat-tests-server-key')
+        self.sender = User.objects.create(uid='chat-sender', email='sender@chat.test', username='chat_sender', first_name='sender', enc_key=server.encrypt('sender-key'))
+        self.receiver = User.objects.create(uid='chat-receiver', email='receiver@chat.test', username='chat_receiver', first_name='receiver', enc_key=server.encrypt('receiver-key'))
+        Friend.objects.create(user=self.sender, friend=self.receiver, chat_room='chatroom-test')
+        Friend.objects.create(user=self.receiver, friend=self.sender, chat_room='chatroom-test')
+
+    def tearDown(self):
+        ChatStore.set_backend(None)
+        self.redis.delete(ChatStore.KEY, ChatStore.PROCESSING_KEY)
+
+    def send(self, text, time):
+        NormalChatService.new_message(self.sender, self.receiver.uid, {
+            'content': AES256('sender-key').encrypt(text),
+            'content_type': 'TEXT',
+            'time': time,
+        })
+
+    def messages(self, uid):
+        prefix = f'normal_chats/chatroom-test/{uid}/'
+        return [data for path, data in self.backend.documents.items() if path.startswith(prefix)]
+
+    @override_settings(CHAT_RECENTS_IN_BACKGROUND=True)
+    def test_message_is_written_at_both_sides_in_one_batch(self):
+        self.send('hello', '1')
+
+        self.assertEqual(self.backend.commits, 1)
+        [sender_message] = self.messages(self.sender.uid)
+        [receiver_message] = self.messages(self.receiver.uid)
+
+        self.assertEqual(sender_message['id'], receiver_message['id'])
+        self.assertEqual(AES256('sender-key').decrypt(sender_message['content']), 'hello')
+        self.assertEqual(AES256('receiver-key').decrypt(receiver_message['content']), 'hello')
+        self.assertFalse(receiver_message['is_read'])
+
+    @override_settings(CHAT_RECENTS_IN_BACKGROUND=False)
+    def test_recents_are_written_with_messages_in_foreground(self):
+        self.send('hello', '1')
+
+        self.assertEqual(self.backend.commits, 1)
+        self.assertIn(f'recents/{self.sender.uid}/chats/{self.receiver.uid}', self.backend.documents)
+        self.assertIn(f'recents/{self.receiver.uid}/chats/{self.sender.uid}', self.backend.documents)
+        self.assertEqual(self.redis.llen(ChatStore.KEY), 0)
+
+    @override_settings(CHAT_RECENTS_IN_BACKGROUND=True)
+    def test_queued_recents_are_coalesced_on_flush(self):
+        self.send('first', '1')
+        self.send('second', '2')
+        self.send('third', '3')
+
+        self.assertEqual(self.redis.llen(ChatStore.KEY), 6)
+        self.assertNotIn(f'recents/{self.receiver.uid}/chats/{self.sender.uid}', self.backend.documents)
+
+        commits = self.backend.commits
+        self.assertEqual(ChatStore.flush(), 6)
+        self.assertEqual(self.backend.commits, commits + 1)
+
+        recent = self.backend.documents[f'recents/{self.receiver.uid}/chats/{self.sender.uid}']
+        self.assertEqual(recent['time'], '3')
+        self.assertEqual(AES256('receiver-key').decrypt(recent['message']['content']), 'third')
+        self.assertEqual(self.redis.llen(ChatStore.KEY), 0)
+        self.assertEqual(self.redis.llen(ChatStore.PROCESSING_KEY), 0)
+
+    @override_settings(CHAT_RECENTS_IN_BACKGROUND=True)
+    def test_recents_of_failed_flush_are_kept_for_next_flush(self):
+        self.send('hello', '1')
+
+        def fail(writes):
+            raise ConnectionError('Firestore unreachable.')
+        commit, self.backend.commit = self.backend.commit, fail
+
+        with self.assertRaises(ConnectionError):
+            ChatStore.flush()
+        self.assertEqual(self.redis.llen(ChatStore.PROCESSING_KEY), 2)
+
+        self.backend.commit = commit
+        self.assertEqual(ChatStore.flush(), 2)
+        self.assertIn(f'recents/{self.sender.uid}/chats/{self.receiver.uid}', self.backend.documents)
+        self.assertEqual(self.redis.llen(ChatStore.PROCESSING_KEY), 0)
@@ -0,0 +1,44 @@
+import asyncio
+
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+from utils.debug import debug_print
+
+
+# User Channel
+class UserChannel:
+    '''
+        Channel layer group of every user joined by all websocket connections of the user, see UserConsumer.
+        1. frames are typed, SECRET_CHAT, SECRET_READ, SECRET_DEL, NOTIFICATION, PRESENCE and TYPING.
+        2. groups span every websocket node sharing the channel layer.
+    '''
+
+    TYPES = ('SECRET_CHAT', 'SECRET_READ', 'SECRET_DEL', 'NOTIFICATION', 'PRESENCE', 'TYPING')
+
+    @staticmethod
+    def group(uid):
+        return f'user_{uid}'
+
+    @staticmethod
+    def event(type, data):
+        return {'type': 'user.frame', 'frame': {'type': type, 'data': data}}
+
+    @staticmethod
+    def send(uid, type, data):
+        '''sends a frame to every connection of user, from sync code.'''
+        UserChannel.send_many([uid], type, data)
+
+    @staticmethod
+    async def group_send_many(uids, type, data, channel_layer=None):
+        '''sends a frame to every connection of users concurrently, from async code.'''
+        channel_layer = channel_layer or get_channel_layer()
+        event = UserChannel.event(type, data)
+        await asyncio.gather(*[channel_layer.group_send(UserChannel.group(uid), event) for uid in uids])
+
+    @staticmethod
+    def send_many(uids, type, data):
+        '''sends a frame to every connection of users, a failing channel layer never fails the caller.'''
+        try:
+            async_to_sync(UserChannel.group_send_many)(list(uids), type, data)
+        except Exception as e:
+            debug_print(e)
@@ -4,7 +4,7 @@ from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated
 from account.permissions import IsRequestValid
 from account.throttling import AuthenticatedUserThrottling, ChatGptThrottling
-from .services import SecretChatService, NormalChatService, ChatGptService
+from .services import SecretChatService, NormalChatService, ChatGptService, PresenceService
 from utils.debug import debug_print
 
 
@@ -28,6 +28,32 @@ class CanChat(APIView):
             return Response.something_went_wrong()
 
 
+# Friends Presence
+class FriendsPresence(APIView):
+    parser_classes = [JSONParser]
+    permission_classes = [IsRequestValid, IsAuthenticated]
+    throttle_classes = [AuthenticatedUserThrottling]
+
+    def get(self, request):
+        try:
+            if request.query_params.get('uids') == None:
+                return Response.error('No uids given.')
+
+            # checking online state of friends in bulk
+            presence = PresenceService.get_friends_presence(
+                auth_user=request.user,
+                uids=[uid for uid in request.query_params.get('uids').split(',') if uid != ''],
+            )
+
+            return Response.success({
+                'message': 'Presence.',
+                'result': presence
+            })
+        except Exception as e:
+            debug_print(e)
+            return Response.something_went_wrong()
+
+
 # Chat Message
 class SecretChatMessage(APIView):
     parser_classes = [JSONParser]
@@ -3,4 +3,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     path('ws/chat/v1/secret/chat/<str:uid>/', consumers.SecretChatConsumer.as_asgi()),
+    path('ws/v1/user/', consumers.UserConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -171,6 +171,7 @@ REST_FRAMEWORK = {
         'resent_password_recovery_otp': '10/min',
         'authenticated_user': '1000/hour',
         'change_names': '3/day',
+        'typeahead': '120/min',
         'chatgpt': '25/day',
         'logout': '10/min',
     },
@@ -204,6 +205,82 @@ OTP_EXPIRE_SECONDS = 3 * 60 # 3 minute
 RESENT_OTP_EXPIRE_SECONDS = 5 * 60 # 5 minute
 PASSWORD_EXPIRE_SECONDS = 5 * 60 # 5 minute
 AUTH_EXPIRE_SECONDS = 30 * 24 * 60 * 60 # 30 days
+AUTH_USER_CACHE_SECONDS = 5 * 60 # 5 minutes, dropped on every user save
+USER_ENC_KEY_CACHE_SIZE = 10000 # decrypted user keys kept per process
+USER_ENC_KEY_CACHE_SECONDS = 10 * 60 # 10 minutes, decrypted again afterwards
+WEB_LOGIN_MAX_SESSIONS = 5 # oldest web sessions are logged out beyond this
+PREKEY_LOW_WATERMARK = 50 # owner is signalled once to upload more one-time prekeys below this
+
+
+# Timeline
+TIMELINE_MAX_LENGTH = 1000 # post ids kept per user timeline
+TIMELINE_EXPIRE_SECONDS = 7 * 24 * 60 * 60 # 7 days, rebuilt on next read
+TIMELINE_CELEBRITY_FOLLOWER_COUNT = 10000 # followers above which posts are merged on read
+
+
+# Reel Feed
+REEL_FEED_LENGTH = 500 # ranked reel ids kept per user
+REEL_FEED_EXPIRE_SECONDS = 30 * 60 # 30 minutes, reranked on next read
+REEL_TRENDING_DAYS = 7 # age of reels scored for trending by rank_reels command
+REEL_FRESH_DAYS = 2 # age of reels taken as fresh uploads
+
+
+# Image Detection
+IMAGE_DETECTION_BACKEND = 'utils.image_processing.VisionDetectionBackend' # or utils.image_processing.StubDetectionBackend
+IMAGE_DETECTION_IN_BACKGROUND = False # when True media posts and reels are published pending until moderate_media command approves them, the command must run
+IMAGE_DETECTION_MAX_ATTEMPTS = 5 # moderations of a media before it is moved to dead letter queue
+IMAGE_DETECTION_CACHE_SECONDS = 30 * 24 * 60 * 60 # 30 days, detection results reused for re-uploaded images
+IMAGE_DETECTION_HASH_DISTANCE = 3 # max differing bits of dHash for near identical images, at most 3 with 4 band index
+
+
+# Image Derivatives
+IMAGE_DERIVATIVE_WIDTHS = [320, 640, 1080] # widths of resized variants generated by generate_derivatives command
+
+
+# Notifications
+NOTIFICATION_SENDER = 'notifier.senders.FirebaseSender' # or notifier.senders.FakeSender
+NOTIFICATION_MAX_ATTEMPTS = 5 # sends of a message before it is dropped
+NOTIFICATION_RETRY_SECONDS = 2 # first retry delay, doubled on every attempt
+
+
+# Chat Store
+CHAT_STORE_BACKEND = 'chat.store.FirestoreBackend' # or chat.store.FakeFirestoreBackend
+CHAT_RECENTS_IN_BACKGROUND = False # when True recents chats are written by flush_chat_recents command instead of request handlers, the command must run
+
+
+# Presence
+PRESENCE_HEARTBEAT_SECONDS = 25 # interval of heartbeat frames sent by user websockets
+PRESENCE_TIMEOUT_SECONDS = 60 # user is offline when no heartbeat is received for this long
+PRESENCE_LAST_SEEN_DAYS = 30 # last seen times are forgotten after this
+PRESENCE_QUERY_SIZE = 100 # friends queried per presence request
+TYPING_COALESCE_SECONDS = 3 # typing frames forwarded at most once per this to a receiver
+
+
+# Social Graph
+GRAPH_EXPIRE_SECONDS = 1 * 24 * 60 * 60 # 1 day, rebuilt on next read
+
+
+# HashTags
+HASHTAG_TRENDING_WINDOW_HOURS = 24 # hours of hashtag uses counted for trending
+HASHTAG_TRENDING_HALF_LIFE_HOURS = 6 # age at which a use counts half for trending
+
+
+# Search
+SEARCH_MAX_WORDS = 5 # query words matched, the rest are ignored
+SEARCH_MAX_TERM_LENGTH = 32 # longer words are indexed and matched by their first characters
+SEARCH_PREFIX_EXPANSIONS = 10 # most frequent indexed terms a query word is expanded to as a prefix
+SEARCH_PREFIX_SCAN = 1000 # indexed terms with a query word as prefix considered for expansion
+SEARCH_TERM_DEPTH = 5000 # best scored postings of the rarest query word taken as candidates
+TYPEAHEAD_SIZE = 10 # usernames completed per keystroke
+TYPEAHEAD_TOP_PREFIX = 3 # prefixes up to this length are served from precomputed most followed usernames
+TYPEAHEAD_TOP_SIZE = 100 # most followed usernames kept per short prefix
+TYPEAHEAD_SCAN = 200 # usernames scanned for longer prefixes
+TYPEAHEAD_NETWORK_EXPIRE_SECONDS = 10 * 60 # 10 minutes, cached network usernames of a viewer follow username changes after this
+
+
+# Views
+VIEW_DEDUP_SECONDS = 7 * 24 * 60 * 60 # 7 days, viewer sets reloaded from database on next view
+VIEW_BATCH_SIZE = 100 # max reels per batch view request
 
 
 # Internationalization
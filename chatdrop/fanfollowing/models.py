@@ -6,6 +6,11 @@ class Following(models.Model):
     user = models.ForeignKey('account.User', on_delete=models.CASCADE, related_name='current_user')
     follow = models.ForeignKey('account.User', on_delete=models.CASCADE, related_name='following_user')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'follow'], name='unique_following'),
+        ]
+
 
 # Following Request
 class FollowRequest(models.Model):
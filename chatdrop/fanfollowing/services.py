@@ -3,8 +3,10 @@ import notifier.services as notifier_services
 from .models import Following, FollowRequest
 from account.services import UserService
 from .exceptions import FollowError
-from django.core.paginator import Paginator
-from privacy.models import BlockedUser
+from utils.pagination import CursorPaginator
+from utils.counters import Counters
+from feeds.timeline import TimeLineStore
+from friends.graph import SocialGraph
 
 
 
@@ -14,7 +16,7 @@ class FollowService:
 
     @staticmethod
     def is_following_exists(user, follow):
-        return Following.objects.filter(user=user, follow=follow).exists()
+        return SocialGraph.is_following(user, follow)
     
     @staticmethod
     def get_following(user, follow):
@@ -74,13 +76,15 @@ class FollowService:
 
         if not FollowService.is_following_exists(user=follow_req.sender, follow=auth_user):
             FollowService.__create_following(user=follow_req.sender, follow=auth_user)
+            SocialGraph.invalidate(follow_req.sender, 'following')
+            SocialGraph.invalidate(auth_user, 'followers')
 
-            # upgrading fan following
-            auth_user.follower_count += 1
-            auth_user.save()
+            # rebuilding follower timeline with posts of new following
+            TimeLineStore.invalidate(follow_req.sender)
 
-            profile.following_count += 1
-            profile.save()
+            # upgrading fan following
+            Counters.incr(auth_user, 'follower_count')
+            Counters.incr(profile, 'following_count')
 
             # deleting request
             follow_req.delete()
@@ -112,13 +116,15 @@ class FollowService:
 
         following = FollowService.get_following(user=auth_user, follow=user)
         following.delete()
+        SocialGraph.invalidate(auth_user, 'following')
+        SocialGraph.invalidate(user, 'followers')
 
-        # downgrading fan following
-        user.follower_count -= 1
-        user.save()
+        # rebuilding timeline without posts of old following
+        TimeLineStore.invalidate(auth_user)
 
-        auth_user.following_count -= 1
-        auth_user.save()
+        # downgrading fan following
+        Counters.decr(user, 'follower_count')
+        Counters.decr(auth_user, 'following_count')
 
     @staticmethod
     def force_unfollow(auth_user, follower_uid):
@@ -127,31 +133,35 @@ class FollowService:
         if FollowService.is_following_exists(user=user, follow=auth_user):
             following = FollowService.get_following(user=user, follow=auth_user)
             following.delete()
+            SocialGraph.invalidate(user, 'following')
+            SocialGraph.invalidate(auth_user, 'followers')
 
-            # downgrading fan following
-            auth_user.follower_count -= 1
-            auth_user.save()
+            # rebuilding timeline of old follower without posts of user
+            TimeLineStore.invalidate(user)
 
-            user.following_count -= 1
-            user.save()
+            # downgrading fan following
+            Counters.decr(auth_user, 'follower_count')
+            Counters.decr(user, 'following_count')
     
     @staticmethod
-    def list_followers(auth_user, uid, page):
+    def list_followers(auth_user, uid, page, cursor=None):
         user = UserService.get_user(uid)
 
         if user.is_private and auth_user.uid != user.uid:
-            return []
+            return [], False, None
 
-        followers = Following.objects.filter(follow=user)
+        followers = Following.objects.filter(follow=user).select_related('user')
 
-        pagination = Paginator(followers, 100)
-        paginated_followers = pagination.get_page(int(page))
+        pagination = CursorPaginator(followers, ('-id',), 100)
+        paginated_followers = pagination.get_page(cursor=cursor, page=page)
+
+        blocked_by = SocialGraph.members(auth_user, 'blocked_by')
 
         follower_list = []
         for follower in paginated_followers.object_list:
-            profile = UserService.get_user(uid=follower.user.uid)
+            profile = follower.user
 
-            if not BlockedUser.objects.filter(user=profile ,blocked_user=auth_user).exists():
+            if profile.uid not in blocked_by:
 
                 follower_list.append({
                     'uid': profile.uid,
@@ -162,25 +172,27 @@ class FollowService:
                     'message': profile.message,
                 })
             
-        return follower_list, paginated_followers.has_next()
+        return follower_list, paginated_followers.has_next(), paginated_followers.next_cursor
     
     @staticmethod
-    def list_followings(auth_user, uid, page):
+    def list_followings(auth_user, uid, page, cursor=None):
         user = UserService.get_user(uid)
 
         if user.is_private and auth_user.uid != user.uid:
-            return []
+            return [], False, None
+
+        followings = Following.objects.filter(user=user).select_related('follow')
 
-        followings = Following.objects.filter(user=user)
+        pagination = CursorPaginator(followings, ('-id',), 100)
+        paginated_followings = pagination.get_page(cursor=cursor, page=page)
 
-        pagination = Paginator(followings, 100)
-        paginated_followings = pagination.get_page(int(page))
+        blocked_by = SocialGraph.members(auth_user, 'blocked_by')
 
         following_list = []
         for following in paginated_followings.object_list:
-            profile = UserService.get_user(uid=following.follow.uid)
+            profile = following.follow
 
-            if not BlockedUser.objects.filter(user=profile ,blocked_user=auth_user).exists():
+            if profile.uid not in blocked_by:
 
                 following_list.append({
                     'uid': profile.uid,
@@ -191,5 +203,5 @@ class FollowService:
                     'message': profile.message,
                 })
 
-        return following_list, paginated_followings.has_next()
+        return following_list, paginated_followings.has_next(), paginated_followings.next_cursor
         
\ No newline at end of file
@@ -98,16 +98,18 @@ class ListFollowers(APIView):
 
     def get(self, request):
         try:
-            followers, has_next = FollowService.list_followers(
+            followers, has_next, next_cursor = FollowService.list_followers(
                 auth_user=request.user,
                 uid=request.query_params['of'],
-                page=request.query_params['page'],
+                page=request.query_params.get('page'),
+                cursor=request.query_params.get('cursor'),
             )
             
             return Response.success({
                 'message': 'All Followers.',
                 'followers': followers,
-                'has_next': has_next
+                'has_next': has_next,
+                'next_cursor': next_cursor,
             })
         except Exception as e:
             debug_print(e)
@@ -122,16 +124,18 @@ class ListFollowings(APIView):
 
     def get(self, request):
         try:
-            followings, has_next = FollowService.list_followings(
+            followings, has_next, next_cursor = FollowService.list_followings(
                 auth_user=request.user,
                 uid=request.query_params['of'],
-                page=request.query_params['page'],
+                page=request.query_params.get('page'),
+                cursor=request.query_params.get('cursor'),
             )
             
             return Response.success({
                 'message': 'All Followings.',
                 'followings': followings,
-                'has_next': has_next
+                'has_next': has_next,
+                'next_cursor': next_cursor,
             })
         except Exception as e:
             debug_print(e)
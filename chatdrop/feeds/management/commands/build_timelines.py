@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from account.models import User
+from feeds.timeline import TimeLineStore
+
+
+# Backfill precomputed timelines
+class Command(BaseCommand):
+    help = 'Builds the precomputed timeline of active users from database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uid', nargs='*', default=[], help='builds timelines of given user uids only.')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        if len(options['uid']) > 0:
+            users = users.filter(uid__in=options['uid'])
+
+        count = 0
+        for user in users.iterator():
+            TimeLineStore.build(user)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'{count} timelines built.'))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from account.models import User
+from feeds.reel_ranking import ReelRanker
+from privacy.viewer import ViewerContext
+from reel.models import Reel, ReelLike, ReelView
+
+
+# Offline evaluation of reel ranking
+class Command(BaseCommand):
+    help = 'Measures recall of held out likes in top ranked reels against a recent reels baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='users with most likes to evaluate.')
+        parser.add_argument('--k', type=int, default=50, help='size of evaluated feed head.')
+        parser.add_argument('--holdout', type=float, default=0.2, help='fraction of latest likes of a user held out.')
+        parser.add_argument('--min-likes', type=int, default=5, help='users with fewer likes are skipped.')
+
+    def __recent(self, user, held_out, k):
+        '''baseline feed of most recent visible reels not seen by user.'''
+        seen = ReelView.objects.filter(seen_by=user).exclude(reel__in=held_out).values('reel')
+        reels = ViewerContext(user).visible(Reel.objects.exclude(user=user).exclude(id__in=seen))
+        return list(reels.order_by('-posted_on', '-id').values_list('id', flat=True)[:k])
+
+    def handle(self, *args, **options):
+        ReelRanker.build_trending()
+
+        users = User.objects.filter(is_active=True).annotate(likes=Count('reellike')).filter(
+            likes__gte=options['min_likes']
+        ).order_by('-likes')[:options['users']]
+
+        k = options['k']
+        evaluated = 0
+        ranked_recall = 0
+        recent_recall = 0
+        for user in users:
+            likes = list(ReelLike.objects.filter(by=user).order_by('-id').values_list('reel', flat=True))
+            held_out = set(likes[:max(int(len(likes) * options['holdout']), 1)])
+
+            ranked = {reel_id for reel_id, _ in ReelRanker.rank(user, held_out=held_out)[:k]}
+            recent = set(self.__recent(user, held_out, k))
+
+            ranked_recall += len(ranked & held_out) / len(held_out)
+            recent_recall += len(recent & held_out) / len(held_out)
+            evaluated += 1
+
+        if evaluated == 0:
+            self.stdout.write(self.style.WARNING('No users with enough likes to evaluate.'))
+            return
+
+        self.stdout.write(f'users evaluated: {evaluated}')
+        self.stdout.write(f'recall@{k} ranked: {ranked_recall / evaluated:.4f}')
+        self.stdout.write(f'recall@{k} recent: {recent_recall / evaluated:.4f}')
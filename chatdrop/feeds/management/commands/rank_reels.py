@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from account.models import User
+from feeds.reel_ranking import ReelRanker
+from utils.debug import debug_print
+
+
+# Reel ranking batch
+class Command(BaseCommand):
+    help = 'Scores trending reels and builds ranked reel feeds of users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uid', nargs='*', default=None, help='builds feeds of given user uids, of all active users if given without uids.')
+        parser.add_argument('--interval', type=float, default=0, help='seconds between runs, runs once if not given.')
+
+    def handle(self, *args, **options):
+        while True:
+            scored = ReelRanker.build_trending()
+
+            built = 0
+            if options['uid'] is not None:
+                users = User.objects.filter(is_active=True)
+                if len(options['uid']) > 0:
+                    users = users.filter(uid__in=options['uid'])
+
+                for user in users.iterator():
+                    try:
+                        ReelRanker.build(user)
+                        built += 1
+                    except Exception as e:
+                        debug_print(e)
+
+            self.stdout.write(self.style.SUCCESS(f'{scored} trending reels scored, {built} feeds built.'))
+
+            if options['interval'] <= 0:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,223 @@
+import math
+
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from django_redis import get_redis_connection
+from friends.graph import SocialGraph
+from privacy.viewer import ViewerContext
+from reel.models import Reel, ReelHashTag, ReelVideo, ReelLike, ReelView
+
+
+# Reel Ranker
+class ReelRanker:
+    '''
+        Ranked reel feed of every user held in a redis sorted set of reel ids scored by rank.
+        1. candidates are reels of friends and followings, reels sharing hashtags with liked reels, trending reels and fresh uploads.
+        2. reels already seen by the user are never candidates.
+        3. candidates are scored by network, tag and label affinity, trending velocity and freshness, same author reels are spread out.
+        4. trending scores are precomputed by rank_reels command, user feeds are built on first read and expire.
+        5. viewed reels are removed from cached feed and a like drops it, so it is ranked again with new interests.
+        6. feed pages are read by (score, reel_id) keyset, a rebuilt feed is scored afresh so the keyset only approximates the position reached.
+    '''
+
+    WEIGHTS = {
+        'network': 3.0,
+        'affinity': 2.0,
+        'trending': 1.5,
+        'fresh': 1.0,
+    }
+
+    CANDIDATES = 200 # reels taken from every candidate source
+    AUTHOR_PENALTY = 0.7 # score multiplier for every earlier reel of the same author in feed
+    TRENDING_KEY = 'reels:trending'
+
+    @staticmethod
+    def __key(uid):
+        return f'{uid}:reelline'
+
+    # Trending
+    @staticmethod
+    def build_trending():
+        '''scores recent reels by likes and views per hour of age, returns number of reels scored.'''
+        now = timezone.now()
+        reels = Reel.objects.filter(
+            moderation='APPROVED',
+            visibility='PUBLIC',
+            posted_on__gte=now - timedelta(days=settings.REEL_TRENDING_DAYS)
+        ).values_list('id', 'likes_count', 'views_count', 'posted_on')
+
+        scores = {}
+        for reel_id, likes_count, views_count, posted_on in reels:
+            hours = (now - posted_on).total_seconds() / 3600
+            scores[reel_id] = (2 * likes_count + views_count) / math.pow(hours + 2, 1.5)
+
+        redis = get_redis_connection('default')
+        pipe = redis.pipeline()
+        pipe.delete(ReelRanker.TRENDING_KEY)
+        if len(scores) > 0:
+            pipe.zadd(ReelRanker.TRENDING_KEY, scores)
+            pipe.zremrangebyrank(ReelRanker.TRENDING_KEY, 0, -(settings.REEL_FEED_LENGTH + 1))
+        pipe.execute()
+
+        return len(scores)
+
+    @staticmethod
+    def __trending():
+        '''returns {reel_id: score} of trending reels normalized to 0..1.'''
+        entries = get_redis_connection('default').zrevrange(ReelRanker.TRENDING_KEY, 0, ReelRanker.CANDIDATES - 1, withscores=True)
+        if len(entries) == 0 or entries[0][1] <= 0:
+            return {}
+        top = entries[0][1]
+        return {member.decode('utf-8'): score / top for member, score in entries}
+
+    # Affinity
+    @staticmethod
+    def interests(user, held_out=()):
+        '''returns {tag or label: weight 0..1} from reels liked by the user and user interests.'''
+        liked = list(
+            ReelLike.objects.filter(by=user).exclude(reel__in=held_out)
+            .order_by('-id').values_list('reel', flat=True)[:ReelRanker.CANDIDATES]
+        )
+
+        interests = Counter()
+        interests.update(
+            tag.lower() for tag in ReelHashTag.objects.filter(reel__in=liked, type='TAG').values_list('tag', flat=True)
+        )
+        for labels in ReelVideo.objects.filter(reel__in=liked).values_list('labels', flat=True):
+            interests.update(labels)
+        interests.update(interest.strip().lower() for interest in user.interest.split(',') if interest.strip() != '')
+
+        if len(interests) == 0:
+            return {}
+        top = max(interests.values())
+        return {interest: count / top for interest, count in interests.items()}
+
+    # Ranking
+    @staticmethod
+    def __candidates(user, interests, network, trending):
+        now = timezone.now()
+        size = ReelRanker.CANDIDATES
+
+        candidates = set(trending.keys())
+        candidates.update(
+            Reel.objects.filter(user__in=network).order_by('-posted_on').values_list('id', flat=True)[:size]
+        )
+        candidates.update(
+            Reel.objects.filter(posted_on__gte=now - timedelta(days=settings.REEL_FRESH_DAYS))
+            .order_by('-posted_on').values_list('id', flat=True)[:size]
+        )
+
+        tags = sorted(interests, key=interests.get, reverse=True)[:50]
+        if len(tags) > 0:
+            candidates.update(
+                ReelHashTag.objects.filter(type='TAG', tag__in=tags)
+                .order_by('-reel__posted_on').values_list('reel', flat=True)[:size]
+            )
+
+        return candidates
+
+    @staticmethod
+    def rank(user, held_out=()):
+        '''
+            returns [(reel_id, score)] ranked for the user, best first.
+            1. held_out reels are neither used as interests nor excluded as seen, used by offline evaluation.
+        '''
+        network = SocialGraph.members(user, 'friends') | SocialGraph.members(user, 'following')
+        interests = ReelRanker.interests(user, held_out=held_out)
+        trending = ReelRanker.__trending()
+
+        candidates = ReelRanker.__candidates(user, interests, network, trending)
+        seen = ReelView.objects.filter(seen_by=user).exclude(reel__in=held_out).values('reel')
+        reels = ViewerContext(user).visible(
+            Reel.objects.filter(id__in=candidates).exclude(user=user).exclude(id__in=seen)
+        ).prefetch_related('reelhashtag_set', 'reelvideo_set')
+
+        now = timezone.now()
+        scored = []
+        for reel in reels:
+            features = {tag.tag.lower() for tag in reel.reelhashtag_set.all() if tag.type == 'TAG'}
+            for video in reel.reelvideo_set.all():
+                features.update(video.labels)
+
+            hours = (now - reel.posted_on).total_seconds() / 3600
+            score = (
+                ReelRanker.WEIGHTS['network'] * (1 if reel.user_id in network else 0) +
+                ReelRanker.WEIGHTS['affinity'] * min(sum(interests.get(feature, 0) for feature in features), 1) +
+                ReelRanker.WEIGHTS['trending'] * trending.get(reel.id, 0) +
+                ReelRanker.WEIGHTS['fresh'] * math.exp(-hours / 24)
+            )
+            scored.append((reel.id, reel.user_id, score))
+
+        # spreading reels of the same author
+        scored.sort(key=lambda entry: (-entry[2], entry[0]))
+        authors = Counter()
+        ranked = []
+        for reel_id, author, score in scored:
+            ranked.append((reel_id, score * math.pow(ReelRanker.AUTHOR_PENALTY, authors[author])))
+            authors[author] += 1
+
+        ranked.sort(key=lambda entry: (-entry[1], entry[0]))
+        return ranked[:settings.REEL_FEED_LENGTH]
+
+    # Feed
+    @staticmethod
+    def build(user):
+        '''ranks reels for the user and caches the ranked list.'''
+        ranked = ReelRanker.rank(user)
+
+        key = ReelRanker.__key(user.uid)
+        pipe = get_redis_connection('default').pipeline()
+        pipe.delete(key)
+        if len(ranked) > 0:
+            pipe.zadd(key, dict(ranked))
+        else:
+            # caching empty feed
+            pipe.zadd(key, {'': -1})
+        pipe.expire(key, settings.REEL_FEED_EXPIRE_SECONDS)
+        pipe.execute()
+
+    @staticmethod
+    def invalidate(user):
+        get_redis_connection('default').delete(ReelRanker.__key(user.uid))
+
+    @staticmethod
+    def remove_seen(user, reel_ids):
+        '''removes reels viewed by the user from cached feed.'''
+        reel_ids = list(reel_ids)
+        if len(reel_ids) > 0:
+            get_redis_connection('default').zrem(ReelRanker.__key(user.uid), *reel_ids)
+
+    @staticmethod
+    def ranked(user):
+        '''returns ids of reels in cached feed of the user, empty if feed is not cached.'''
+        members = get_redis_connection('default').zrange(ReelRanker.__key(user.uid), 0, -1)
+        return {member.decode('utf-8') for member in members} - {''}
+
+    @staticmethod
+    def read(user, size, cursor=None, offset=0):
+        '''
+            returns (entries, has_next) of ranked feed page, best first.
+            1. entries is a list of (reel_id, score).
+            2. cursor is (score, reel_id) of the last entry of previous page, offset is a rank offset used without cursor.
+        '''
+        key = ReelRanker.__key(user.uid)
+        redis = get_redis_connection('default')
+
+        if not redis.exists(key):
+            ReelRanker.build(user)
+
+        if cursor is None:
+            window = redis.zrevrange(key, offset, offset + size, withscores=True)
+            entries = [(member.decode('utf-8'), score) for member, score in window]
+        else:
+            # skipping entries sharing the cursor score which were already served
+            upper_score, reel_id = cursor
+            ties = redis.zcount(key, upper_score, upper_score)
+            window = redis.zrevrangebyscore(key, upper_score, '-inf', start=0, num=size + 1 + ties, withscores=True)
+            entries = [(member.decode('utf-8'), score) for member, score in window]
+            entries = [(member, score) for member, score in entries if score < upper_score or member < reel_id]
+
+        entries = [(member, score) for member, score in entries if member != '']
+        return entries[:size], len(entries) > size
@@ -11,8 +11,14 @@ from stories.services import StoryService
 from django.core.paginator import Paginator
 from django.db.models import Q
 from post.services import PostService
-from reel.models import Reel
+from reel.models import Reel, ReelView
 from deprecated.sphinx import deprecated
+from datetime import datetime, timezone
+from .timeline import TimeLineStore
+from .reel_ranking import ReelRanker
+from privacy.viewer import ViewerContext
+from search.hashtags import HashTagIndex
+from utils.pagination import Cursor, CursorPaginator
 
 
 # TimeLine Paginator
@@ -43,27 +49,10 @@ class TimeLineService:
         return post_list
     
     @staticmethod
-    def serialize_post_v3(user, posts):
-        post_list = []
+    def serialize_post_v3(user, posts, viewer=None):
+        viewer = ViewerContext(user) if viewer is None else viewer
 
-        counted = []
-        for post in posts:
-            if privacy_services.BlockedUserService.is_blocked(user=post.user, blocked_user=user):
-                continue
-
-            if post.id in counted or (post.is_private and post.user.uid != user.uid):
-                continue
-
-            if post.is_only_friends and user.uid != post.user.uid:
-                if not friend_services.FriendService.is_friend_exists(user=user, friend=post.user):
-                    continue
-
-            counted.append(post.id)
-            
-            post_json = PostService.to_json_v3(post=post, auth_user=user)
-            post_list.append(post_json)
-        
-        return post_list
+        return PostService.to_json_many(viewer.filter_visible(posts), auth_user=user)
 
     
     @deprecated(version='2', reason='This method is deprecated, must use v3')
@@ -83,9 +72,7 @@ class TimeLineService:
         feeds_query += Post.objects.filter(user=user).order_by('-posted_on')
 
         q = user.interest.strip().split(',') + [user.location, f'@{user.username}::{user.uid}']
-        hashtags = PostHashTag.objects.filter(Q(tag__in=q))
-        for hashtag in hashtags:
-            feeds_query.append(hashtag.post)
+        feeds_query += Post.objects.filter(id__in=PostHashTag.objects.filter(tag__in=q).values('post'))
 
         feeds_query += Post.objects.filter(visibility='PUBLIC')
 
@@ -99,34 +86,85 @@ class TimeLineService:
         return feed_json, paginated_posts.has_next()
 
     @staticmethod
-    def generate_timeline_feeds_v3(user, page):
-        feeds_query = []
-
-        friends = Friend.objects.filter(user=user)
-        for friend in friends:
-            feeds_query += Post.objects.filter(user=friend.friend).order_by('-posted_on')
-        
-        followings = Following.objects.filter(user=user)
-        for following in followings:
-            feeds_query += Post.objects.filter(user=following.follow).order_by('-posted_on')
-
-        feeds_query += Post.objects.filter(user=user).order_by('-posted_on')
+    def __discover_posts(user):
+        '''public and interest matching posts from outside the user network.'''
+        q = user.interest.strip().split(',') + [user.location]
+        return Post.objects.select_related('user').filter(
+            Q(visibility='PUBLIC') | Q(id__in=HashTagIndex.posts(q))
+        ).exclude(
+            Q(user=user) |
+            Q(user__in=Friend.objects.filter(user=user).values('friend')) |
+            Q(user__in=Following.objects.filter(user=user).values('follow'))
+        )
 
-        q = user.interest.strip().split(',') + [user.location, f'@{user.username}::{user.uid}']
-        hashtags = PostHashTag.objects.filter(Q(tag__in=q))
-        for hashtag in hashtags:
-            feeds_query.append(hashtag.post)
-
-        feeds_query += Post.objects.filter(visibility='PUBLIC')
+    @staticmethod
+    def generate_timeline_feeds_v3(user, page, cursor=None):
+        '''
+            timeline cursor is [score, post_id, None] while reading precomputed timeline
+            and [None, None, discover_cursor] once it is exhausted.
+        '''
+        page_size = 50
+        values = Cursor.decode(cursor)
+
+        posts = []
+        next_cursor = None
+
+        if values is None or values[0] is not None:
+            # reading post ids from precomputed timeline
+            start = (int(page) - 1) * page_size if values is None and page is not None else 0
+            entries, upper_score, has_next, timeline_length = TimeLineStore.read(
+                user, 
+                page_size, 
+                cursor=None if values is None else (values[0], values[1]), 
+                start=start,
+            )
+
+            posts_by_id = Post.objects.select_related('user').in_bulk([post_id for post_id, _ in entries])
+            posts = [posts_by_id[post_id] for post_id, _ in entries if post_id in posts_by_id]
+
+            # merging posts of followed celebrity accounts falling in the time window of this page
+            celebrities = TimeLineStore.celebrity_followings(user)
+            if len(celebrities) > 0 and start <= timeline_length:
+                celebrity_posts = Post.objects.select_related('user').filter(user__in=celebrities, moderation='APPROVED', visibility='PUBLIC')
+                if upper_score is not None:
+                    celebrity_posts = celebrity_posts.filter(posted_on__lt=datetime.fromtimestamp(upper_score, tz=timezone.utc))
+                if has_next and len(entries) > 0:
+                    celebrity_posts = celebrity_posts.filter(posted_on__gt=datetime.fromtimestamp(entries[-1][1], tz=timezone.utc))
+                posts = sorted(posts + list(celebrity_posts.order_by('-posted_on')[:page_size]), key=lambda post: (post.posted_on, post.id), reverse=True)
+
+            if len(posts) > page_size:
+                # capping merged page, next page continues after its last post
+                posts = posts[:page_size]
+                next_cursor = Cursor.encode([posts[-1].posted_on.timestamp(), posts[-1].id, None])
+            elif has_next:
+                next_cursor = Cursor.encode([entries[-1][1], entries[-1][0], None])
+            elif len(entries) < page_size:
+                # filling the page with posts from outside user network once timeline ends
+                remaining = page_size - len(posts)
+                offset = max(start - timeline_length, 0)
+                discover_posts = list(TimeLineService.__discover_posts(user).order_by('-posted_on', '-id')[offset:offset + remaining + 1])
+                
+                if len(discover_posts) > remaining and remaining > 0:
+                    last = discover_posts[remaining - 1]
+                    next_cursor = Cursor.encode([None, None, Cursor.encode([last.posted_on, last.id])])
+                elif len(discover_posts) > remaining:
+                    # page filled by timeline, discover posts start from their head
+                    next_cursor = Cursor.encode([None, None, None])
+                posts += discover_posts[:remaining]
+            else:
+                next_cursor = Cursor.encode([None, None, None])
+        else:
+            # reading posts from outside user network after timeline
+            pagination = CursorPaginator(TimeLineService.__discover_posts(user), ('-posted_on', '-id'), page_size)
+            discover_posts = pagination.get_page(cursor=values[2])
+            posts = discover_posts.object_list
 
-        pagination = Paginator(feeds_query, 50)
-        paginated_posts = pagination.get_page(int(page))
+            if discover_posts.has_next():
+                next_cursor = Cursor.encode([None, None, discover_posts.next_cursor])
 
-        feed_json = TimeLineService.serialize_post_v3(user, paginated_posts.object_list)
+        feed_json = TimeLineService.serialize_post_v3(user, posts)
 
-        shuffle(feed_json)
-
-        return feed_json, paginated_posts.has_next()
+        return feed_json, next_cursor is not None, next_cursor
 
 
 # Story Feeds
@@ -177,30 +215,44 @@ class StoryLineFeedsService:
 # reel line feeds
 class ReelLineService:
     @staticmethod
-    def list_all(auth_user, page):
-        feed_list = []
-        reels = Reel.objects.all()
-
-        pagination = Paginator(reels, 100)
-        paginated_reels = pagination.get_page(int(page))
-
-        reel_service = reel_services.ReelService
-
-        counted = []
-        for reel in paginated_reels.object_list:
-            if privacy_services.BlockedUserService.is_blocked(user=reel.user, blocked_user=auth_user):
-                continue
-
-            if reel.id in counted or (reel.is_private and reel.user.uid != auth_user.uid):
-                continue
-
-            if reel.is_only_friends and auth_user.uid != reel.user.uid:
-                if not friend_services.FriendService.is_friend_exists(user=auth_user, friend=reel.user):
-                    continue
-
-            feed_list.append(reel_service.to_json(reel, auth_user=auth_user))
-        
-        shuffle(feed_list)
+    def list_all(auth_user, page, cursor=None):
+        '''
+            reel line cursor is [score, reel_id, None] while reading ranked feed
+            and [None, None, recent_cursor] with recent reels once it is exhausted.
+        '''
+        page_size = 50
+        values = Cursor.decode(cursor)
+        viewer = ViewerContext(auth_user)
+
+        next_cursor = None
+        if values is None or values[0] is not None:
+            # reading ranked reels
+            offset = (int(page) - 1) * page_size if values is None and page is not None else 0
+            entries, has_next = ReelRanker.read(
+                auth_user, 
+                page_size, 
+                cursor=None if values is None else (values[0], values[1]), 
+                offset=offset,
+            )
+
+            reels_by_id = Reel.objects.select_related('user').in_bulk([reel_id for reel_id, _ in entries])
+            reels = [reels_by_id[reel_id] for reel_id, _ in entries if reel_id in reels_by_id]
+
+            next_cursor = Cursor.encode([entries[-1][1], entries[-1][0], None] if has_next else [None, None, None])
+        else:
+            # reading recent reels after ranked feed, leaving out reels seen or already served from ranked feed
+            seen = ReelView.objects.filter(seen_by=auth_user).values('reel')
+            recent_reels = viewer.visible(
+                Reel.objects.select_related('user').exclude(id__in=seen).exclude(id__in=ReelRanker.ranked(auth_user))
+            )
+            pagination = CursorPaginator(recent_reels, ('-posted_on', '-id'), page_size)
+            paginated_reels = pagination.get_page(cursor=values[2])
+            reels = paginated_reels.object_list
+
+            if paginated_reels.has_next():
+                next_cursor = Cursor.encode([None, None, paginated_reels.next_cursor])
+
+        feed_list = reel_services.ReelService.to_json_many(viewer.filter_visible(reels), auth_user=auth_user)
         
-        return feed_list, paginated_reels.has_next()
+        return feed_list, next_cursor is not None, next_cursor
 
@@ -0,0 +1,159 @@
+from django.conf import settings
+from django.db.models import Q
+from django_redis import get_redis_connection
+from friends.models import Friend
+from fanfollowing.models import Following
+from post.models import Post, PostHashTag
+
+
+# Timeline Store
+class TimeLineStore:
+    '''
+        Precomputed timeline of every user held in a redis sorted set of post ids scored by posted_on.
+        1. posts are fanned out to friends and followers when they are created (fan-out-on-write).
+        2. posts of celebrity accounts are only fanned out to friends, followers merge them on read (fan-out-on-read).
+        3. missing or expired timelines are rebuilt from database on next read.
+    '''
+
+    @staticmethod
+    def __key(uid):
+        return f'{uid}:timeline'
+
+    @staticmethod
+    def __score(post):
+        return post.posted_on.timestamp()
+
+    @staticmethod
+    def is_celebrity(user):
+        return user.follower_count >= settings.TIMELINE_CELEBRITY_FOLLOWER_COUNT
+
+    @staticmethod
+    def celebrity_followings(user):
+        '''uids of celebrity accounts followed by the user which are not fanned out to the user.'''
+        return list(
+            Following.objects.filter(user=user, follow__follower_count__gte=settings.TIMELINE_CELEBRITY_FOLLOWER_COUNT)
+            .exclude(follow__in=Friend.objects.filter(user=user).values('friend'))
+            .values_list('follow', flat=True)
+        )
+
+    @staticmethod
+    def __mentioned(post):
+        '''uids of users mentioned in the post.'''
+        return [tag.split('::')[-1] for tag in PostHashTag.objects.filter(post=post, type='USER').values_list('tag', flat=True)]
+
+    @staticmethod
+    def __audience(post, mentioned=None, visibility=None):
+        '''uids of timelines the post belongs to with given visibility, visibility of post by default.'''
+        author = post.user
+        audience = {author.uid}
+        visibility = visibility or post.visibility
+
+        if visibility == 'PRIVATE':
+            return audience
+
+        audience.update(Friend.objects.filter(user=author).values_list('friend', flat=True))
+
+        if visibility == 'PUBLIC':
+            audience.update(mentioned if mentioned is not None else TimeLineStore.__mentioned(post))
+
+            if not TimeLineStore.is_celebrity(author):
+                audience.update(Following.objects.filter(follow=author).values_list('user', flat=True))
+
+        return audience
+
+    @staticmethod
+    def push(post, mentioned=None):
+        '''fan out the post to timelines of author, friends, followers and mentioned users, mentioned are read from tags if not given.'''
+        audience = list(TimeLineStore.__audience(post, mentioned))
+        keys = [TimeLineStore.__key(uid) for uid in audience]
+        redis = get_redis_connection('default')
+
+        # pushing only to built timelines, others will include the post when built
+        pipe = redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.exists(key)
+        built = pipe.execute()
+
+        pipe = redis.pipeline(transaction=False)
+        for key, exists in zip(keys, built):
+            if exists:
+                pipe.zadd(key, {post.id: TimeLineStore.__score(post)})
+                pipe.zremrangebyrank(key, 0, -(settings.TIMELINE_MAX_LENGTH + 1))
+        pipe.execute()
+
+    @staticmethod
+    def remove(post, visibility=None):
+        '''removes the post from timelines it was fanned out to with given visibility, visibility of post by default.'''
+        redis = get_redis_connection('default')
+        pipe = redis.pipeline(transaction=False)
+        for uid in TimeLineStore.__audience(post, visibility=visibility):
+            pipe.zrem(TimeLineStore.__key(uid), post.id)
+        pipe.execute()
+
+    @staticmethod
+    def invalidate(user):
+        '''drops the timeline of user, it is rebuilt on next read.'''
+        get_redis_connection('default').delete(TimeLineStore.__key(user.uid))
+
+    @staticmethod
+    def build(user):
+        '''rebuilds the timeline of user from posts of user, friends and non celebrity followings.'''
+        friends = Friend.objects.filter(user=user).values('friend')
+        followings = Following.objects.filter(
+            user=user,
+            follow__follower_count__lt=settings.TIMELINE_CELEBRITY_FOLLOWER_COUNT
+        ).values('follow')
+
+        posts = Post.objects.filter(
+            Q(user=user) |
+            Q(user__in=friends, moderation='APPROVED', visibility__in=['PUBLIC', 'ONLY_FRIENDS']) |
+            Q(user__in=followings, moderation='APPROVED', visibility='PUBLIC')
+        ).order_by('-posted_on').values_list('id', 'posted_on')[:settings.TIMELINE_MAX_LENGTH]
+
+        key = TimeLineStore.__key(user.uid)
+        redis = get_redis_connection('default')
+        pipe = redis.pipeline()
+        pipe.delete(key)
+        for post_id, posted_on in posts:
+            pipe.zadd(key, {post_id: posted_on.timestamp()})
+        pipe.expire(key, settings.TIMELINE_EXPIRE_SECONDS)
+        pipe.execute()
+
+    @staticmethod
+    def read(user, size, cursor=None, start=0):
+        '''
+            returns (entries, upper_score, has_next, length) of a timeline page, newest first.
+            1. entries is a list of (post_id, score).
+            2. cursor is (score, post_id) of the last entry of previous page, start is a rank offset used without cursor.
+            3. upper_score is the score bounding the page from above, None for the first page.
+        '''
+        key = TimeLineStore.__key(user.uid)
+        redis = get_redis_connection('default')
+
+        if not redis.exists(key):
+            TimeLineStore.build(user)
+
+        pipe = redis.pipeline(transaction=False)
+        pipe.zcard(key)
+        if cursor is not None:
+            upper_score, post_id = cursor
+            pipe.zcount(key, upper_score, upper_score)
+        else:
+            # reading one entry before the window to bound merged posts
+            pipe.zrevrange(key, max(start - 1, 0), start + size, withscores=True)
+        pipe.expire(key, settings.TIMELINE_EXPIRE_SECONDS)
+        length, result, _ = pipe.execute()
+
+        if cursor is not None:
+            # skipping entries sharing the cursor score which were already served
+            window = redis.zrevrangebyscore(key, upper_score, '-inf', start=0, num=size + 1 + result, withscores=True)
+            entries = [(member.decode('utf-8'), score) for member, score in window]
+            entries = [(member, score) for member, score in entries if score < upper_score or member < post_id]
+        else:
+            entries = [(member.decode('utf-8'), score) for member, score in result]
+            upper_score = None
+            if start > 0 and len(entries) > 0:
+                upper_score = entries.pop(0)[1]
+
+        has_next = len(entries) > size
+        return entries[:size], upper_score, has_next, length
@@ -42,9 +42,10 @@ class TimeLineFeedsV3(APIView):
 
     def get(self, request):
         try:
-            feeds, has_next = TimeLineService.generate_timeline_feeds_v3(
+            feeds, has_next, next_cursor = TimeLineService.generate_timeline_feeds_v3(
                 user=request.user,
                 page=request.query_params.get('page'),
+                cursor=request.query_params.get('cursor'),
             )
 
             # sending response
@@ -52,6 +53,7 @@ class TimeLineFeedsV3(APIView):
                 'message': 'Timeline Feeds',
                 'feeds': feeds,
                 'has_next': has_next,
+                'next_cursor': next_cursor,
             })
         except Exception as e:
             debug_print(e)
@@ -90,9 +92,10 @@ class ReelLineFeeds(APIView):
 
     def get(self, request):
         try:
-            feeds, has_next = ReelLineService.list_all(
+            feeds, has_next, next_cursor = ReelLineService.list_all(
                 auth_user=request.user,
                 page=request.query_params.get('page'),
+                cursor=request.query_params.get('cursor'),
             )
 
             # sending response
@@ -100,6 +103,7 @@ class ReelLineFeeds(APIView):
                 'message': 'Reel Feeds',
                 'feeds': feeds,
                 'has_next': has_next,
+                'next_cursor': next_cursor,
             })
         except Exception as e:
             debug_print(e)
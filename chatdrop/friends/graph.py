@@ -0,0 +1,106 @@
+from django.conf import settings
+from django_redis import get_redis_connection
+from .models import Friend
+from fanfollowing.models import Following
+from privacy.models import BlockedUser
+from search.index import UsernameIndex
+
+
+# Social Graph
+class SocialGraph:
+    '''
+        Adjacency of every user held in redis sets of uids, loaded lazily from database.
+        1. relations are friends, following, followers, blocked and blocked_by.
+        2. sets are dropped on every friend, follow and block change and rebuilt on next read.
+        3. a built set always holds an empty member, so users without relations are cached too.
+    '''
+
+    RELATIONS = {
+        'friends': (Friend, 'user', 'friend'),
+        'following': (Following, 'user', 'follow'),
+        'followers': (Following, 'follow', 'user'),
+        'blocked': (BlockedUser, 'user', 'blocked_user'),
+        'blocked_by': (BlockedUser, 'blocked_user', 'user'),
+    }
+
+    @staticmethod
+    def __key(uid, relation):
+        return f'{uid}:graph:{relation}'
+
+    @staticmethod
+    def __uid(user):
+        return user if isinstance(user, str) else user.uid
+
+    @staticmethod
+    def __build(uid, relation):
+        model, field, other = SocialGraph.RELATIONS[relation]
+        members = set(model.objects.filter(**{field: uid}).values_list(other, flat=True))
+
+        key = SocialGraph.__key(uid, relation)
+        pipe = get_redis_connection('default').pipeline()
+        pipe.delete(key)
+        pipe.sadd(key, '', *members)
+        pipe.expire(key, settings.GRAPH_EXPIRE_SECONDS)
+        pipe.execute()
+        return members
+
+    @staticmethod
+    def members(user, relation):
+        '''returns set of uids related to user.'''
+        uid = SocialGraph.__uid(user)
+        members = get_redis_connection('default').smembers(SocialGraph.__key(uid, relation))
+
+        if len(members) == 0:
+            return SocialGraph.__build(uid, relation)
+
+        members = {member.decode('utf-8') for member in members}
+        members.discard('')
+        return members
+
+    @staticmethod
+    def has_member(user, relation, other):
+        '''checks whether other is related to user in O(1).'''
+        return SocialGraph.__uid(other) in SocialGraph.has_members(user, relation, [other])
+
+    @staticmethod
+    def has_members(user, relation, others):
+        '''returns set of uids from others related to user, in a single round trip.'''
+        uid = SocialGraph.__uid(user)
+        others = [SocialGraph.__uid(other) for other in others]
+        key = SocialGraph.__key(uid, relation)
+
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        pipe.exists(key)
+        for other in others:
+            pipe.sismember(key, other)
+        exists, *found = pipe.execute()
+
+        if not exists:
+            members = SocialGraph.__build(uid, relation)
+            return {other for other in others if other in members}
+
+        return {other for other, is_member in zip(others, found) if is_member}
+
+    @staticmethod
+    def invalidate(user, *relations):
+        '''drops relation sets of user, all relations if none given.'''
+        uid = SocialGraph.__uid(user)
+        relations = relations if len(relations) > 0 else SocialGraph.RELATIONS.keys()
+        get_redis_connection('default').delete(*[SocialGraph.__key(uid, relation) for relation in relations])
+
+        # network usernames completed first are friends and followings
+        if 'friends' in relations or 'following' in relations:
+            UsernameIndex.invalidate_network(uid)
+
+    @staticmethod
+    def is_friend(user, friend):
+        return SocialGraph.has_member(user, 'friends', friend)
+
+    @staticmethod
+    def is_following(user, follow):
+        return SocialGraph.has_member(user, 'following', follow)
+
+    @staticmethod
+    def is_blocked(user, blocked_user):
+        '''checks whether user blocked the blocked_user.'''
+        return SocialGraph.has_member(user, 'blocked', blocked_user)
@@ -8,6 +8,11 @@ class Friend(models.Model):
     chat_room = models.CharField(max_length=36)
     relation_on = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'friend'], name='unique_friend'),
+        ]
+
 
 # Friend Request
 class FriendRequest(models.Model):
@@ -5,8 +5,12 @@ from account.services import UserService
 from .exceptions import FriendError
 from utils import generator
 from django.core.paginator import Paginator
-from privacy.models import BlockedUser
-from firebase_admin.firestore import firestore
+from django.db import transaction
+from utils.pagination import CursorPaginator
+from utils.counters import Counters
+from chat.store import ChatStore
+from feeds.timeline import TimeLineStore
+from .graph import SocialGraph
 
 
 # Friend Service
@@ -15,7 +19,7 @@ class FriendService:
 
     @staticmethod
     def is_friend_exists(user, friend):
-        return Friend.objects.filter(user=user, friend=friend).exists()
+        return SocialGraph.is_friend(user, friend)
     
     @staticmethod
     def get_friend(user, friend):
@@ -24,8 +28,15 @@ class FriendService:
     @staticmethod
     def create_friend(user, friend):
         chat_room = generator.generate_string(prefix='chatroom', n=15)
-        Friend.objects.create(user=user, friend=friend, chat_room=chat_room)
-        Friend.objects.create(user=friend, friend=user, chat_room=chat_room)
+        with transaction.atomic():
+            Friend.objects.create(user=user, friend=friend, chat_room=chat_room)
+            Friend.objects.create(user=friend, friend=user, chat_room=chat_room)
+        SocialGraph.invalidate(user, 'friends')
+        SocialGraph.invalidate(friend, 'friends')
+
+        # rebuilding timelines with posts of new friend
+        TimeLineStore.invalidate(user)
+        TimeLineStore.invalidate(friend)
         return chat_room
     
     @staticmethod
@@ -33,10 +44,18 @@ class FriendService:
         if FriendService.is_friend_exists(user, friend):
             FriendService.get_friend(user, friend).delete()
             FriendService.get_friend(friend, user).delete()
+            SocialGraph.invalidate(user, 'friends')
+            SocialGraph.invalidate(friend, 'friends')
 
-            store = firestore.Client()
-            store.collection('recents').document(user.uid).collection('chats').document(friend.uid).delete()
-            store.collection('recents').document(friend.uid).collection('chats').document(user.uid).delete()
+            # rebuilding timelines without posts of old friend
+            TimeLineStore.invalidate(user)
+            TimeLineStore.invalidate(friend)
+
+            # deleting recents chats of both users, queued after recents waiting to be written
+            ChatStore.commit([], recents=[
+                (ChatStore.recent_path(user.uid, friend.uid), None),
+                (ChatStore.recent_path(friend.uid, user.uid), None),
+            ])
 
 
     @staticmethod
@@ -49,13 +68,8 @@ class FriendService:
         FriendService.delete_friend(user=auth_user, friend=friend)
         
         # decrementing friend count
-        if auth_user.friend_count > 0:
-            auth_user.friend_count -= 1
-            auth_user.save()
-
-        if friend.friend_count > 0:
-            friend.friend_count -= 1
-            friend.save()
+        Counters.decr(auth_user, 'friend_count')
+        Counters.decr(friend, 'friend_count')
 
     @staticmethod
     def has_friendship(auth_user, friend_uid):
@@ -63,18 +77,20 @@ class FriendService:
         return FriendService.is_friend_exists(user=auth_user, friend=friend)
 
     @staticmethod
-    def list_all(auth_user, uid, page):
+    def list_all(auth_user, uid, page, cursor=None):
         user = UserService.get_user(uid)
-        friends = Friend.objects.filter(user=user)
+        friends = Friend.objects.filter(user=user).select_related('friend')
+
+        pagination = CursorPaginator(friends, ('-id',), 100)
+        paginated_friends = pagination.get_page(cursor=cursor, page=page)
 
-        pagination = Paginator(friends, 100)
-        paginated_friends = pagination.get_page(int(page))
+        blocked_by = SocialGraph.members(auth_user, 'blocked_by')
 
         friends_list = []
         for friend in paginated_friends.object_list:
             profile = friend.friend
 
-            if not BlockedUser.objects.filter(user=profile ,blocked_user=auth_user).exists():
+            if profile.uid not in blocked_by:
 
                 user_json = {
                     'uid': profile.uid,
@@ -90,7 +106,7 @@ class FriendService:
 
                 friends_list.append(user_json)
         
-        return friends_list
+        return friends_list, paginated_friends.has_next(), paginated_friends.next_cursor
     
 
 
@@ -158,17 +174,8 @@ class FriendRequestService:
         FriendService.create_friend(user=auth_user, friend=friend_req.sender)
 
         # incrementing friend count
-        if auth_user.friend_count == 0:
-            auth_user.friend_count = Friend.objects.filter(user=auth_user).count()
-        else:
-            auth_user.friend_count += 1
-        auth_user.save()
-
-        if friend_req.sender.friend_count == 0:
-            friend_req.sender.friend_count = Friend.objects.filter(user=friend_req.sender).count()
-        else:
-            friend_req.sender.friend_count += 1
-        friend_req.sender.save()
+        Counters.incr(auth_user, 'friend_count')
+        Counters.incr(friend_req.sender, 'friend_count')
 
         # deleting request
         friend_req.delete()
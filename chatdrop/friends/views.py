@@ -115,15 +115,18 @@ class ListFriend(APIView):
 
     def get(self, request):
         try:
-            friends = FriendService.list_all(
+            friends, has_next, next_cursor = FriendService.list_all(
                 auth_user=request.user,
                 uid=request.query_params.get('of'),
                 page=request.query_params.get('page'),
+                cursor=request.query_params.get('cursor'),
             )
             
             return Response.success({
                 'message': 'Friends List.',
-                'friends': friends
+                'friends': friends,
+                'has_next': has_next,
+                'next_cursor': next_cursor,
             })
         except:
             return Response.something_went_wrong()
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from notifier.outbox import NotificationOutbox
+from utils.debug import debug_print
+
+
+# Push notification dispatcher
+class Command(BaseCommand):
+    help = 'Sends queued push notifications in coalesced batches through FCM.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drain', action='store_true', help='exits once the outbox is empty.')
+        parser.add_argument('--interval', type=float, default=1, help='seconds to wait when outbox is empty.')
+
+    def handle(self, *args, **options):
+        count = 0
+        while True:
+            try:
+                taken = NotificationOutbox.dispatch()
+            except Exception as e:
+                # messages are kept for retry by outbox
+                debug_print(e)
+                taken = 0
+
+            count += taken
+            if taken == 0:
+                if options['drain']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'{count} notifications dispatched.'))
@@ -26,3 +26,8 @@ class Notification(models.Model):
     refer = models.CharField(default='', max_length=50, blank=True)
     read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['to_user', '-id']),
+        ]
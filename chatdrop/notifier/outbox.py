@@ -0,0 +1,211 @@
+import json
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from django_redis import get_redis_connection
+from firebase_admin import messaging, exceptions
+from account.models import User
+from account.auth_cache import AuthCache
+
+
+# Notification Outbox
+class NotificationOutbox:
+    '''
+        Queue of push notifications sent by dispatch_notifications command instead of request handlers.
+        1. likes and comments on the same content for a recipient are coalesced into one message per dispatch.
+        2. messages are sent in batches of up to 500 through settings.NOTIFICATION_SENDER.
+        3. unavailable or throttled messages are retried with exponential backoff.
+        4. unregistered tokens are removed from User.msg_token.
+        5. a taken batch is held in a processing list until it is sent or scheduled for retry,
+           a batch left by a crashed dispatch is sent again first, so messages are delivered at least once.
+    '''
+
+    KEY = 'notifier:outbox'
+    RETRY_KEY = 'notifier:outbox:retry'
+    PROCESSING_KEY = 'notifier:outbox:processing'
+    BATCH_SIZE = 500
+
+    COALESCED_TYPES = ('POST_LIKE', 'POST_COMMENT', 'POST_COMMENT_LIKE', 'REEL_LIKE', 'REEL_COMMENT', 'REEL_COMMENT_LIKE')
+    INVALID_TOKEN_ERRORS = (messaging.UnregisteredError, messaging.SenderIdMismatchError)
+    TRANSIENT_ERRORS = (messaging.QuotaExceededError, exceptions.UnavailableError, exceptions.InternalError, exceptions.DeadlineExceededError)
+
+    __sender = None
+
+    @staticmethod
+    def get_sender():
+        if NotificationOutbox.__sender is None:
+            NotificationOutbox.__sender = import_string(settings.NOTIFICATION_SENDER)()
+        return NotificationOutbox.__sender
+
+    @staticmethod
+    def set_sender(sender):
+        '''replaces sender of the process, None creates settings.NOTIFICATION_SENDER again on next use.'''
+        NotificationOutbox.__sender = sender
+
+    @staticmethod
+    def push(to_user, type, data, from_name='', title='', body='', refer='', alert=True):
+        '''
+            queues a message for to_user.
+            1. data is the fcm data payload, a dict of strings.
+            2. alert messages are shown as '{from_name} {body}' with title, others are data only.
+        '''
+        NotificationOutbox.push_many([(to_user, data)], type, from_name=from_name, title=title, body=body, refer=refer, alert=alert)
+
+    @staticmethod
+    def push_many(messages, type, from_name='', title='', body='', refer='', alert=True):
+        '''queues messages given as [(to_user, data)] of the same type in a single round trip.'''
+        entries = [
+            json.dumps({
+                'to': to_user.uid,
+                'type': type,
+                'refer': refer,
+                'from_name': from_name,
+                'title': title,
+                'body': body,
+                'alert': alert,
+                'data': data,
+                'count': 1,
+                'attempt': 0,
+            })
+            for to_user, data in messages
+        ]
+        if len(entries) > 0:
+            get_redis_connection('default').rpush(NotificationOutbox.KEY, *entries)
+
+    @staticmethod
+    def __take(size):
+        redis = get_redis_connection('default')
+
+        # resuming batch of an interrupted dispatch
+        entries = redis.lrange(NotificationOutbox.PROCESSING_KEY, 0, -1)
+        if len(entries) > 0:
+            return [json.loads(entry) for entry in entries]
+
+        # moving retries which are due back to outbox
+        now = time.time()
+        pipe = redis.pipeline()
+        pipe.zrangebyscore(NotificationOutbox.RETRY_KEY, 0, now)
+        pipe.zremrangebyscore(NotificationOutbox.RETRY_KEY, 0, now)
+        due, _ = pipe.execute()
+        if len(due) > 0:
+            redis.rpush(NotificationOutbox.KEY, *due)
+
+        pipe = redis.pipeline()
+        for _ in range(size):
+            pipe.lmove(NotificationOutbox.KEY, NotificationOutbox.PROCESSING_KEY, 'LEFT', 'RIGHT')
+        entries = [entry for entry in pipe.execute() if entry is not None]
+        return [json.loads(entry) for entry in entries]
+
+    @staticmethod
+    def __ack():
+        '''drops the batch being processed once it is sent or scheduled for retry.'''
+        get_redis_connection('default').delete(NotificationOutbox.PROCESSING_KEY)
+
+    @staticmethod
+    def __coalesce(entries):
+        coalesced = []
+        groups = {}
+        for entry in entries:
+            if entry['type'] not in NotificationOutbox.COALESCED_TYPES or entry['attempt'] > 0:
+                coalesced.append(entry)
+                continue
+
+            key = (entry['to'], entry['type'], entry['refer'])
+            if key in groups:
+                # keeping payload of latest message with count of all
+                entry['count'] += coalesced[groups[key]]['count']
+                coalesced[groups[key]] = entry
+            else:
+                groups[key] = len(coalesced)
+                coalesced.append(entry)
+
+        return coalesced
+
+    @staticmethod
+    def __message(entry, token):
+        if not entry['alert']:
+            return messaging.Message(token=token, data=entry['data'])
+
+        others = entry['count'] - 1
+        if others == 0:
+            body = f'{entry["from_name"]} {entry["body"]}'
+        else:
+            body = f'{entry["from_name"]} and {others} {"other" if others == 1 else "others"} {entry["body"]}'
+
+        return messaging.Message(
+            token=token,
+            notification=messaging.Notification(title=entry['title'], body=body),
+            data=entry['data'],
+            apns=messaging.APNSConfig(
+                payload=messaging.APNSPayload(
+                    messaging.Aps(sound="default")
+                )
+            ),
+            android=messaging.AndroidConfig(
+                notification=messaging.AndroidNotification(
+                    sound="default",
+                    priority="high"
+                )
+            )
+        )
+
+    @staticmethod
+    def __retry(entries):
+        if len(entries) == 0:
+            return
+
+        retries = {}
+        for entry in entries:
+            entry['attempt'] += 1
+            if entry['attempt'] < settings.NOTIFICATION_MAX_ATTEMPTS:
+                retries[json.dumps(entry)] = time.time() + settings.NOTIFICATION_RETRY_SECONDS * 2 ** (entry['attempt'] - 1)
+
+        if len(retries) > 0:
+            get_redis_connection('default').zadd(NotificationOutbox.RETRY_KEY, retries)
+
+    @staticmethod
+    def dispatch():
+        '''sends a batch of queued messages, returns number of messages taken from outbox.'''
+        entries = NotificationOutbox.__take(NotificationOutbox.BATCH_SIZE)
+        if len(entries) == 0:
+            return 0
+
+        messages = NotificationOutbox.__coalesce(entries)
+
+        # fetching current tokens of all recipients in one query
+        tokens = dict(
+            User.objects.filter(uid__in={message['to'] for message in messages})
+            .exclude(msg_token='').exclude(msg_token=None)
+            .values_list('uid', 'msg_token')
+        )
+        messages = [(message, tokens[message['to']]) for message in messages if message['to'] in tokens]
+        if len(messages) == 0:
+            NotificationOutbox.__ack()
+            return len(entries)
+
+        try:
+            results = NotificationOutbox.get_sender().send([NotificationOutbox.__message(message, token) for message, token in messages])
+        except Exception:
+            NotificationOutbox.__retry([message for message, _ in messages])
+            NotificationOutbox.__ack()
+            raise
+
+        invalid = set()
+        retries = []
+        for (message, token), error in zip(messages, results):
+            if error is None:
+                continue
+            if isinstance(error, NotificationOutbox.INVALID_TOKEN_ERRORS):
+                invalid.add((message['to'], token))
+            elif isinstance(error, NotificationOutbox.TRANSIENT_ERRORS):
+                retries.append(message)
+
+        # purging tokens only if user has not registered a new one meanwhile
+        for uid, token in invalid:
+            User.objects.filter(uid=uid, msg_token=token).update(msg_token='')
+            AuthCache.invalidate(uid)
+
+        NotificationOutbox.__retry(retries)
+        NotificationOutbox.__ack()
+        return len(entries)
@@ -0,0 +1,30 @@
+from firebase_admin import messaging
+
+
+class FirebaseSender:
+    '''Sends messages through Firebase Cloud Messaging.'''
+
+    def send(self, messages: list) -> list:
+        '''sends up to 500 messages in a single call, returns exception or None per message.'''
+        send = getattr(messaging, 'send_each', messaging.send_all)
+        response = send(messages)
+        return [None if res.success else res.exception for res in response.responses]
+
+
+
+class FakeSender:
+    '''Local sender for tests and development, keeps sent messages in memory.'''
+
+    def __init__(self):
+        self.sent = []
+        self.invalid_tokens = set()
+
+    def send(self, messages: list) -> list:
+        results = []
+        for message in messages:
+            if message.token in self.invalid_tokens:
+                results.append(messaging.UnregisteredError('Requested entity was not found.'))
+            else:
+                self.sent.append(message)
+                results.append(None)
+        return results
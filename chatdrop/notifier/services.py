@@ -2,12 +2,16 @@ import json
 import random
 import post.services as post_services
 import reel.services as reel_services
-import privacy.services as privacy_services
 
 from .models import Notification
+from post.models import Post
+from reel.models import Reel
+from privacy.viewer import ViewerContext
 from django.core.paginator import Paginator
-from firebase_admin import messaging
-from utils import time, debug
+from utils.pagination import CursorPaginator
+from .outbox import NotificationOutbox
+from chat.user_channel import UserChannel
+from utils import time
 from deprecated.sphinx import deprecated
 
 
@@ -36,17 +40,17 @@ class NotificationChannelService:
                 'time': None
             }
 
-            # sending notification throung FCM
+            # queuing notification for FCM
             if to_user.msg_token != '' and to_user.msg_token != None:
-                fcm_token = to_user.msg_token
-                fcm = messaging.MulticastMessage(
-                    [fcm_token],
+                NotificationOutbox.push(
+                    to_user=to_user,
+                    type=type,
                     data={
                         'content': json.dumps(content),
                         'extras': json.dumps(extras)
-                    }
+                    },
+                    alert=False,
                 )
-                messaging.send_multicast(fcm)
 
         elif type == 'NORMAL_CHAT_MESSAGE':
             # notification content
@@ -69,17 +73,17 @@ class NotificationChannelService:
                 'time': None
             }
 
-             # sending notification throung FCM
+            # queuing notification for FCM
             if to_user.msg_token != '' and to_user.msg_token != None:
-                fcm_token = to_user.msg_token
-                fcm = messaging.MulticastMessage(
-                    [fcm_token],
+                NotificationOutbox.push(
+                    to_user=to_user,
+                    type=type,
                     data={
                         'content': json.dumps(content),
                         'extras': json.dumps(extras)
                     },
+                    alert=False,
                 )
-                messaging.send_multicast(fcm)
 
         else:
             # creating notification in database
@@ -108,44 +112,84 @@ class NotificationChannelService:
                 'time': time_ago
             }
 
-            try:
-                # attaching post content in notification list if notification is related to post
-                if notification.type == 'POST' or notification.type == 'POST_LIKE' or notification.type == 'POST_COMMENT' or notification.type == 'POST_COMMENT_LIKE':
-                    if notification.refer is not None and notification.refer != '':
-                        post = post_services.PostService.get_post(id=notification.refer)
-                        content['refer_content'] = post_services.PostService.form_post_content_json_v2(post=post, auth_user=to_user)
-                
-                # attaching reel content in notification list if notification is related to reel
-                elif notification.type == 'REEL' or notification.type == 'REEL_LIKE' or notification.type == 'REEL_COMMENT' or notification.type == 'REEL_COMMENT_LIKE':
-                    if notification.refer is not None and notification.refer != '':
-                        reel = reel_services.ReelService.get_reel(id=notification.refer)
-                        content['refer_content'] = reel_services.ReelService.to_json(reel=reel, auth_user=to_user)
-            except Exception as e:
-                debug.debug_print(e)
-
-            # sending notification throung FCM
+            # delivering to user websockets
+            UserChannel.send(to_user.uid, 'NOTIFICATION', content)
+
+            # queuing notification for FCM, coalesced with similar notifications by dispatcher
             if to_user.msg_token != '' and to_user.msg_token != None:
-                fcm_token = to_user.msg_token
-                fcm = messaging.MulticastMessage(
-                    [fcm_token],
-                    notification=messaging.Notification(title=subject, body=f'{from_user.full_name} {notification.body}'),
+                NotificationOutbox.push(
+                    to_user=to_user,
+                    type=notification.type,
                     data={
                         'content': json.dumps(content),
                         'extras': json.dumps(extras)
                     },
-                    apns=messaging.APNSConfig(
-                        payload=messaging.APNSPayload(
-                            messaging.Aps(sound="default")
-                        )   
-                    ),
-                    android=messaging.AndroidConfig(
-                        notification=messaging.AndroidNotification(
-                            sound="default",
-                            priority="high"
-                        )
-                    )
+                    from_name=from_user.full_name,
+                    title=subject,
+                    body=notification.body,
+                    refer=notification.refer,
                 )
-                messaging.send_multicast(fcm)
+
+    @staticmethod
+    def push_notifications(from_user, to_users, subject, body, refer='', type='DEFAULT'):
+        '''creates the same notification for many users with a single insert and queues their messages together.'''
+        to_users = [to_user for to_user in to_users if to_user.uid != from_user.uid]
+        if len(to_users) == 0:
+            return
+
+        # creating notifications in database
+        Notification.objects.bulk_create([
+            Notification(from_user=from_user, to_user=to_user, subject=subject, body=body, refer=refer, type=type)
+            for to_user in to_users
+        ])
+
+        # reading ids back, bulk inserts do not return them on mysql
+        notifications = {}
+        for notification in Notification.objects.filter(from_user=from_user, to_user__in=to_users, type=type, refer=refer).order_by('id'):
+            notifications[notification.to_user_id] = notification
+
+        from_user_json = {
+            'uid': from_user.uid,
+            'name': from_user.full_name,
+            'photo': from_user.photo_cdn_url,
+            'username': from_user.username,
+            'gender': from_user.gender,
+            'message': from_user.message,
+        }
+
+        messages = []
+        for to_user in to_users:
+            if to_user.uid not in notifications:
+                continue
+
+            notification = notifications[to_user.uid]
+
+            # notification content
+            content = {
+                'id': notification.id,
+                'from_user': from_user_json,
+                'subject': notification.subject,
+                'body': notification.body,
+                'type': notification.type,
+                'refer': notification.refer,
+                'refer_content': None,
+                'is_read': notification.read,
+                'time': time.caltime_string(notification.created_at)
+            }
+
+            # delivering to user websockets
+            UserChannel.send(to_user.uid, 'NOTIFICATION', content)
+
+            if to_user.msg_token == '' or to_user.msg_token == None:
+                continue
+
+            messages.append((to_user, {
+                'content': json.dumps(content),
+                'extras': json.dumps({})
+            }))
+
+        # queuing notifications for FCM
+        NotificationOutbox.push_many(messages, type, from_name=from_user.full_name, title=subject, body=body, refer=refer)
 
 
 
@@ -153,6 +197,9 @@ class NotificationChannelService:
 # Notification Paginator
 class NotificationService:
     '''Notification Service for listing and reading notifications'''
+
+    POST_TYPES = ('POST', 'POST_LIKE', 'POST_COMMENT', 'POST_COMMENT_LIKE')
+    REEL_TYPES = ('REEL', 'REEL_LIKE', 'REEL_COMMENT', 'REEL_COMMENT_LIKE')
     
     @staticmethod
     def read_notification(auth_user, notification_id):
@@ -199,18 +246,43 @@ class NotificationService:
         return notification_json
     
     @staticmethod
-    def list_notification_v2(auth_user, page):
+    def __hydrate(viewer, notifications):
+        '''serializes distinct posts and reels referred by notifications visible to viewer, keyed by id.'''
+        post_ids = {notification.refer for notification in notifications if notification.type in NotificationService.POST_TYPES and notification.refer != ''}
+        reel_ids = {notification.refer for notification in notifications if notification.type in NotificationService.REEL_TYPES and notification.refer != ''}
+
+        posts = {}
+        if len(post_ids) > 0:
+            visible_posts = viewer.filter_visible(Post.objects.select_related('user').filter(id__in=post_ids))
+            posts = {post['id']: post for post in post_services.PostService.to_json_many(visible_posts, auth_user=viewer.viewer)}
+
+        reels = {}
+        if len(reel_ids) > 0:
+            visible_reels = viewer.filter_visible(Reel.objects.select_related('user').filter(id__in=reel_ids))
+            reels = {reel['id']: reel for reel in reel_services.ReelService.to_json_many(visible_reels, auth_user=viewer.viewer)}
+
+        return posts, reels
+
+    @staticmethod
+    def list_notification_v2(auth_user, page, cursor=None, expand=None):
+        '''refer_content of post and reel notifications is attached only if expand is refer.'''
+        viewer = ViewerContext(auth_user)
+
         # query notification and paginating
-        notifications_objects = Notification.objects.filter(to_user=auth_user).order_by('-id')
-        pagination = Paginator(notifications_objects, 50)
-        notifications = pagination.get_page(int(page))
+        notifications_objects = viewer.not_blocked(
+            Notification.objects.filter(to_user=auth_user).select_related('from_user'), 
+            field='from_user',
+        )
+        pagination = CursorPaginator(notifications_objects, ('-id',), 50)
+        notifications = pagination.get_page(cursor=cursor, page=page)
+
+        posts, reels = {}, {}
+        if expand == 'refer':
+            posts, reels = NotificationService.__hydrate(viewer, notifications.object_list)
 
         # paginating notification in json format
         notification_list = []
         for notification in notifications.object_list:
-            if privacy_services.BlockedUserService.is_blocked(user=notification.from_user, blocked_user=auth_user):
-                continue
-
             # fetching profile of the user
             user = notification.from_user
 
@@ -236,21 +308,12 @@ class NotificationService:
                 'time': time_ago
             }
 
-            try:
-                # attaching post content in notification list if notification is related to post
-                if notification.type == 'POST' or notification.type == 'POST_LIKE' or notification.type == 'POST_COMMENT' or notification.type == 'POST_COMMENT_LIKE':
-                    if notification.refer is not None and notification.refer != '':
-                        post = post_services.PostService.get_post(id=notification.refer)
-                        notification_json['refer_content'] = post_services.PostService.form_post_content_json_v2(post=post, auth_user=auth_user)
-                
-                # attaching reel content in notification list if notification is related to reel
-                elif notification.type == 'REEL' or notification.type == 'REEL_LIKE' or notification.type == 'REEL_COMMENT' or notification.type == 'REEL_COMMENT_LIKE':
-                    if notification.refer is not None and notification.refer != '':
-                        reel = reel_services.ReelService.get_reel(id=notification.refer)
-                        notification_json['refer_content'] = reel_services.ReelService.to_json(reel=reel, auth_user=auth_user)
-            except Exception as e:
-                debug.debug_print(e)
+            # attaching referred post or reel content if requested
+            if notification.type in NotificationService.POST_TYPES:
+                notification_json['refer_content'] = posts.get(notification.refer)
+            elif notification.type in NotificationService.REEL_TYPES:
+                notification_json['refer_content'] = reels.get(notification.refer)
 
             notification_list.append(notification_json)
         
-        return notification_list, notifications.has_next()
+        return notification_list, notifications.has_next(), notifications.next_cursor
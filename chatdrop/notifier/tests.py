@@ -1,3 +1,140 @@
-from django.test import TestCase
+import json
+import time
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django_redis import get_redis_connection
+from firebase_admin import exceptions
+from account.models import User
+from .outbox import NotificationOutbox
+from .senders import FakeSender
+
+
+class FlakySender(FakeSender):
+    '''fails the given number of next sends with a transient error.'''
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def send(self, messages: list) -> list:
+        if self.failures == 0:
+            return super().send(messages)
+        self.failures -= 1
+        return [exceptions.UnavailableError('Service unavailable.') for _ in messages]
+
+
+
+class BrokenSender(FakeSender):
+    def send(self, messages: list) -> list:
+        raise ConnectionError('FCM unreachable.')
+
+
+
+
+@override_settings(NOTIFICATION_MAX_ATTEMPTS=3, NOTIFICATION_RETRY_SECONDS=2)
+class NotificationOutboxTestCase(TestCase):
+    def setUp(self):
+        self.redis = get_redis_connection('default')
+        self.redis.delete(NotificationOutbox.KEY, NotificationOutbox.RETRY_KEY, NotificationOutbox.PROCESSING_KEY)
+
+        self.sender = FakeSender()
+        NotificationOutbox.set_sender(self.sender)
+
+        self.from_user = User.objects.create(uid='outbox-from', email='from@outbox.test', username='outbox_from', first_name='from')
+        self.to_user = User.objects.create(uid='outbox-to', email='to@outbox.test', username='outbox_to', msg_token='token-to')
+
+    def tearDown(self):
+        NotificationOutbox.set_sender(None)
+        self.redis.delete(NotificationOutbox.KEY, NotificationOutbox.RETRY_KEY, NotificationOutbox.PROCESSING_KEY)
+
+    def push_like(self, from_name, refer='post-1'):
+        NotificationOutbox.push(
+            to_user=self.to_user,
+            type='POST_LIKE',
+            data={'content': json.dumps({'from': from_name}), 'extras': json.dumps({})},
+            from_name=from_name,
+            title='New Like',
+            body='likes your post',
+            refer=refer,
+        )
+
+    def test_likes_of_same_content_are_coalesced(self):
+        self.push_like('amit')
+        self.push_like('bina')
+        self.push_like('chirag')
+
+        self.assertEqual(NotificationOutbox.dispatch(), 3)
+        self.assertEqual(len(self.sender.sent), 1)
+        self.assertEqual(self.sender.sent[0].notification.body, 'chirag and 2 others likes your post')
+        self.assertEqual(self.sender.sent[0].data['content'], json.dumps({'from': 'chirag'}))
+
+    def test_likes_of_different_content_are_not_coalesced(self):
+        self.push_like('amit', refer='post-1')
+        self.push_like('bina', refer='post-2')
+
+        NotificationOutbox.dispatch()
+        self.assertEqual(sorted(message.notification.body for message in self.sender.sent), ['amit likes your post', 'bina likes your post'])
+
+    def test_transient_errors_are_retried_with_backoff(self):
+        sender = FlakySender(failures=2)
+        NotificationOutbox.set_sender(sender)
+        self.push_like('amit')
+
+        # first retry is due after NOTIFICATION_RETRY_SECONDS
+        now = time.time()
+        NotificationOutbox.dispatch()
+        [(entry, due)] = self.redis.zrange(NotificationOutbox.RETRY_KEY, 0, -1, withscores=True)
+        self.assertEqual(json.loads(entry)['attempt'], 1)
+        self.assertAlmostEqual(due - now, 2, delta=1)
+
+        # second retry waits twice as long
+        self.redis.zadd(NotificationOutbox.RETRY_KEY, {entry: 0})
+        now = time.time()
+        NotificationOutbox.dispatch()
+        [(entry, due)] = self.redis.zrange(NotificationOutbox.RETRY_KEY, 0, -1, withscores=True)
+        self.assertEqual(json.loads(entry)['attempt'], 2)
+        self.assertAlmostEqual(due - now, 4, delta=1)
+
+        self.redis.zadd(NotificationOutbox.RETRY_KEY, {entry: 0})
+        NotificationOutbox.dispatch()
+        self.assertEqual(len(sender.sent), 1)
+        self.assertEqual(self.redis.zcard(NotificationOutbox.RETRY_KEY), 0)
+
+    def test_messages_are_dropped_after_max_attempts(self):
+        NotificationOutbox.set_sender(FlakySender(failures=3))
+        self.push_like('amit')
+
+        for _ in range(3):
+            NotificationOutbox.dispatch()
+            # making retries due right away
+            for entry in self.redis.zrange(NotificationOutbox.RETRY_KEY, 0, -1):
+                self.redis.zadd(NotificationOutbox.RETRY_KEY, {entry: 0})
+
+        self.assertEqual(self.redis.zcard(NotificationOutbox.RETRY_KEY), 0)
+        self.assertEqual(self.redis.llen(NotificationOutbox.KEY), 0)
+
+    def test_failed_send_is_scheduled_for_retry(self):
+        NotificationOutbox.set_sender(BrokenSender())
+        self.push_like('amit')
+
+        with self.assertRaises(ConnectionError):
+            NotificationOutbox.dispatch()
+        self.assertEqual(self.redis.llen(NotificationOutbox.PROCESSING_KEY), 0)
+        self.assertEqual(self.redis.zcard(NotificationOutbox.RETRY_KEY), 1)
+
+    def test_batch_of_interrupted_dispatch_is_sent_again(self):
+        self.push_like('amit')
+        self.redis.lmove(NotificationOutbox.KEY, NotificationOutbox.PROCESSING_KEY, 'LEFT', 'RIGHT')
+
+        self.assertEqual(NotificationOutbox.dispatch(), 1)
+        self.assertEqual(len(self.sender.sent), 1)
+        self.assertEqual(self.redis.llen(NotificationOutbox.PROCESSING_KEY), 0)
+
+    def test_invalid_tokens_are_purged(self):
+        self.sender.invalid_tokens.add('token-to')
+        self.push_like('amit')
+
+        NotificationOutbox.dispatch()
+        self.to_user.refresh_from_db()
+        self.assertEqual(self.to_user.msg_token, '')
+        self.assertEqual(self.redis.zcard(NotificationOutbox.RETRY_KEY), 0)
@@ -21,13 +21,19 @@ class UserNotificationsV2(APIView):
 
     def get(self, request):
         try:
-            notifications, has_next = NotificationService.list_notification_v2(auth_user=request.user, page=request.query_params.get('page'))
+            notifications, has_next, next_cursor = NotificationService.list_notification_v2(
+                auth_user=request.user, 
+                page=request.query_params.get('page'),
+                cursor=request.query_params.get('cursor'),
+                expand=request.query_params.get('expand'),
+            )
             
             # sending response
             return Response.success({
                 'message': 'notifications',
                 'notifications': notifications,
                 'has_next': has_next,
+                'next_cursor': next_cursor,
             })
         except:
             return Response.something_went_wrong()
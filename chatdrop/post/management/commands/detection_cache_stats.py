@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from utils.image_processing import ImageDetectionCache
+
+
+# Image detection cache metrics
+class Command(BaseCommand):
+    help = 'Shows hit and miss counts of image detection cache.'
+
+    def handle(self, *args, **options):
+        metrics = ImageDetectionCache.metrics()
+
+        self.stdout.write(f'exact hits: {metrics["exact_hits"]}')
+        self.stdout.write(f'near hits: {metrics["near_hits"]}')
+        self.stdout.write(f'misses: {metrics["misses"]}')
+        self.stdout.write(self.style.SUCCESS(f'hit rate: {metrics["hit_rate"] * 100:.2f}%'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.core.exceptions import ObjectDoesNotExist
+from django.apps import apps
+from utils.derivatives import ImageDerivatives, ImageDerivativeQueue
+from utils.debug import debug_print
+
+
+# Background image derivatives worker
+class Command(BaseCommand):
+    help = 'Generates resized variants and placeholders of uploaded images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drain', action='store_true', help='exits once the queue is empty.')
+        parser.add_argument('--backfill', action='store_true', help='queues all images without variants before starting.')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            for model, (image_field, variants_field, _) in ImageDerivatives.FIELDS.items():
+                instances = apps.get_model(model).objects.filter(**{variants_field: []}).exclude(**{image_field: ''})
+                for instance in instances.only('id').iterator():
+                    ImageDerivativeQueue.push(instance)
+
+        count = 0
+        while True:
+            job = ImageDerivativeQueue.pop()
+            if job is None:
+                if options['drain']:
+                    break
+                continue
+
+            model, id = job
+            try:
+                ImageDerivatives.process(model, id)
+                count += 1
+            except ObjectDoesNotExist:
+                pass
+            except Exception as e:
+                # skipping files which are not decodable images, e.g. text stories without photo
+                debug_print(e)
+
+        self.stdout.write(self.style.SUCCESS(f'{count} images processed.'))
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from post.models import Post
+from reel.models import Reel
+from post.services import PostService
+from reel.services import ReelService
+from utils.moderation import ModerationQueue
+from utils.debug import debug_print
+
+
+# Background media moderation worker
+class Command(BaseCommand):
+    help = 'Moderates media of pending posts and reels, publishing safe ones and removing the rest.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drain', action='store_true', help='exits once the queue is empty.')
+        parser.add_argument('--requeue', action='store_true', help='queues all pending posts and reels again before starting.')
+
+    def handle(self, *args, **options):
+        if options['requeue']:
+            for post_id in Post.objects.filter(moderation='PENDING').values_list('id', flat=True):
+                ModerationQueue.push('POST', post_id)
+            for reel_id in Reel.objects.filter(moderation='PENDING').values_list('id', flat=True):
+                ModerationQueue.push('REEL', reel_id)
+
+        count = 0
+        while True:
+            job = ModerationQueue.pop()
+            if job is None:
+                if options['drain']:
+                    break
+                continue
+
+            type, id, attempts = job
+            try:
+                if type == 'POST':
+                    PostService.moderate_post(post_id=id)
+                elif type == 'REEL':
+                    ReelService.moderate_reel(reel_id=id)
+                count += 1
+            except (Post.DoesNotExist, Reel.DoesNotExist):
+                pass
+            except Exception as e:
+                # keeping job for retry, detection backend may be unavailable
+                debug_print(e)
+                if not ModerationQueue.retry(type, id, attempts):
+                    self.stderr.write(f'{type} {id} moved to dead letter queue after {attempts + 1} attempts.')
+                time.sleep(1)
+
+        self.stdout.write(self.style.SUCCESS(f'{count} media moderated.'))
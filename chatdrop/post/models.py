@@ -18,6 +18,16 @@ class Post(models.Model):
     likes_count = models.IntegerField(default=0)
     comments_count = models.IntegerField(default=0)
     posted_on = models.DateTimeField(default=None)
+    moderation = models.CharField(default='APPROVED', choices=(('PENDING', 'Pending'), ('APPROVED', 'Approved')), max_length=10)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-posted_on']),
+        ]
+
+    @property
+    def is_approved(self):
+        return self.moderation == 'APPROVED'
 
     @property
     def is_public(self):
@@ -39,6 +49,11 @@ class PostHashTag(models.Model):
     type = models.CharField(default='USER', choices=(('USER', 'User'), ('TAG', 'Tag'), ('URL', 'Url')), max_length=10)
     tag = models.CharField(default='', blank=True, max_length=100)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['tag']),
+        ]
+
 
 
 # Post Photo
@@ -50,6 +65,8 @@ class PostPhoto(models.Model):
     photo = models.ImageField(upload_to=_upload_to_path)
     labels = models.JSONField(default=list)
     aspect_ratio = models.FloatField(default=1)
+    variants = models.JSONField(default=list, blank=True)
+    placeholder = models.TextField(default='', blank=True)
 
     @property
     def cdn_url(self):
@@ -88,6 +105,11 @@ class PostLike(models.Model):
         ('LIKE', 'Like'), ('LOVE', 'Love'), ('HAHA', 'Haha'), ('YAY', 'Yay'), ('WOW', 'Wow'), ('SAD', 'Sad'), ('ANGRY', 'Angry')
     ), max_length=10)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'by'], name='unique_post_like'),
+        ]
+
 
 
 # Post Comment
@@ -4,12 +4,25 @@ import privacy.services as privacy_services
 
 from .models import Post, PostPhoto, PostVideo, PostHashTag, PostComment, PostLike, PostCommentLike
 from utils import generator, time
+from django.conf import settings
 from django.utils import timezone
+from django.db import transaction
 from account.services import UserService
 from .exceptions import PostError, CommentError, LikeError
 from django.core.paginator import Paginator
+from django.db.models import prefetch_related_objects
+from utils.pagination import CursorPaginator
+from utils.counters import Counters
 from utils.image_processing import ImageDetection, InvalidImageError
+from utils.moderation import ModerationQueue
+from utils.derivatives import ImageDerivatives, ImageDerivativeQueue
 from deprecated.sphinx import deprecated
+from feeds.timeline import TimeLineStore
+from search.hashtags import HashTagIndex
+from search.tags import TagParser
+from privacy.viewer import ViewerContext
+from friends.graph import SocialGraph
+from account.models import User
 
 
 # Post Paginator
@@ -60,7 +73,8 @@ class PostService:
 
             aspect_ratios = data.get('aspect_ratios')
             for i, photo in enumerate(data.get('photos')):
-                PostPhoto.objects.create(post=post, photo=photo, aspect_ratio=aspect_ratios[i])
+                post_photo = PostPhoto.objects.create(post=post, photo=photo, aspect_ratio=aspect_ratios[i])
+                ImageDerivativeQueue.push(post_photo)
 
         elif content_type == 'VIDEO':
             post = Post.objects.create(
@@ -87,7 +101,8 @@ class PostService:
 
             aspect_ratios = data.get('aspect_ratios')
             for i, photo in enumerate(data.get('photos')):
-                PostPhoto.objects.create(post=post, photo=photo, aspect_ratio=aspect_ratios[i])
+                post_photo = PostPhoto.objects.create(post=post, photo=photo, aspect_ratio=aspect_ratios[i])
+                ImageDerivativeQueue.push(post_photo)
 
         elif content_type == 'TEXT_VIDEO':
             post = Post.objects.create(
@@ -103,28 +118,45 @@ class PostService:
             PostVideo.objects.create(post=post, video=data.get('video'), aspect_ratio=data.get('aspect_ratio'))
 
         if post is not None:
-            user_tags = data.get('hashtags').split(',')
-            for hashtag in user_tags:
-                hashtag = str(hashtag)
-                if hashtag.startswith('@'):
-                    try:
-                        user = UserService.get_user_by_username(username=hashtag[1:])
-                        PostHashTag.objects.create(post=post, type='USER', tag=f'@{user.username}::{user.uid}')
-                    except:
-                        pass
-                elif hashtag.startswith('#'):
-                    PostHashTag.objects.create(post=post, type='TAG', tag=hashtag[1:])
-                elif hashtag.startswith('https://') or hashtag.startswith('http://'):
-                    PostHashTag.objects.create(post=post, type='URL', tag=hashtag)
-            
-            auth_user.post_count += 1
-            auth_user.save()
+            tagged = TagParser.parse(data.get('hashtags'))
+            TagParser.save(PostHashTag, 'post', post, tagged)
+            HashTagIndex.add_post(post, tagged.tags)
+            Counters.incr(auth_user, 'post_count')
+
+            # fanning out post to timelines
+            TimeLineStore.push(post, mentioned=[user.uid for user in tagged.mentioned])
 
         return post
     
+    @staticmethod
+    def __detect_images(images, message):
+        '''returns labels of every image, raises InvalidImageError if any image is unsafe.'''
+        predictions = ImageDetection.process_many(images)
+        for prediction in predictions:
+            if not prediction.is_safe:
+                raise InvalidImageError(message)
+        return [prediction.labels for prediction in predictions]
+
+    @staticmethod
+    def __notify_mentioned(post, mentioned):
+        '''notifies mentioned users of a published post in a single batch, leaving out users who blocked the author.'''
+        if len(mentioned) == 0:
+            return
+
+        blocked_by = SocialGraph.has_members(post.user, 'blocked_by', mentioned)
+        notifier_services.NotificationChannelService.push_notifications(
+            from_user=post.user,
+            to_users=[user for user in mentioned if user.uid not in blocked_by],
+            refer=post.id,
+            subject='Mention',
+            body='mentioned you in a post.',
+            type='POST'
+        )
+
     @staticmethod
     def add_post_v3(auth_user, content_type, data):
-        post = None
+        if content_type not in ('TEXT', 'PHOTO', 'VIDEO', 'TEXT_PHOTO', 'TEXT_VIDEO'):
+            return None
 
         contains_hashtags = False
         if data.get('hashtags') != '':
@@ -132,134 +164,64 @@ class PostService:
         
         posted_on = timezone.now()
 
+        # media posts are published pending and moderated by moderate_media command when in background
+        moderation = 'APPROVED'
+        if content_type != 'TEXT' and settings.IMAGE_DETECTION_IN_BACKGROUND:
+            moderation = 'PENDING'
 
-        if content_type == 'TEXT':
-            post = Post.objects.create(
-                id=generator.generate_identity(), 
-                user=auth_user,
-                text=data.get('text'),
-                content_type=content_type,
-                contains_hashtags=contains_hashtags,
-                visibility=data.get('visibility'),
-                posted_on=posted_on,
-            )
-
-        elif content_type == 'PHOTO':
-            labels = []
-            for photo in data.get('photos'):
-                prediction = ImageDetection.process(image_bytes=photo.file)
-                labels.append(prediction.labels)
-                if not prediction.is_safe:
-                    raise InvalidImageError('Nude Image found')
-            
-            if len(labels) != len(data.get('photos')) or len(labels) != len(data.get('aspect_ratios')):
+        # detecting media before opening transaction
+        labels = []
+        if content_type in ('PHOTO', 'TEXT_PHOTO'):
+            if len(data.get('photos')) != len(data.get('aspect_ratios')):
                 raise PostError('something went wrong in posting.')
 
+            labels = [[] for _ in data.get('photos')]
+            if moderation == 'APPROVED':
+                labels = PostService.__detect_images([photo.file for photo in data.get('photos')], 'Nude Image found')
 
-            post = Post.objects.create(
-                id=generator.generate_identity(), 
-                user=auth_user, 
-                content_type=content_type, 
-                contains_hashtags=contains_hashtags,
-                visibility=data.get('visibility'),
-                posted_on=posted_on,
-            )
-
-            aspect_ratios = data.get('aspect_ratios')
-            for i, photo in enumerate(data.get('photos')):
-                PostPhoto.objects.create(post=post, photo=photo, labels=labels[i], aspect_ratio=aspect_ratios[i])
-
-        elif content_type == 'VIDEO':
-            thumbnail = data.get('thumbnail')
-            prediction = ImageDetection.process(image_bytes=thumbnail.file)
-            labels = prediction.labels
-            if not prediction.is_safe:
-                raise InvalidImageError('Nude Video found')
-            
-            post = Post.objects.create(
-                id=generator.generate_identity(), 
-                user=auth_user, 
-                content_type=content_type, 
-                contains_hashtags=contains_hashtags,
-                visibility=data.get('visibility'),
-                posted_on=posted_on,
-            )
-
-            PostVideo.objects.create(
-                post=post, 
-                video=data.get('video'), 
-                thumbnail=data.get('thumbnail'), 
-                labels=labels, 
-                aspect_ratio=data.get('aspect_ratio'),
-            )
-
-        elif content_type == 'TEXT_PHOTO':
-            labels = []
-            for photo in data.get('photos'):
-                prediction = ImageDetection.process(image_bytes=photo.file)
-                labels.append(prediction.labels)
-                if not prediction.is_safe:
-                    raise InvalidImageError('Nude Image found')
-            
-            if len(labels) != len(data.get('photos')) or len(labels) != len(data.get('aspect_ratios')):
-                raise PostError('something went wrong in posting.')
-            
-            post = Post.objects.create(
-                id=generator.generate_identity(), 
-                user=auth_user, 
-                text=data.get('text'), 
-                content_type=content_type, 
-                contains_hashtags=contains_hashtags,
-                visibility=data.get('visibility'),
-                posted_on=posted_on,
-            )
+        elif content_type in ('VIDEO', 'TEXT_VIDEO'):
+            if moderation == 'APPROVED':
+                labels = PostService.__detect_images([data.get('thumbnail').file], 'Nude Video found')[0]
 
-            aspect_ratios = data.get('aspect_ratios')
-            for i, photo in enumerate(data.get('photos')):
-                PostPhoto.objects.create(post=post, photo=photo, labels=labels[i], aspect_ratio=aspect_ratios[i])
+        tagged = TagParser.parse(data.get('hashtags'))
 
-        elif content_type == 'TEXT_VIDEO':
-            thumbnail = data.get('thumbnail')
-            prediction = ImageDetection.process(image_bytes=thumbnail.file)
-            labels = prediction.labels
-            if not prediction.is_safe:
-                raise InvalidImageError('Nude Video found')
-            
+        with transaction.atomic():
             post = Post.objects.create(
                 id=generator.generate_identity(), 
                 user=auth_user, 
-                text=data.get('text'), 
+                text=data.get('text') if content_type in ('TEXT', 'TEXT_PHOTO', 'TEXT_VIDEO') else '', 
                 content_type=content_type, 
                 contains_hashtags=contains_hashtags,
                 visibility=data.get('visibility'),
                 posted_on=posted_on,
+                moderation=moderation,
             )
 
-            PostVideo.objects.create(
-                post=post, 
-                video=data.get('video'), 
-                thumbnail=data.get('thumbnail'), 
-                labels=labels, 
-                aspect_ratio=data.get('aspect_ratio'),
-            )
-
-        if post is not None:
-            user_tags = data.get('hashtags').split(',')
-            for hashtag in user_tags:
-                hashtag = str(hashtag)
-                if hashtag.startswith('@'):
-                    try:
-                        user = UserService.get_user_by_username(username=hashtag[1:])
-                        PostHashTag.objects.create(post=post, type='USER', tag=f'@{user.username}::{user.uid}')
-                    except:
-                        pass
-                elif hashtag.startswith('#'):
-                    PostHashTag.objects.create(post=post, type='TAG', tag=hashtag[1:])
-                elif hashtag.startswith('https://') or hashtag.startswith('http://'):
-                    PostHashTag.objects.create(post=post, type='URL', tag=hashtag)
-            
-            auth_user.post_count += 1
-            auth_user.save()
+            if content_type in ('PHOTO', 'TEXT_PHOTO'):
+                aspect_ratios = data.get('aspect_ratios')
+                for i, photo in enumerate(data.get('photos')):
+                    post_photo = PostPhoto.objects.create(post=post, photo=photo, labels=labels[i], aspect_ratio=aspect_ratios[i])
+                    transaction.on_commit(lambda post_photo=post_photo: ImageDerivativeQueue.push(post_photo))
+
+            elif content_type in ('VIDEO', 'TEXT_VIDEO'):
+                PostVideo.objects.create(
+                    post=post, 
+                    video=data.get('video'), 
+                    thumbnail=data.get('thumbnail'), 
+                    labels=labels, 
+                    aspect_ratio=data.get('aspect_ratio'),
+                )
+
+            TagParser.save(PostHashTag, 'post', post, tagged)
+            HashTagIndex.add_post(post, tagged.tags)
+            transaction.on_commit(lambda: Counters.incr(auth_user, 'post_count'))
+
+        if post.is_approved:
+            # fanning out post to timelines
+            TimeLineStore.push(post, mentioned=[user.uid for user in tagged.mentioned])
+            PostService.__notify_mentioned(post, tagged.mentioned)
+        else:
+            ModerationQueue.push('POST', post.id)
 
         return post
 
@@ -270,8 +232,14 @@ class PostService:
         if post.user.uid != auth_user.uid:
             raise PostError('No permission to delete post.')
         
+        old_visibility = post.visibility
         post.visibility = visibility
-        post.save()
+        post.save(update_fields=['visibility'])
+
+        # moving post from timelines of old audience to timelines of new audience
+        if post.is_approved:
+            TimeLineStore.remove(post, visibility=old_visibility)
+            TimeLineStore.push(post)
 
 
     @staticmethod
@@ -281,10 +249,46 @@ class PostService:
         if post.user.uid != auth_user.uid:
             raise PostError('No permission to delete post.')
         
+        TimeLineStore.remove(post)
+        HashTagIndex.remove_post(post)
         post.delete()
 
-        auth_user.post_count -= 1
-        auth_user.save()
+        Counters.decr(auth_user, 'post_count')
+
+    @staticmethod
+    def moderate_post(post_id):
+        '''moderates media of a pending post, publishes it if safe otherwise removes it.'''
+        post = Post.objects.select_related('user').get(id=post_id)
+
+        if post.is_approved:
+            return
+
+        photos = list(PostPhoto.objects.filter(post=post))
+        videos = list(PostVideo.objects.filter(post=post).exclude(thumbnail__isnull=True).exclude(thumbnail=''))
+
+        images = [photo.photo.open('rb') for photo in photos] + [video.thumbnail.open('rb') for video in videos]
+        try:
+            predictions = ImageDetection.process_many(images)
+        finally:
+            for image in images:
+                image.close()
+
+        if not all(prediction.is_safe for prediction in predictions):
+            PostService.delete_post(auth_user=post.user, post_id=post.id)
+            return
+
+        for media, prediction in zip(photos + videos, predictions):
+            media.labels = prediction.labels
+            media.save(update_fields=['labels'])
+
+        post.moderation = 'APPROVED'
+        post.save(update_fields=['moderation'])
+        HashTagIndex.approve_post(post)
+
+        # fanning out post to timelines with mentioned users
+        mentioned = [tag.split('::')[-1] for tag in PostHashTag.objects.filter(post=post, type='USER').values_list('tag', flat=True)]
+        TimeLineStore.push(post, mentioned=mentioned)
+        PostService.__notify_mentioned(post, list(User.objects.filter(uid__in=mentioned)))
 
     @deprecated(version='2', reason='This method is deprecated, must use to_json_v3 method')
     @staticmethod
@@ -371,87 +375,94 @@ class PostService:
     
     @staticmethod
     def to_json_v3(post, auth_user):
-        # Profile
-        profile = post.user
-
-        # calculating ago time
-        time_ago = time.caltime_string(post.posted_on)
-
-        post_json = {
-            'id': post.id,
-            'user': {
-                'uid': profile.uid,
-                'name': profile.full_name,
-                'photo': profile.photo_cdn_url,
-                'username': profile.username,
-                'gender': profile.gender,
-                'message': profile.message,
-            },
-            'type': post.post_type,
-            'visibility': post.visibility,
-            'content_type': post.content_type,
-            'posted_on': time_ago,
-            'contains_hashtags': post.contains_hashtags,
-            'likes_count': post.likes_count,
-            'comments_count': post.comments_count,
-            'hashtags': [],
-            'text': None,
-            'photos': [],
-            'video': None,
-            'liked': None,
-            'auth_user': {
-                'uid': auth_user.uid,
-                'name': auth_user.full_name,
-                'photo': auth_user.photo_cdn_url,
-                'username': auth_user.username,
-                'gender': auth_user.gender,
-                'message': auth_user.message,
-            }
+        return PostService.to_json_many([post], auth_user)[0]
+    
+    @staticmethod
+    def to_json_many(posts, auth_user):
+        '''serializes posts in the same format as to_json_v3 with a constant number of queries.'''
+        posts = list(posts)
+        prefetch_related_objects(posts, 'user', 'posthashtag_set', 'postphoto_set', 'postvideo_set')
+        Counters.merge(posts)
+
+        # likes of auth user on all posts in one query
+        likes = dict(PostLike.objects.filter(post__in=[post.id for post in posts], by=auth_user).values_list('post', 'type'))
+
+        auth_user_json = {
+            'uid': auth_user.uid,
+            'name': auth_user.full_name,
+            'photo': auth_user.photo_cdn_url,
+            'username': auth_user.username,
+            'gender': auth_user.gender,
+            'message': auth_user.message,
         }
 
-        try:
-            like = PostLike.objects.get(post=post, by=auth_user)
-            post_json['liked'] = like.type
-        except:
-            pass
+        post_list = []
+        for post in posts:
+            # Profile
+            profile = post.user
 
-        if post.contains_hashtags:
-            hashtags = PostHashTag.objects.filter(post=post)
-            
-            post_json['hashtags'] = []
+            # calculating ago time
+            time_ago = time.caltime_string(post.posted_on)
 
-            for tag in hashtags:
-                post_json['hashtags'].append({
-                    'type': tag.type,
-                    'tag': tag.tag
-                })
-            
-        if post.content_type == 'TEXT' or post.content_type == 'TEXT_PHOTO' or post.content_type == 'TEXT_VIDEO':
-            post_json['text'] = post.text
-            
-        if post.content_type == 'PHOTO' or post.content_type == 'TEXT_PHOTO':
-            photos = PostPhoto.objects.filter(post=post)
-            
-            post_json['photos'] = []
+            post_json = {
+                'id': post.id,
+                'user': {
+                    'uid': profile.uid,
+                    'name': profile.full_name,
+                    'photo': profile.photo_cdn_url,
+                    'username': profile.username,
+                    'gender': profile.gender,
+                    'message': profile.message,
+                },
+                'type': post.post_type,
+                'visibility': post.visibility,
+                'content_type': post.content_type,
+                'posted_on': time_ago,
+                'contains_hashtags': post.contains_hashtags,
+                'likes_count': post.likes_count,
+                'comments_count': post.comments_count,
+                'hashtags': [],
+                'text': None,
+                'photos': [],
+                'video': None,
+                'liked': likes.get(post.id),
+                'auth_user': dict(auth_user_json),
+            }
 
-            for photo in photos:
-                post_json['photos'].append({
-                    'url': photo.cdn_url,
-                    'aspect_ratio': photo.aspect_ratio,
-                    'labels': photo.labels,
-                })
+            if post.contains_hashtags:
+                for tag in post.posthashtag_set.all():
+                    post_json['hashtags'].append({
+                        'type': tag.type,
+                        'tag': tag.tag
+                    })
+                
+            if post.content_type == 'TEXT' or post.content_type == 'TEXT_PHOTO' or post.content_type == 'TEXT_VIDEO':
+                post_json['text'] = post.text
+                
+            if post.content_type == 'PHOTO' or post.content_type == 'TEXT_PHOTO':
+                for photo in post.postphoto_set.all():
+                    post_json['photos'].append({
+                        'url': photo.cdn_url,
+                        'aspect_ratio': photo.aspect_ratio,
+                        'labels': photo.labels,
+                        'variants': ImageDerivatives.to_json(photo.variants),
+                        'placeholder': photo.placeholder,
+                    })
+
+            if post.content_type == 'VIDEO' or post.content_type == 'TEXT_VIDEO':
+                videos = post.postvideo_set.all()
+                if len(videos) > 0:
+                    video = videos[0]
+                    post_json['video'] = {
+                        'url': video.cdn_url,
+                        'aspect_ratio': video.aspect_ratio,
+                        'thumbnail': video.cdn_thumbnail_url,
+                        'labels': video.labels,
+                    }
 
-        if post.content_type == 'VIDEO' or post.content_type == 'TEXT_VIDEO':
-            video = PostVideo.objects.get(post=post)
-            
-            post_json['video'] = {
-                'url': video.cdn_url,
-                'aspect_ratio': video.aspect_ratio,
-                'thumbnail': video.cdn_thumbnail_url,
-                'labels': video.labels,
-            }
+            post_list.append(post_json)
 
-        return post_json
+        return post_list
     
     @deprecated(version='1', reason='This method is deprecated, must use v2.')
     @staticmethod
@@ -476,16 +487,9 @@ class PostService:
     def view_post_v2(auth_user, post_id):
         post = PostService.get_post(id=post_id)
 
-        if privacy_services.BlockedUserService.is_blocked(user=post.user, blocked_user=auth_user):
+        if not ViewerContext(auth_user).can_view(post):
             return None
 
-        if post.is_private and auth_user.uid != post.user.uid:
-            return None
-
-        if post.is_only_friends and auth_user.uid != post.user.uid:
-            if not friend_services.FriendService.is_friend_exists(user=auth_user, friend=post.user):
-                return None
-
         post_json = PostService.to_json_v3(post=post, auth_user=auth_user)
         return post_json
     
@@ -518,30 +522,17 @@ class PostService:
         return post_list
 
     @staticmethod
-    def list_all_v3(auth_user, uid, page):
+    def list_all_v3(auth_user, uid, page, cursor=None):
         user = UserService.get_user(uid)
 
-        posts = Post.objects.filter(user=user).order_by('-posted_on')
+        posts = ViewerContext(auth_user).visible(Post.objects.filter(user=user).select_related('user'))
 
-        pagination = Paginator(posts, 100)
-        paginated_posts = pagination.get_page(int(page))
+        pagination = CursorPaginator(posts, ('-posted_on', '-id'), 100)
+        paginated_posts = pagination.get_page(cursor=cursor, page=page)
         
-        post_list = []
-        for post in paginated_posts.object_list:
-            if privacy_services.BlockedUserService.is_blocked(user=post.user, blocked_user=auth_user):
-                continue
-            
-            if post.is_private and auth_user.uid != user.uid:
-                continue
-
-            if post.is_only_friends and auth_user.uid != user.uid:
-                if not friend_services.FriendService.is_friend_exists(user=auth_user, friend=user):
-                    continue
-
-            post_json = PostService.to_json_v3(post=post, auth_user=auth_user)
-            post_list.append(post_json)
+        post_list = PostService.to_json_many(paginated_posts.object_list, auth_user=auth_user)
         
-        return post_list, paginated_posts.has_next()
+        return post_list, paginated_posts.has_next(), paginated_posts.next_cursor
     
 
 # Comment Paginator
@@ -570,8 +561,7 @@ class CommentService:
         )
 
         # upgrading comment counts
-        post.comments_count += 1
-        post.save()
+        Counters.incr(post, 'comments_count')
 
         if post.user.uid != auth_user.uid:
             # sending user a notification
@@ -615,21 +605,18 @@ class CommentService:
             comment.delete()
 
             # downgrading comment counts
-            post.comments_count -= 1
-            post.save()
+            Counters.decr(post, 'comments_count')
         else:
             raise CommentError('No permission for deleting comment')
 
     @staticmethod
     def list_all(user, post_id):
         post = Post.objects.get(id=post_id)
-        comments = PostComment.objects.filter(post=post)
+        comments = ViewerContext(user).not_blocked(PostComment.objects.filter(post=post).select_related('by'), field='by')
+        comments = Counters.merge(list(comments))
 
         comments_list = []
         for comment in comments:
-            if privacy_services.BlockedUserService.is_blocked(user=comment.by, blocked_user=user):
-                continue
-
             # Profile
             profile = comment.by
 
@@ -675,20 +662,12 @@ class LikeService:
     def like_post(auth_user, post_id, data):
         post = PostService.get_post(post_id)
 
-        try:
-            like = PostLike.objects.get(post=post, by=auth_user)
-            like.type = data.get('type')
-            like.save()
-        except:
-            like = PostLike.objects.create(
-                post=post, 
-                by=auth_user, 
-                type=data.get('type'),
-            )
+        # unique (post, by) keeps a single like per user even on concurrent requests
+        like, created = PostLike.objects.update_or_create(post=post, by=auth_user, defaults={'type': data.get('type')})
         
+        if created:
             # upgrading like counts
-            post.likes_count += 1
-            post.save()
+            Counters.incr(post, 'likes_count')
         
         if post.user.uid != auth_user.uid:
             # sending user a notification
@@ -713,8 +692,7 @@ class LikeService:
         
         like.delete()
 
-        post.likes_count -= 1
-        post.save()
+        Counters.decr(post, 'likes_count')
 
     @staticmethod
     def list_all(post_id):
@@ -748,7 +726,7 @@ class CommentLikeService:
         try:
             like = PostCommentLike.objects.get(comment=comment, by=auth_user)
             like.type = data.get('type')
-            like.save()
+            like.save(update_fields=['type'])
         except:
             like = PostCommentLike.objects.create(
                 comment=comment, 
@@ -757,8 +735,7 @@ class CommentLikeService:
             )
         
             # upgrading like counts
-            comment.likes_count += 1
-            comment.save()
+            Counters.incr(comment, 'likes_count')
         
         if comment.by.uid != auth_user.uid:
             # sending user a notification
@@ -783,8 +760,7 @@ class CommentLikeService:
         
         like.delete()
 
-        comment.likes_count -= 1
-        comment.save()
+        Counters.decr(comment, 'likes_count')
 
     @staticmethod
     def list_all(comment_id):
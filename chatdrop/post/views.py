@@ -220,16 +220,18 @@ class ListPostV3(APIView):
 
     def get(self, request):
         try: 
-            posts, has_next = PostService.list_all_v3(
+            posts, has_next, next_cursor = PostService.list_all_v3(
                 auth_user=request.user,
                 uid=request.query_params.get('of'),
                 page=request.query_params.get('page'),
+                cursor=request.query_params.get('cursor'),
             )
             
             return Response.success({
                 'message': 'All Post.',
                 'posts': posts,
-                'has_next': has_next
+                'has_next': has_next,
+                'next_cursor': next_cursor,
             })
         except:
             return Response.something_went_wrong()
@@ -6,6 +6,11 @@ class BlockedUser(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blocked_by')
     blocked_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blocked_user')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'blocked_user'], name='unique_blocked_user'),
+        ]
+
 
 # Reported User
 class ReportedUser(models.Model):
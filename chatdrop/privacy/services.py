@@ -2,6 +2,7 @@ from .models import BlockedUser, ReportedUser
 from account.services import UserService
 from friends.services import FriendService, FriendRequestService
 from fanfollowing.services import FollowService
+from friends.graph import SocialGraph
 
 
 # Blocked User Paginator
@@ -10,13 +11,15 @@ class BlockedUserService:
 
     @staticmethod
     def is_blocked(user, blocked_user):
-        return BlockedUser.objects.filter(user=user, blocked_user=blocked_user).exists()
+        return SocialGraph.is_blocked(user, blocked_user)
 
     @staticmethod
     def block_user(auth_user, uid):
         user = UserService.get_user(uid)
 
-        BlockedUser.objects.create(user=auth_user, blocked_user=user)
+        BlockedUser.objects.get_or_create(user=auth_user, blocked_user=user)
+        SocialGraph.invalidate(auth_user, 'blocked')
+        SocialGraph.invalidate(user, 'blocked_by')
 
         if BlockedUserService.is_blocked(auth_user, user):
 
@@ -41,6 +44,8 @@ class BlockedUserService:
 
         if BlockedUserService.is_blocked(user=auth_user, blocked_user=user):
             BlockedUser.objects.get(user=auth_user, blocked_user=user).delete()
+            SocialGraph.invalidate(auth_user, 'blocked')
+            SocialGraph.invalidate(user, 'blocked_by')
 
     @staticmethod
     def list_all(user):
@@ -0,0 +1,77 @@
+from django.db.models import Q
+from friends.models import Friend
+from friends.graph import SocialGraph
+from .models import BlockedUser
+
+
+# Viewer Context
+class ViewerContext:
+    '''
+        Relations of the viewing user used for filtering posts, reels, comments and notifications.
+        1. blocked by and friend sets are loaded once per context from social graph cache, on first use.
+        2. visibility rules are applied in memory with can_view or in database with visible.
+    '''
+
+    def __init__(self, viewer):
+        self.viewer = viewer
+        self.__blocked_by = None
+        self.__friends = None
+
+    @property
+    def blocked_by(self):
+        '''uids of users who blocked the viewer.'''
+        if self.__blocked_by is None:
+            self.__blocked_by = SocialGraph.members(self.viewer, 'blocked_by')
+        return self.__blocked_by
+
+    @property
+    def friends(self):
+        '''uids of friends of the viewer.'''
+        if self.__friends is None:
+            self.__friends = SocialGraph.members(self.viewer, 'friends')
+        return self.__friends
+
+    def is_blocked_by(self, user):
+        return user.uid in self.blocked_by
+
+    def is_friend(self, user):
+        return user.uid in self.friends
+
+    def can_view(self, content):
+        '''checks visibility of a post or reel for the viewer, pending posts and reels are only visible to author.'''
+        author = content.user
+
+        if author.uid == self.viewer.uid:
+            return True
+
+        if self.is_blocked_by(author) or content.is_private or not content.is_approved:
+            return False
+
+        if content.is_only_friends:
+            return self.is_friend(author)
+
+        return True
+
+    def filter_visible(self, contents):
+        '''returns visible posts or reels dropping duplicates, keeping order.'''
+        visible = []
+        counted = set()
+        for content in contents:
+            if content.id in counted or not self.can_view(content):
+                continue
+            counted.add(content.id)
+            visible.append(content)
+        return visible
+
+    def not_blocked(self, queryset, field='user'):
+        '''excludes rows whose user in given field blocked the viewer.'''
+        return queryset.exclude(**{f'{field}__in': BlockedUser.objects.filter(blocked_user=self.viewer).values('user')})
+
+    def visible(self, queryset):
+        '''filters a post or reel queryset to the ones visible to the viewer in a single query.'''
+        friends = Friend.objects.filter(user=self.viewer).values('friend')
+        return self.not_blocked(queryset).filter(
+            Q(user=self.viewer) |
+            Q(moderation='APPROVED', visibility='PUBLIC') |
+            Q(moderation='APPROVED', visibility='ONLY_FRIENDS', user__in=friends)
+        )
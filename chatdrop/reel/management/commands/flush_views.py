@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from utils.view_tracker import ViewTracker
+from utils.debug import debug_print
+
+
+# View writer
+class Command(BaseCommand):
+    help = 'Bulk inserts reel and story views recorded in redis.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drain', action='store_true', help='exits once all recorded views are written.')
+        parser.add_argument('--interval', type=float, default=1, help='seconds to wait when no views are recorded.')
+
+    def handle(self, *args, **options):
+        count = 0
+        while True:
+            try:
+                taken = ViewTracker.flush()
+            except Exception as e:
+                debug_print(e)
+                taken = 0
+
+            count += taken
+            if taken == 0:
+                if options['drain']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'{count} views written.'))
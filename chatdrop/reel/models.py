@@ -35,6 +35,16 @@ class Reel(models.Model):
     likes_count = models.IntegerField(default=0)
     comments_count = models.IntegerField(default=0)
     posted_on = models.DateTimeField(default=None)
+    moderation = models.CharField(default='APPROVED', choices=(('PENDING', 'Pending'), ('APPROVED', 'Approved')), max_length=10)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-posted_on']),
+        ]
+
+    @property
+    def is_approved(self):
+        return self.moderation == 'APPROVED'
 
     @property
     def is_public(self):
@@ -54,6 +64,11 @@ class ReelView(models.Model):
     reel = models.ForeignKey(Reel, on_delete=models.CASCADE)
     seen_by = models.ForeignKey('account.User', on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['reel', 'seen_by'], name='unique_reel_view'),
+        ]
+
 
 # Reel HashTags
 class ReelHashTag(models.Model):
@@ -61,6 +76,11 @@ class ReelHashTag(models.Model):
     type = models.CharField(default='USER', choices=(('USER', 'User'), ('TAG', 'Tag'), ('URL', 'Url')), max_length=10)
     tag = models.CharField(default='', blank=True, max_length=100)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['tag']),
+        ]
+
 
 # Reel Video
 class ReelVideo(models.Model):
@@ -73,6 +93,8 @@ class ReelVideo(models.Model):
     labels = models.JSONField(default=list)
     audio = models.ForeignKey(Audio, null=True, on_delete=models.DO_NOTHING)
     aspect_ratio = models.FloatField(default=1)
+    thumbnail_variants = models.JSONField(default=list, blank=True)
+    thumbnail_placeholder = models.TextField(default='', blank=True)
 
     @property
     def cdn_url(self):
@@ -94,6 +116,11 @@ class ReelLike(models.Model):
         ('LIKE', 'Like'), ('LOVE', 'Love'), ('HAHA', 'Haha'), ('YAY', 'Yay'), ('WOW', 'Wow'), ('SAD', 'Sad'), ('ANGRY', 'Angry')
     ), max_length=10)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['reel', 'by'], name='unique_reel_like'),
+        ]
+
 
 
 # Post Comment
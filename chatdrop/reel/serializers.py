@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import Reel, ReelComment, ReelLike, ReelCommentLike, Audio
 from utils import validators
@@ -117,4 +118,11 @@ class AudioSerailzer(serializers.ModelSerializer):
         if duration is None:
             raise serializers.ValidationError({'duration': 'Audio duration not specified.'})
         
-        return attrs
\ No newline at end of file
+        return attrs
+
+
+
+
+# Reel View Batch
+class ReelViewBatchSerializer(serializers.Serializer):
+    reels = serializers.ListField(child=serializers.CharField(max_length=36), allow_empty=False, max_length=settings.VIEW_BATCH_SIZE)
@@ -1,15 +1,26 @@
 import notifier.services as notifier_services
-import friends.services as friend_services
-import fanfollowing.services as fan_services
-import privacy.services as privacy_services
 
-from .models import Reel, ReelVideo, ReelHashTag, ReelComment, ReelLike, ReelCommentLike, Audio, ReelView
+from friends.graph import SocialGraph
+from .models import Reel, ReelVideo, ReelHashTag, ReelComment, ReelLike, ReelCommentLike, Audio
 from utils import generator, time
+from django.conf import settings
 from django.utils import timezone
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from account.services import UserService
 from .exceptions import ReelError, CommentError, LikeError, AudioError
-from django.core.paginator import Paginator
+from utils.pagination import CursorPaginator
+from utils.counters import Counters
+from utils.view_tracker import ViewTracker
 from utils.image_processing import ImageDetection
+from utils.moderation import ModerationQueue
+from utils.derivatives import ImageDerivatives, ImageDerivativeQueue
+from privacy.viewer import ViewerContext
+from search.hashtags import HashTagIndex
+from search.index import AudioIndex
+from search.tags import TagParser
+from feeds.reel_ranking import ReelRanker
+from account.models import User
 
 
 
@@ -26,59 +37,76 @@ class ReelService:
         return Reel.objects.get(id=id)
     
     @staticmethod
-    def add_reel(auth_user, data):
-        reel = None
+    def __notify_mentioned(reel, mentioned):
+        '''notifies mentioned users of a published reel in a single batch, leaving out users who blocked the author.'''
+        if len(mentioned) == 0:
+            return
+
+        blocked_by = SocialGraph.has_members(reel.user, 'blocked_by', mentioned)
+        notifier_services.NotificationChannelService.push_notifications(
+            from_user=reel.user,
+            to_users=[user for user in mentioned if user.uid not in blocked_by],
+            refer=reel.id,
+            subject='Mention',
+            body='mentioned you in a reel.',
+            type='REEL'
+        )
 
+    @staticmethod
+    def add_reel(auth_user, data):
         contains_hashtags = False
         if data.get('hashtags') != '':
             contains_hashtags = True
         
         posted_on = timezone.now()
 
-        prediction = ImageDetection.process(image_bytes=data.get('thumbnail'))
-        labels = prediction.labels
-        if not prediction.is_safe:
-            raise ReelError('Nude Video found.')
-
-        reel = Reel.objects.create(
-            id=generator.generate_identity(), 
-            user=auth_user, 
-            text=data.get('text'), 
-            contains_hashtags=contains_hashtags,
-            visibility=data.get('visibility'),
-            posted_on=posted_on,
-        )
+        # reels are published pending and moderated by moderate_media command when in background
+        moderation = 'APPROVED'
+        if settings.IMAGE_DETECTION_IN_BACKGROUND:
+            moderation = 'PENDING'
+
+        labels = []
+        if moderation == 'APPROVED':
+            prediction = ImageDetection.process(image_bytes=data.get('thumbnail'))
+            labels = prediction.labels
+            if not prediction.is_safe:
+                raise ReelError('Nude Video found.')
 
         audio = None
         if data.get('audio_id') != 0 and data.get('audio_id') != None:
             audio = Audio.objects.get(id=data.get('audio_id'))
 
-        ReelVideo.objects.create(
-            reel=reel, 
-            video=data.get('video'), 
-            thumbnail=data.get('thumbnail'), 
-            labels=labels,
-            audio=audio, 
-            aspect_ratio=data.get('aspect_ratio')
-        )
+        tagged = TagParser.parse(data.get('hashtags'))
+
+        with transaction.atomic():
+            reel = Reel.objects.create(
+                id=generator.generate_identity(), 
+                user=auth_user, 
+                text=data.get('text'), 
+                contains_hashtags=contains_hashtags,
+                visibility=data.get('visibility'),
+                posted_on=posted_on,
+                moderation=moderation,
+            )
 
-        if reel is not None:
-            user_tags = data.get('hashtags').split(',')
-            for hashtag in user_tags:
-                hashtag = str(hashtag)
-                if hashtag.startswith('@'):
-                    try:
-                        user = UserService.get_user_by_username(username=hashtag[1:])
-                        ReelHashTag.objects.create(reel=reel, type='USER', tag=f'@{user.username}::{user.uid}')
-                    except:
-                        pass
-                elif hashtag.startswith('#'):
-                    ReelHashTag.objects.create(reel=reel, type='TAG', tag=hashtag[1:])
-                elif hashtag.startswith('https://') or hashtag.startswith('http://'):
-                    ReelHashTag.objects.create(reel=reel, type='URL', tag=hashtag)
-            
-            auth_user.reel_count += 1
-            auth_user.save()
+            reel_video = ReelVideo.objects.create(
+                reel=reel, 
+                video=data.get('video'), 
+                thumbnail=data.get('thumbnail'), 
+                labels=labels,
+                audio=audio, 
+                aspect_ratio=data.get('aspect_ratio')
+            )
+            transaction.on_commit(lambda: ImageDerivativeQueue.push(reel_video))
+
+            TagParser.save(ReelHashTag, 'reel', reel, tagged)
+            HashTagIndex.add_reel(reel, tagged.tags)
+            transaction.on_commit(lambda: Counters.incr(auth_user, 'reel_count'))
+
+        if reel.is_approved:
+            ReelService.__notify_mentioned(reel, tagged.mentioned)
+        else:
+            ModerationQueue.push('REEL', reel.id)
 
         return reel
     
@@ -90,18 +118,22 @@ class ReelService:
             raise ReelError('No permission to change visibility of this reel.')
         
         reel.visibility = visibility
-        reel.save()
+        reel.save(update_fields=['visibility'])
     
     @staticmethod
     def add_reel_view(auth_user, reel_id):
         reel = ReelService.get_reel(reel_id)
 
-        # adding view to a story
-        if not ReelView.objects.filter(reel=reel, seen_by=auth_user).exists():
-            ReelView.objects.create(reel=reel, seen_by=auth_user)
+        # recording view, written to database by flush_views command
+        ViewTracker.track('reel.Reel', [reel.id], auth_user)
+        ReelRanker.remove_seen(auth_user, [reel.id])
 
-            reel.views_count += 1
-            reel.save()
+    @staticmethod
+    def add_reel_views(auth_user, reel_ids):
+        '''records views of many reels watched by auth user, at most VIEW_BATCH_SIZE enforced by ReelViewBatchSerializer, returns number of new views.'''
+        reel_ids = list(Reel.objects.filter(id__in=reel_ids).values_list('id', flat=True))
+        ReelRanker.remove_seen(auth_user, reel_ids)
+        return len(ViewTracker.track('reel.Reel', reel_ids, auth_user))
 
     @staticmethod
     def delete_reel(auth_user, reel_id):
@@ -110,125 +142,146 @@ class ReelService:
         if reel.user.uid != auth_user.uid:
             raise ReelError('No permission to delete post.')
         
+        HashTagIndex.remove_reel(reel)
         reel.delete()
 
-        auth_user.reel_count -= 1
-        auth_user.save()
-    
+        Counters.decr(auth_user, 'reel_count')
+
     @staticmethod
-    def to_json(reel: Reel, auth_user):
-        # Profile
-        profile = reel.user
+    def moderate_reel(reel_id):
+        '''moderates thumbnail of a pending reel, publishes it if safe otherwise removes it.'''
+        reel = Reel.objects.select_related('user').get(id=reel_id)
 
-        # calculating ago time
-        time_ago = time.caltime_string(reel.posted_on)
-
-        reel_json = {
-            'id': reel.id,
-            'user': {
-                'uid': profile.uid,
-                'name': profile.full_name,
-                'photo': profile.photo_cdn_url,
-                'username': profile.username,
-                'gender': profile.gender,
-                'message': profile.message,
-            },
-            'type': reel.reel_type,
-            'visibility': reel.visibility,
-            'posted_on': time_ago,
-            'contains_hashtags': reel.contains_hashtags,
-            'is_following': False,
-            'views_count': reel.views_count,
-            'likes_count': reel.likes_count,
-            'comments_count': reel.comments_count,
-            'hashtags': [],
-            'text': reel.text,
-            'video': None,
-            'liked': None,
-            'auth_user': {
-                'uid': auth_user.uid,
-                'name': auth_user.full_name,
-                'photo': auth_user.photo_cdn_url,
-                'username': auth_user.username,
-                'gender': auth_user.gender,
-                'message': auth_user.message,
-            }
-        }
+        if reel.is_approved:
+            return
 
-        if auth_user.uid != profile.uid and fan_services.FollowService.is_following_exists(user=auth_user, follow=profile):
-            reel_json['is_following'] = True
+        videos = list(ReelVideo.objects.filter(reel=reel).exclude(thumbnail__isnull=True).exclude(thumbnail=''))
 
+        images = [video.thumbnail.open('rb') for video in videos]
         try:
-            like = ReelLike.objects.get(reel=reel, by=auth_user)
-            reel_json['liked'] = like.type
-        except:
-            pass
+            predictions = ImageDetection.process_many(images)
+        finally:
+            for image in images:
+                image.close()
 
-        if reel.contains_hashtags:
-            hashtags = ReelHashTag.objects.filter(reel=reel)
-            
-            reel_json['hashtags'] = []
+        if not all(prediction.is_safe for prediction in predictions):
+            ReelService.delete_reel(auth_user=reel.user, reel_id=reel.id)
+            return
 
-            for tag in hashtags:
-                reel_json['hashtags'].append({
-                    'type': tag.type,
-                    'tag': tag.tag
-                })
+        for video, prediction in zip(videos, predictions):
+            video.labels = prediction.labels
+            video.save(update_fields=['labels'])
 
-        video = ReelVideo.objects.get(reel=reel)
-        
-        reel_json['video'] = {
-            'url': video.cdn_url,
-            'thumbnail': video.cdn_thumbnail_url,
-            'labels': video.labels,
-            'audio': None if video.audio == None else AudioService.to_json(video.audio),
-            'aspect_ratio': video.aspect_ratio,
+        reel.moderation = 'APPROVED'
+        reel.save(update_fields=['moderation'])
+        HashTagIndex.approve_reel(reel)
+
+        mentioned = [tag.split('::')[-1] for tag in ReelHashTag.objects.filter(reel=reel, type='USER').values_list('tag', flat=True)]
+        ReelService.__notify_mentioned(reel, list(User.objects.filter(uid__in=mentioned)))
+    
+    @staticmethod
+    def to_json(reel: Reel, auth_user):
+        return ReelService.to_json_many([reel], auth_user)[0]
+    
+    @staticmethod
+    def to_json_many(reels, auth_user):
+        '''serializes reels in the same format as to_json with a constant number of queries.'''
+        reels = list(reels)
+        prefetch_related_objects(reels, 'user', 'reelhashtag_set', 'reelvideo_set__audio__user')
+        Counters.merge(reels)
+
+        # likes and followings of auth user for all reels in one query each
+        likes = dict(ReelLike.objects.filter(reel__in=[reel.id for reel in reels], by=auth_user).values_list('reel', 'type'))
+        followings = SocialGraph.has_members(auth_user, 'following', {reel.user.uid for reel in reels})
+
+        auth_user_json = {
+            'uid': auth_user.uid,
+            'name': auth_user.full_name,
+            'photo': auth_user.photo_cdn_url,
+            'username': auth_user.username,
+            'gender': auth_user.gender,
+            'message': auth_user.message,
         }
 
-        return reel_json
+        reel_list = []
+        for reel in reels:
+            # Profile
+            profile = reel.user
+
+            # calculating ago time
+            time_ago = time.caltime_string(reel.posted_on)
+
+            reel_json = {
+                'id': reel.id,
+                'user': {
+                    'uid': profile.uid,
+                    'name': profile.full_name,
+                    'photo': profile.photo_cdn_url,
+                    'username': profile.username,
+                    'gender': profile.gender,
+                    'message': profile.message,
+                },
+                'type': reel.reel_type,
+                'visibility': reel.visibility,
+                'posted_on': time_ago,
+                'contains_hashtags': reel.contains_hashtags,
+                'is_following': auth_user.uid != profile.uid and profile.uid in followings,
+                'views_count': reel.views_count,
+                'likes_count': reel.likes_count,
+                'comments_count': reel.comments_count,
+                'hashtags': [],
+                'text': reel.text,
+                'video': None,
+                'liked': likes.get(reel.id),
+                'auth_user': dict(auth_user_json),
+            }
+
+            if reel.contains_hashtags:
+                for tag in reel.reelhashtag_set.all():
+                    reel_json['hashtags'].append({
+                        'type': tag.type,
+                        'tag': tag.tag
+                    })
+
+            videos = reel.reelvideo_set.all()
+            if len(videos) > 0:
+                video = videos[0]
+                reel_json['video'] = {
+                    'url': video.cdn_url,
+                    'thumbnail': video.cdn_thumbnail_url,
+                    'thumbnail_variants': ImageDerivatives.to_json(video.thumbnail_variants),
+                    'thumbnail_placeholder': video.thumbnail_placeholder,
+                    'labels': video.labels,
+                    'audio': None if video.audio == None else AudioService.to_json(video.audio),
+                    'aspect_ratio': video.aspect_ratio,
+                }
+
+            reel_list.append(reel_json)
+
+        return reel_list
     
     @staticmethod
     def view_reel(auth_user, reel_id):
         reel = ReelService.get_reel(id=reel_id)
 
-        if privacy_services.BlockedUserService.is_blocked(user=reel.user, blocked_user=auth_user):
-            return None
-
-        if reel.is_private and auth_user.uid != reel.user.uid:
+        if not ViewerContext(auth_user).can_view(reel):
             return None
 
-        if reel.is_only_friends and auth_user.uid != reel.user.uid:
-            if not friend_services.FriendService.is_friend_exists(user=auth_user, friend=reel.user):
-                return None
-
         reel_json = ReelService.to_json(reel=reel, auth_user=auth_user)
         return reel_json
 
     @staticmethod
-    def list_all(auth_user, uid, page):
+    def list_all(auth_user, uid, page, cursor=None):
         user = UserService.get_user(uid)
 
-        reels = Reel.objects.filter(user=user).order_by('-posted_on')
+        reels = ViewerContext(auth_user).visible(Reel.objects.filter(user=user).select_related('user'))
 
-        pagination = Paginator(reels, 100)
-        paginated_reels = pagination.get_page(int(page))
+        pagination = CursorPaginator(reels, ('-posted_on', '-id'), 100)
+        paginated_reels = pagination.get_page(cursor=cursor, page=page)
         
-        reel_list = []
-        for reel in paginated_reels.object_list:
-            if privacy_services.BlockedUserService.is_blocked(user=reel.user, blocked_user=auth_user):
-                continue
-            
-            if reel.is_private and auth_user.uid != user.uid:
-                continue
-
-            if reel.is_only_friends and auth_user.uid != user.uid:
-                if not friend_services.FriendService.is_friend_exists(user=auth_user, friend=user):
-                    continue
-
-            reel_json = ReelService.to_json(reel=reel, auth_user=auth_user)
-            reel_list.append(reel_json)
+        reel_list = ReelService.to_json_many(paginated_reels.object_list, auth_user=auth_user)
         
-        return reel_list
+        return reel_list, paginated_reels.has_next(), paginated_reels.next_cursor
     
 
 # Comment Paginator
@@ -257,8 +310,7 @@ class CommentService:
         )
 
         # upgrading comment counts
-        reel.comments_count += 1
-        reel.save()
+        Counters.incr(reel, 'comments_count')
 
         if reel.user.uid != auth_user.uid:
             # sending user a notification
@@ -302,21 +354,18 @@ class CommentService:
             comment.delete()
 
             # downgrading comment counts
-            reel.comments_count -= 1
-            reel.save()
+            Counters.decr(reel, 'comments_count')
         else:
             raise CommentError('No permission for deleting comment')
 
     @staticmethod
     def list_all(user, reel_id):
         reel = Reel.objects.get(id=reel_id)
-        comments = ReelComment.objects.filter(reel=reel)
+        comments = ViewerContext(user).not_blocked(ReelComment.objects.filter(reel=reel).select_related('by'), field='by')
+        comments = Counters.merge(list(comments))
 
         comments_list = []
         for comment in comments:
-            if privacy_services.BlockedUserService.is_blocked(user=comment.by, blocked_user=user):
-                continue
-            
             # Profile
             profile = comment.by
 
@@ -362,20 +411,15 @@ class LikeService:
     def like_reel(auth_user, reel_id, data):
         reel = ReelService.get_reel(reel_id)
 
-        try:
-            like = ReelLike.objects.get(reel=reel, by=auth_user)
-            like.type = data.get('type')
-            like.save()
-        except:
-            like = ReelLike.objects.create(
-                reel=reel, 
-                by=auth_user, 
-                type=data.get('type'),
-            )
+        # unique (reel, by) keeps a single like per user even on concurrent requests
+        like, created = ReelLike.objects.update_or_create(reel=reel, by=auth_user, defaults={'type': data.get('type')})
         
+        if created:
             # upgrading like counts
-            reel.likes_count += 1
-            reel.save()
+            Counters.incr(reel, 'likes_count')
+
+            # ranking reels again with interests of the new like
+            ReelRanker.invalidate(auth_user)
         
         if reel.user.uid != auth_user.uid:
             # sending user a notification
@@ -400,8 +444,7 @@ class LikeService:
         
         like.delete()
 
-        reel.likes_count -= 1
-        reel.save()
+        Counters.decr(reel, 'likes_count')
 
     @staticmethod
     def list_all(reel_id):
@@ -435,7 +478,7 @@ class CommentLikeService:
         try:
             like = ReelCommentLike.objects.get(comment=comment, by=auth_user)
             like.type = data.get('type')
-            like.save()
+            like.save(update_fields=['type'])
         except:
             like = ReelCommentLike.objects.create(
                 comment=comment, 
@@ -444,8 +487,7 @@ class CommentLikeService:
             )
         
             # upgrading like counts
-            comment.likes_count += 1
-            comment.save()
+            Counters.incr(comment, 'likes_count')
         
         if comment.by.uid != auth_user.uid:
             # sending user a notification
@@ -470,8 +512,7 @@ class CommentLikeService:
         
         like.delete()
 
-        comment.likes_count -= 1
-        comment.save()
+        Counters.decr(comment, 'likes_count')
 
     @staticmethod
     def list_all(comment_id):
@@ -503,6 +544,7 @@ class AudioService:
             audio=data.get('audio'),
             duration=data.get('duration'),
         )
+        AudioIndex.add(audio)
 
         return AudioService.to_json(audio)
     
@@ -513,6 +555,7 @@ class AudioService:
         if audio.user.uid != auth_user.uid:
             raise AudioError('No Permission to delete this audio.')
     
+        AudioIndex.remove(audio.id)
         audio.delete()
     
     @staticmethod
@@ -6,6 +6,7 @@ urlpatterns = [
     path('v1/reel/add/', views.AddReel.as_view(), name='add-reel'),
     path('v1/reel/<str:reel_id>/view/', views.SingleReelView.as_view(), name='single-reel-view'),
     path('v1/reel/<str:reel_id>/viewer/', views.ReelViewer.as_view(), name='reel-viewer'),
+    path('v1/reel/viewer/batch/', views.ReelViewerBatch.as_view(), name='reel-viewer-batch'),
     path('v1/reel/<str:reel_id>/visibility/', views.ChangeReelVisilibity.as_view(), name='add-reel-visibility'),
     path('v1/reel/list/', views.ListReel.as_view(), name='list-reel'),
     path('v1/reel/<str:reel_id>/delete/', views.DeleteReel.as_view(), name='delete-reel'),
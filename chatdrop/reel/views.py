@@ -68,6 +68,38 @@ class ReelViewer(APIView):
 
 
 
+# Reel Viewer Batch
+class ReelViewerBatch(APIView):
+    parser_classes = [JSONParser]
+    permission_classes = [IsRequestValid, IsAuthenticated]
+    throttle_classes = [AuthenticatedUserThrottling]
+
+    def post(self, request):
+        try:
+            serializer = serializers.ReelViewBatchSerializer(data=request.data)
+
+            # validating serializer
+            if serializer.is_valid():
+                # adding reel views
+                count = ReelService.add_reel_views(
+                    auth_user=request.user,
+                    reel_ids=serializer.validated_data.get('reels')
+                )
+
+                return Response.success({
+                    'message': 'Reel views added.',
+                    'count': count
+                })
+
+            return Response.errors(serializer.errors)
+        except Exception as e:
+            debug_print(e)
+            return Response.something_went_wrong()
+
+
+
+
+
 # Single Reel view
 class SingleReelView(APIView):
     parser_classes = [JSONParser]
@@ -126,15 +158,18 @@ class ListReel(APIView):
 
     def get(self, request):
         try: 
-            reels = ReelService.list_all(
+            reels, has_next, next_cursor = ReelService.list_all(
                 auth_user=request.user,
                 uid=request.query_params.get('of'),
                 page=request.query_params.get('page'),
+                cursor=request.query_params.get('cursor'),
             )
             
             return Response.success({
                 'message': 'All reel.',
-                'reels': reels
+                'reels': reels,
+                'has_next': has_next,
+                'next_cursor': next_cursor,
             })
         except:
             return Response.something_went_wrong()
@@ -6,6 +6,7 @@ urlpatterns = [
     path('v1/reel/add/', web_views.AddReel.as_view(), name='web-add-reel'),
     path('v1/reel/<str:reel_id>/view/', web_views.SingleReelView.as_view(), name='web-single-reel-view'),
     path('v1/reel/<str:reel_id>/viewer/', web_views.ReelViewer.as_view(), name='web-reel-viewer'),
+    path('v1/reel/viewer/batch/', web_views.ReelViewerBatch.as_view(), name='web-reel-viewer-batch'),
     path('v1/reel/<str:reel_id>/visibility/', web_views.ChangeReelVisilibity.as_view(), name='web-add-reel-visibility'),
     path('v1/reel/list/', web_views.ListReel.as_view(), name='web-list-reel'),
     path('v1/reel/<str:reel_id>/delete/', web_views.DeleteReel.as_view(), name='web-delete-reel'),
@@ -1,3 +1,8 @@
 from django.contrib import admin
+from . import models
 
-# Register your models here.
+# HashTagAdminPanel
+class HashTagAdminPanel(admin.ModelAdmin):
+    list_display = ('tag', 'posts_count', 'reels_count', 'created_on')
+
+admin.site.register(models.HashTag, HashTagAdminPanel)
@@ -0,0 +1,160 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django_redis import get_redis_connection
+from utils.counters import Counters
+from .models import HashTag, HashTagPost, HashTagReel
+
+
+# HashTag Index
+class HashTagIndex:
+    '''
+        Normalized hashtags with posting lists of posts and reels ordered by time.
+        1. tags are stored lowercase without '#', every posting holds posted_on of its content for index range scans.
+        2. postings are added when posts and reels are created and removed with them by cascade.
+        3. posts and reels counts of tags go through Counters, once the transaction adding postings commits.
+        4. uses of public content count towards trending once it is approved by moderation.
+    '''
+
+    @staticmethod
+    def normalize(tag):
+        return str(tag).strip().lstrip('#').lower()
+
+    @staticmethod
+    def __hashtags(tags):
+        '''returns hashtags of normalized tags, creating missing ones.'''
+        tags = {tag for tag in tags if tag != ''}
+        if len(tags) == 0:
+            return []
+
+        HashTag.objects.bulk_create([HashTag(tag=tag) for tag in tags], ignore_conflicts=True)
+        return list(HashTag.objects.filter(tag__in=tags))
+
+    @staticmethod
+    def add_post(post, tags):
+        hashtags = HashTagIndex.__hashtags(HashTagIndex.normalize(tag) for tag in tags)
+        if len(hashtags) == 0:
+            return
+
+        HashTagPost.objects.bulk_create([
+            HashTagPost(hashtag=hashtag, post=post, posted_on=post.posted_on) for hashtag in hashtags
+        ], ignore_conflicts=True)
+        hashtag_ids = [hashtag.id for hashtag in hashtags]
+        transaction.on_commit(lambda: Counters.incr_many('search.HashTag', hashtag_ids, 'posts_count'))
+
+        if post.is_public and post.is_approved:
+            tags = [hashtag.tag for hashtag in hashtags]
+            transaction.on_commit(lambda: TrendingHashTags.record(tags))
+
+    @staticmethod
+    def add_reel(reel, tags):
+        hashtags = HashTagIndex.__hashtags(HashTagIndex.normalize(tag) for tag in tags)
+        if len(hashtags) == 0:
+            return
+
+        HashTagReel.objects.bulk_create([
+            HashTagReel(hashtag=hashtag, reel=reel, posted_on=reel.posted_on) for hashtag in hashtags
+        ], ignore_conflicts=True)
+        hashtag_ids = [hashtag.id for hashtag in hashtags]
+        transaction.on_commit(lambda: Counters.incr_many('search.HashTag', hashtag_ids, 'reels_count'))
+
+        if reel.is_public and reel.is_approved:
+            tags = [hashtag.tag for hashtag in hashtags]
+            transaction.on_commit(lambda: TrendingHashTags.record(tags))
+
+    @staticmethod
+    def approve_post(post):
+        '''records uses of tags of a post published pending once moderation approves it.'''
+        if post.is_public:
+            TrendingHashTags.record(list(HashTagPost.objects.filter(post=post).values_list('hashtag__tag', flat=True)))
+
+    @staticmethod
+    def approve_reel(reel):
+        '''records uses of tags of a reel published pending once moderation approves it.'''
+        if reel.is_public:
+            TrendingHashTags.record(list(HashTagReel.objects.filter(reel=reel).values_list('hashtag__tag', flat=True)))
+
+    @staticmethod
+    def remove_post(post):
+        '''decrements counts of tags of a post about to be deleted.'''
+        hashtag_ids = list(HashTagPost.objects.filter(post=post).values_list('hashtag', flat=True))
+        Counters.incr_many('search.HashTag', hashtag_ids, 'posts_count', -1)
+
+    @staticmethod
+    def remove_reel(reel):
+        '''decrements counts of tags of a reel about to be deleted.'''
+        hashtag_ids = list(HashTagReel.objects.filter(reel=reel).values_list('hashtag', flat=True))
+        Counters.incr_many('search.HashTag', hashtag_ids, 'reels_count', -1)
+
+    @staticmethod
+    def posts(tags):
+        '''subquery of ids of posts tagged with any of the tags.'''
+        tags = [HashTagIndex.normalize(tag) for tag in tags]
+        return HashTagPost.objects.filter(hashtag__tag__in=tags).values('post')
+
+    @staticmethod
+    def reels(tags):
+        '''subquery of ids of reels tagged with any of the tags.'''
+        tags = [HashTagIndex.normalize(tag) for tag in tags]
+        return HashTagReel.objects.filter(hashtag__tag__in=tags).values('reel')
+
+
+
+# Trending HashTags
+class TrendingHashTags:
+    '''
+        Hashtags used most in public posts and reels over a sliding window.
+        1. uses are counted in redis sorted sets, one per hour, expiring after the window.
+        2. trending scores sum hourly counts decayed by age with settings.HASHTAG_TRENDING_HALF_LIFE_HOURS.
+        3. computed scores are cached for a minute.
+    '''
+
+    KEY = 'hashtags:trending'
+    CACHE_SECONDS = 60
+
+    @staticmethod
+    def __bucket_key(hour):
+        return f'hashtags:trending:{hour}'
+
+    @staticmethod
+    def __hour():
+        return int(time.time() // 3600)
+
+    @staticmethod
+    def record(tags):
+        if len(tags) == 0:
+            return
+
+        window = settings.HASHTAG_TRENDING_WINDOW_HOURS
+        key = TrendingHashTags.__bucket_key(TrendingHashTags.__hour())
+
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        for tag in tags:
+            pipe.zincrby(key, 1, tag)
+        pipe.expire(key, (window + 1) * 3600)
+        pipe.execute()
+
+    @staticmethod
+    def __compute(redis):
+        hour = TrendingHashTags.__hour()
+        half_life = settings.HASHTAG_TRENDING_HALF_LIFE_HOURS
+        weights = {
+            TrendingHashTags.__bucket_key(hour - age): 0.5 ** (age / half_life)
+            for age in range(settings.HASHTAG_TRENDING_WINDOW_HOURS)
+        }
+
+        pipe = redis.pipeline()
+        pipe.zunionstore(TrendingHashTags.KEY, weights)
+        pipe.expire(TrendingHashTags.KEY, TrendingHashTags.CACHE_SECONDS)
+        pipe.execute()
+
+    @staticmethod
+    def top(count=20):
+        '''returns [(tag, score)] of trending hashtags, highest first.'''
+        redis = get_redis_connection('default')
+        if not redis.exists(TrendingHashTags.KEY):
+            TrendingHashTags.__compute(redis)
+
+        entries = redis.zrevrange(TrendingHashTags.KEY, 0, count - 1, withscores=True)
+        return [(tag.decode('utf-8'), score) for tag, score in entries]
@@ -0,0 +1,461 @@
+import re
+import math
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+
+# Search Index
+class SearchIndex:
+    '''
+        Inverted index of documents held in redis, queried by word prefixes.
+        1. every term has a posting sorted set of document ids scored by field weight plus popularity boost.
+        2. all terms are held in a lexicographic sorted set, prefixes are expanded with ZRANGEBYLEX
+           to their most frequent terms, document frequencies of terms are kept in another sorted set.
+        3. a document matches when every query word matches one of its terms, a prefix match scores less than an exact one.
+        4. multiple words are matched by scoring postings of the rarest word against other words with ZMSCORE.
+        5. terms of every document are kept, so changed or removed documents drop their old postings.
+    '''
+
+    TOKEN = re.compile(r'[^\W_]+')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __terms_key(self):
+        return f'search:{self.name}:terms'
+
+    def __df_key(self):
+        return f'search:{self.name}:df'
+
+    def __term_key(self, term):
+        return f'search:{self.name}:term:{term}'
+
+    def __doc_key(self, doc_id):
+        return f'search:{self.name}:doc:{doc_id}'
+
+    @staticmethod
+    def tokenize(text):
+        '''returns lowercase words of text, words joined by '_' like usernames are also kept whole.'''
+        text = str(text).lower()
+        tokens = SearchIndex.TOKEN.findall(text)
+        tokens.extend(word for word in re.findall(r'\w+', text) if '_' in word.strip('_'))
+        return [token[:settings.SEARCH_MAX_TERM_LENGTH] for token in tokens]
+
+    @staticmethod
+    def boost(popularity):
+        '''popularity count scaled to 0..1 on a log scale.'''
+        return min(math.log10(1 + max(popularity, 0)) / 7, 1)
+
+    def __drop(self, redis, doc_ids):
+        '''removes postings of documents, returns terms left without postings.'''
+        pipe = redis.pipeline(transaction=False)
+        for doc_id in doc_ids:
+            pipe.smembers(self.__doc_key(doc_id))
+        olds = pipe.execute()
+
+        pipe = redis.pipeline(transaction=False)
+        terms = set()
+        for doc_id, old in zip(doc_ids, olds):
+            for term in old:
+                term = term.decode('utf-8')
+                terms.add(term)
+                pipe.zrem(self.__term_key(term), doc_id)
+                pipe.zincrby(self.__df_key(), -1, term)
+            pipe.delete(self.__doc_key(doc_id))
+        pipe.execute()
+
+        return terms
+
+    def __prune(self, redis, terms):
+        '''drops terms without postings from term set.'''
+        terms = list(terms)
+        if len(terms) == 0:
+            return
+
+        pipe = redis.pipeline(transaction=False)
+        for term in terms:
+            pipe.exists(self.__term_key(term))
+        empty = [term for term, exists in zip(terms, pipe.execute()) if not exists]
+        if len(empty) > 0:
+            pipe = redis.pipeline(transaction=False)
+            pipe.zrem(self.__terms_key(), *empty)
+            pipe.zrem(self.__df_key(), *empty)
+            pipe.execute()
+
+    def add_many(self, documents):
+        '''
+            indexes documents given as [(doc_id, [(text, weight)], popularity)], replacing their old terms.
+        '''
+        documents = list(documents)
+        if len(documents) == 0:
+            return
+
+        redis = get_redis_connection('default')
+        dropped = self.__drop(redis, [doc_id for doc_id, _, _ in documents])
+
+        pipe = redis.pipeline(transaction=False)
+        added = set()
+        for doc_id, fields, popularity in documents:
+            terms = {}
+            for text, weight in fields:
+                for term in SearchIndex.tokenize(text):
+                    terms[term] = max(terms.get(term, 0), weight)
+            if len(terms) == 0:
+                continue
+
+            boost = SearchIndex.boost(popularity)
+            for term, weight in terms.items():
+                pipe.zadd(self.__term_key(term), {doc_id: weight + boost})
+                pipe.zincrby(self.__df_key(), 1, term)
+            pipe.sadd(self.__doc_key(doc_id), *terms.keys())
+            added.update(terms.keys())
+
+        if len(added) > 0:
+            pipe.zadd(self.__terms_key(), {term: 0 for term in added})
+        pipe.execute()
+
+        self.__prune(redis, dropped - added)
+
+    def add(self, doc_id, fields, popularity=0):
+        self.add_many([(doc_id, fields, popularity)])
+
+    def remove(self, *doc_ids):
+        redis = get_redis_connection('default')
+        self.__prune(redis, self.__drop(redis, doc_ids))
+
+    def clear(self):
+        '''drops every key of the index.'''
+        redis = get_redis_connection('default')
+        keys = []
+        for key in redis.scan_iter(match=f'search:{self.name}:*', count=1000):
+            keys.append(key)
+            if len(keys) >= 1000:
+                redis.delete(*keys)
+                keys = []
+        if len(keys) > 0:
+            redis.delete(*keys)
+
+    def __expand(self, redis, words):
+        '''
+            returns [({term: factor}, postings)] for every word, postings is the number of documents of its terms.
+            1. exact term is always taken, prefix matches are the SEARCH_PREFIX_EXPANSIONS most frequent terms
+               of the first SEARCH_PREFIX_SCAN terms with the prefix, scaled by length.
+        '''
+        pipe = redis.pipeline(transaction=False)
+        for word in words:
+            pipe.zrangebylex(self.__terms_key(), f'[{word}', b'[' + word.encode('utf-8') + b'\xff', start=0, num=settings.SEARCH_PREFIX_SCAN)
+        candidates = [[term.decode('utf-8') for term in terms] for terms in pipe.execute()]
+
+        pipe = redis.pipeline(transaction=False)
+        for terms in candidates:
+            if len(terms) > 0:
+                pipe.zmscore(self.__df_key(), terms)
+        frequencies = iter(pipe.execute())
+
+        expansions = []
+        for word, terms in zip(words, candidates):
+            if len(terms) == 0:
+                expansions.append(({}, 0))
+                continue
+
+            dfs = {term: int(df or 0) for term, df in zip(terms, next(frequencies))}
+            chosen = sorted((term for term in terms if term != word), key=lambda term: (-dfs[term], term))[:settings.SEARCH_PREFIX_EXPANSIONS]
+            if word in dfs:
+                chosen.insert(0, word)
+
+            factors = {term: 1 if term == word else 0.5 + 0.5 * len(word) / len(term) for term in chosen}
+            expansions.append((factors, sum(dfs[term] for term in chosen)))
+        return expansions
+
+    def __word_scores(self, postings, factors):
+        '''best score of every document over postings of the terms of a word.'''
+        scores = {}
+        for (term, factor), entries in zip(factors.items(), postings):
+            for doc_id, score in entries:
+                doc_id = doc_id.decode('utf-8') if isinstance(doc_id, bytes) else doc_id
+                if score is not None:
+                    scores[doc_id] = max(scores.get(doc_id, 0), score * factor)
+        return scores
+
+    def search(self, q, offset=0, size=20, exclude=None):
+        '''
+            returns ([(doc_id, score)], has_next) of documents matching q best first.
+            1. exclude is a callable taking candidate ids and returning ids to leave out, applied before paging.
+            2. a single word takes the best scored postings of its terms, enough for the requested page.
+            3. multiple words take up to SEARCH_TERM_DEPTH best postings of the rarest word as candidates,
+               scored against other words, so matches are complete unless every word is that common.
+        '''
+        words = list(dict.fromkeys(SearchIndex.TOKEN.findall(str(q).lower())))[:settings.SEARCH_MAX_WORDS]
+        words = [word[:settings.SEARCH_MAX_TERM_LENGTH] for word in words]
+        if len(words) == 0:
+            return [], False
+
+        redis = get_redis_connection('default')
+        expansions = self.__expand(redis, words)
+        if any(len(factors) == 0 for factors, _ in expansions):
+            return [], False
+
+        # candidates from postings of the rarest word
+        rarest = min(range(len(expansions)), key=lambda index: expansions[index][1])
+        factors, _ = expansions[rarest]
+        depth = max(settings.SEARCH_TERM_DEPTH, offset + size + 1) if len(words) > 1 else offset + size + 1
+        if exclude is not None:
+            depth = max(depth, settings.SEARCH_TERM_DEPTH)
+
+        pipe = redis.pipeline(transaction=False)
+        for term in factors:
+            pipe.zrevrange(self.__term_key(term), 0, depth - 1, withscores=True)
+        scores = self.__word_scores(pipe.execute(), factors)
+
+        # scoring candidates against other words
+        others = [factors for index, (factors, _) in enumerate(expansions) if index != rarest]
+        if len(others) > 0 and len(scores) > 0:
+            doc_ids = list(scores.keys())
+            pipe = redis.pipeline(transaction=False)
+            for factors in others:
+                for term in factors:
+                    pipe.zmscore(self.__term_key(term), doc_ids)
+            results = iter(pipe.execute())
+
+            for factors in others:
+                word_scores = self.__word_scores([zip(doc_ids, next(results)) for _ in factors], factors)
+                scores = {doc_id: score + word_scores[doc_id] for doc_id, score in scores.items() if doc_id in word_scores}
+
+        if exclude is not None and len(scores) > 0:
+            for doc_id in exclude(list(scores.keys())):
+                scores.pop(doc_id, None)
+
+        ranked = sorted(scores.items(), key=lambda entry: (-entry[1], entry[0]))
+        return ranked[offset:offset + size], len(ranked) > offset + size
+
+
+
+
+# Username Index
+class UsernameIndex:
+    '''
+        Usernames completed by prefix for mentions, cheap enough for every keystroke.
+        1. usernames are held in a lexicographic sorted set, with uid and follower count of every username alongside.
+        2. short prefixes have precomputed sorted sets of their most followed usernames, as a lexicographic scan of them would miss popular users.
+        3. longer prefixes scan a bounded lexicographic range and rank it by follower count.
+        4. usernames of the viewer's network are matched first, then everyone else by follower count,
+           network usernames of every viewer are cached in a lexicographic sorted set, so a keystroke never reads the whole network.
+    '''
+
+    KEY = 'search:usernames'
+    UIDS_KEY = 'search:usernames:uids' # username: uid
+    NAMES_KEY = 'search:usernames:names' # uid: username
+    FOLLOWERS_KEY = 'search:usernames:followers' # sorted set of usernames scored by follower count
+
+    @staticmethod
+    def __top_key(prefix):
+        return f'search:usernames:top:{prefix}'
+
+    @staticmethod
+    def __network_key(uid):
+        return f'search:usernames:network:{uid}'
+
+    @staticmethod
+    def __prefixes(username):
+        return [username[:i] for i in range(1, min(len(username), settings.TYPEAHEAD_TOP_PREFIX) + 1)]
+
+    @staticmethod
+    def __unlink(pipe, uid, username):
+        pipe.zrem(UsernameIndex.KEY, username)
+        pipe.zrem(UsernameIndex.FOLLOWERS_KEY, username)
+        pipe.hdel(UsernameIndex.UIDS_KEY, username)
+        pipe.hdel(UsernameIndex.NAMES_KEY, uid)
+        for prefix in UsernameIndex.__prefixes(username):
+            pipe.zrem(UsernameIndex.__top_key(prefix), username)
+
+    @staticmethod
+    def add_many(users):
+        '''indexes usernames of users given as [(uid, username, follower_count)], replacing old usernames.'''
+        users = [(uid, username.lower(), follower_count) for uid, username, follower_count in users]
+        if len(users) == 0:
+            return
+
+        redis = get_redis_connection('default')
+        olds = redis.hmget(UsernameIndex.NAMES_KEY, [uid for uid, _, _ in users])
+
+        pipe = redis.pipeline(transaction=False)
+        for (uid, username, follower_count), old in zip(users, olds):
+            if old is not None and old.decode('utf-8') != username:
+                UsernameIndex.__unlink(pipe, uid, old.decode('utf-8'))
+
+            pipe.zadd(UsernameIndex.KEY, {username: 0})
+            pipe.zadd(UsernameIndex.FOLLOWERS_KEY, {username: follower_count})
+            pipe.hset(UsernameIndex.UIDS_KEY, username, uid)
+            pipe.hset(UsernameIndex.NAMES_KEY, uid, username)
+            for prefix in UsernameIndex.__prefixes(username):
+                pipe.zadd(UsernameIndex.__top_key(prefix), {username: follower_count})
+                pipe.zremrangebyrank(UsernameIndex.__top_key(prefix), 0, -(settings.TYPEAHEAD_TOP_SIZE + 1))
+        pipe.execute()
+
+    @staticmethod
+    def remove(*uids):
+        if len(uids) == 0:
+            return
+
+        redis = get_redis_connection('default')
+        pipe = redis.pipeline(transaction=False)
+        for uid, username in zip(uids, redis.hmget(UsernameIndex.NAMES_KEY, list(uids))):
+            if username is not None:
+                UsernameIndex.__unlink(pipe, uid, username.decode('utf-8'))
+        pipe.execute()
+
+    @staticmethod
+    def clear():
+        redis = get_redis_connection('default')
+        keys = list(redis.scan_iter(match=f'{UsernameIndex.KEY}*', count=1000))
+        for i in range(0, len(keys), 1000):
+            redis.delete(*keys[i:i + 1000])
+
+    @staticmethod
+    def invalidate_network(*uids):
+        '''drops cached network usernames of viewers, rebuilt on next completion.'''
+        if len(uids) > 0:
+            get_redis_connection('default').delete(*[UsernameIndex.__network_key(uid) for uid in uids])
+
+    @staticmethod
+    def __build_network(redis, uid, network):
+        '''caches usernames of network uids of viewer, an empty member keeps an empty network cached.'''
+        network = list(network)
+        names = redis.hmget(UsernameIndex.NAMES_KEY, network) if len(network) > 0 else []
+
+        key = UsernameIndex.__network_key(uid)
+        pipe = redis.pipeline()
+        pipe.delete(key)
+        pipe.zadd(key, {'': 0, **{name: 0 for name in names if name is not None}})
+        pipe.expire(key, settings.TYPEAHEAD_NETWORK_EXPIRE_SECONDS)
+        pipe.execute()
+
+    @staticmethod
+    def complete(prefix, size=10, viewer=None, network=None, exclude=None):
+        '''
+            returns [(uid, username, is_network)] of usernames starting with prefix, network usernames first, then by follower count.
+            1. network is a callable returning network uids of viewer uid, called only when the cached network usernames expired.
+            2. exclude is a callable taking candidate uids and returning uids to leave out.
+        '''
+        prefix = str(prefix).strip().lstrip('@').lower()[:settings.SEARCH_MAX_TERM_LENGTH]
+        if prefix == '':
+            return []
+
+        redis = get_redis_connection('default')
+        prefix_range = (f'[{prefix}', b'[' + prefix.encode('utf-8') + b'\xff')
+
+        if viewer is not None and network is not None and not redis.exists(UsernameIndex.__network_key(viewer)):
+            UsernameIndex.__build_network(redis, viewer, network())
+
+        pipe = redis.pipeline(transaction=False)
+        if len(prefix) <= settings.TYPEAHEAD_TOP_PREFIX:
+            pipe.zrevrange(UsernameIndex.__top_key(prefix), 0, -1)
+        else:
+            pipe.zrangebylex(UsernameIndex.KEY, *prefix_range, start=0, num=settings.TYPEAHEAD_SCAN)
+        if viewer is not None:
+            pipe.zrangebylex(UsernameIndex.__network_key(viewer), *prefix_range, start=0, num=settings.TYPEAHEAD_SCAN)
+        usernames, *names = pipe.execute()
+
+        # network usernames matching prefix
+        network_names = {name.decode('utf-8') for name in (names[0] if len(names) > 0 else [])}
+        candidates = list({username.decode('utf-8') for username in usernames} | network_names)
+        if len(candidates) == 0:
+            return []
+
+        pipe = redis.pipeline(transaction=False)
+        pipe.hmget(UsernameIndex.UIDS_KEY, candidates)
+        pipe.zmscore(UsernameIndex.FOLLOWERS_KEY, candidates)
+        uids, followers = pipe.execute()
+
+        entries = [
+            (uid.decode('utf-8'), username, username in network_names, follower_count or 0)
+            for username, uid, follower_count in zip(candidates, uids, followers) if uid is not None
+        ]
+        if exclude is not None and len(entries) > 0:
+            excluded = set(exclude([uid for uid, _, _, _ in entries]))
+            entries = [entry for entry in entries if entry[0] not in excluded]
+
+        entries.sort(key=lambda entry: (not entry[2], -entry[3], entry[1]))
+        return [(uid, username, is_network) for uid, username, is_network, _ in entries[:size]]
+
+
+
+
+# Profile Index
+class ProfileIndex:
+    '''Users searchable by username, names, location and interests, ranked with follower count, usernames are completed by UsernameIndex.'''
+
+    # field: weight
+    WEIGHTS = {
+        'username': 5,
+        'first_name': 3,
+        'last_name': 3,
+        'location': 1,
+        'interest': 1,
+    }
+
+    index = SearchIndex('profiles')
+
+    @staticmethod
+    def add_many(users):
+        '''indexes users, admins are never searchable.'''
+        users = list(users)
+        admins = [user.uid for user in users if user.is_admin]
+        users = [user for user in users if not user.is_admin]
+
+        ProfileIndex.index.remove(*admins)
+        ProfileIndex.index.add_many(
+            (user.uid, [(getattr(user, field), weight) for field, weight in ProfileIndex.WEIGHTS.items()], user.follower_count)
+            for user in users
+        )
+
+        UsernameIndex.remove(*admins)
+        UsernameIndex.add_many((user.uid, user.username, user.follower_count) for user in users)
+
+    @staticmethod
+    def add(user):
+        ProfileIndex.add_many([user])
+
+    @staticmethod
+    def remove(uid):
+        ProfileIndex.index.remove(uid)
+        UsernameIndex.remove(uid)
+
+    @staticmethod
+    def search(q, offset=0, size=20, exclude=None):
+        return ProfileIndex.index.search(q, offset=offset, size=size, exclude=exclude)
+
+
+
+
+# Audio Index
+class AudioIndex:
+    '''Audios searchable by name and username of the user who added them.'''
+
+    # field: weight
+    WEIGHTS = {
+        'name': 3,
+        'username': 1,
+    }
+
+    index = SearchIndex('audios')
+
+    @staticmethod
+    def add_many(audios):
+        AudioIndex.index.add_many(
+            (str(audio.id), [(audio.name, AudioIndex.WEIGHTS['name']), (audio.user.username, AudioIndex.WEIGHTS['username'])], 0)
+            for audio in audios
+        )
+
+    @staticmethod
+    def add(audio):
+        AudioIndex.add_many([audio])
+
+    @staticmethod
+    def remove(audio_id):
+        AudioIndex.index.remove(str(audio_id))
+
+    @staticmethod
+    def search(q, offset=0, size=20):
+        return AudioIndex.index.search(q, offset=offset, size=size)
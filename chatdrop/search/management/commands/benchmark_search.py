@@ -0,0 +1,81 @@
+import time
+import random
+
+from django.core.management.base import BaseCommand
+from search.index import SearchIndex, ProfileIndex
+
+
+# Search benchmark
+class Command(BaseCommand):
+    help = 'Indexes synthetic users into a separate search index and reports query latencies, typeahead should stay under 20 ms.'
+
+    BATCH_SIZE = 5000
+    SYLLABLES = ['ka', 'ri', 'sha', 'an', 'vi', 'mo', 'ra', 'ja', 'ni', 'el', 'to', 'su', 'de', 'li', 'na', 'om', 'pra', 'kes', 'har', 'yu']
+    LOCATIONS = ['delhi', 'mumbai', 'pune', 'kolkata', 'chennai', 'london', 'paris', 'tokyo', 'berlin', 'toronto']
+    INTERESTS = ['music', 'travel', 'cricket', 'coding', 'movies', 'food', 'art', 'fitness', 'gaming', 'books']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000000, help='synthetic users indexed.')
+        parser.add_argument('--queries', type=int, default=2000, help='queries timed.')
+        parser.add_argument('--seed', type=int, default=7, help='random seed of synthetic data.')
+        parser.add_argument('--keep', action='store_true', help='keeps the benchmark index after running.')
+
+    def __name(self, rng):
+        return ''.join(rng.choice(self.SYLLABLES) for _ in range(rng.randint(2, 3)))
+
+    def __user(self, rng, i):
+        first_name = self.__name(rng)
+        last_name = self.__name(rng)
+        fields = {
+            'username': f'{first_name}_{last_name}_{rng.randint(1000, 9999)}',
+            'first_name': first_name,
+            'last_name': last_name,
+            'location': rng.choice(self.LOCATIONS),
+            'interest': ','.join(rng.sample(self.INTERESTS, 2)),
+        }
+        return (f'bench{i}', [(fields[field], weight) for field, weight in ProfileIndex.WEIGHTS.items()], int(rng.paretovariate(1.2)) - 1)
+
+    def __query(self, rng):
+        name = self.__name(rng)
+        kind = rng.random()
+        if kind < 0.6:
+            # typeahead of a single word
+            return name[:rng.randint(1, len(name))]
+        if kind < 0.9:
+            # full name with last word being typed
+            last_name = self.__name(rng)
+            return f'{name} {last_name[:rng.randint(1, len(last_name))]}'
+        return f'{name} {rng.choice(self.LOCATIONS)}'
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        index = SearchIndex('benchmark')
+        index.clear()
+
+        # indexing
+        started = time.perf_counter()
+        for start in range(0, options['users'], self.BATCH_SIZE):
+            index.add_many(self.__user(rng, i) for i in range(start, min(start + self.BATCH_SIZE, options['users'])))
+        self.stdout.write(f'{options["users"]} users indexed in {time.perf_counter() - started:.1f} s.')
+
+        # querying
+        timings = []
+        results = 0
+        for _ in range(options['queries']):
+            q = self.__query(rng)
+            started = time.perf_counter()
+            ranked, _ = index.search(q, size=10)
+            timings.append((time.perf_counter() - started) * 1000)
+            results += len(ranked)
+
+        timings.sort()
+        def percentile(p):
+            return timings[min(int(len(timings) * p), len(timings) - 1)]
+
+        self.stdout.write(f'{len(timings)} queries, {results / max(len(timings), 1):.1f} results per query.')
+        self.stdout.write(f'p50 {percentile(0.5):.2f} ms, p95 {percentile(0.95):.2f} ms, p99 {percentile(0.99):.2f} ms, max {timings[-1]:.2f} ms.')
+
+        if not options['keep']:
+            index.clear()
+
+        self.stdout.write(self.style.SUCCESS('Benchmark done.'))
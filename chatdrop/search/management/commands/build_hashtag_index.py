@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from post.models import PostHashTag
+from reel.models import ReelHashTag
+from search.hashtags import HashTagIndex
+from search.models import HashTag, HashTagPost, HashTagReel
+
+
+# Backfill hashtag index
+class Command(BaseCommand):
+    help = 'Builds hashtags and their post and reel postings from existing post and reel tags.'
+
+    BATCH_SIZE = 1000
+
+    def handle(self, *args, **options):
+        # creating hashtags
+        tags = {HashTagIndex.normalize(tag) for tag in PostHashTag.objects.filter(type='TAG').values_list('tag', flat=True).distinct()}
+        tags.update(HashTagIndex.normalize(tag) for tag in ReelHashTag.objects.filter(type='TAG').values_list('tag', flat=True).distinct())
+        tags.discard('')
+        HashTag.objects.bulk_create([HashTag(tag=tag) for tag in tags], batch_size=self.BATCH_SIZE, ignore_conflicts=True)
+        hashtags = dict(HashTag.objects.values_list('tag', 'id'))
+
+        # creating postings
+        postings = [
+            HashTagPost(hashtag_id=hashtags[HashTagIndex.normalize(tag)], post_id=post_id, posted_on=posted_on)
+            for post_id, tag, posted_on in PostHashTag.objects.filter(type='TAG').values_list('post', 'tag', 'post__posted_on').iterator()
+            if HashTagIndex.normalize(tag) in hashtags
+        ]
+        HashTagPost.objects.bulk_create(postings, batch_size=self.BATCH_SIZE, ignore_conflicts=True)
+
+        postings = [
+            HashTagReel(hashtag_id=hashtags[HashTagIndex.normalize(tag)], reel_id=reel_id, posted_on=posted_on)
+            for reel_id, tag, posted_on in ReelHashTag.objects.filter(type='TAG').values_list('reel', 'tag', 'reel__posted_on').iterator()
+            if HashTagIndex.normalize(tag) in hashtags
+        ]
+        HashTagReel.objects.bulk_create(postings, batch_size=self.BATCH_SIZE, ignore_conflicts=True)
+
+        # recounting postings
+        posts_counts = dict(HashTagPost.objects.values('hashtag').annotate(count=Count('id')).values_list('hashtag', 'count'))
+        reels_counts = dict(HashTagReel.objects.values('hashtag').annotate(count=Count('id')).values_list('hashtag', 'count'))
+        for hashtag in HashTag.objects.all().iterator():
+            HashTag.objects.filter(id=hashtag.id).update(
+                posts_count=posts_counts.get(hashtag.id, 0),
+                reels_count=reels_counts.get(hashtag.id, 0),
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'{len(hashtags)} hashtags indexed.'))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from account.models import User
+from reel.models import Audio
+from search.index import ProfileIndex, UsernameIndex, AudioIndex
+
+
+# Backfill search index
+class Command(BaseCommand):
+    help = 'Builds profile, username and audio search indexes from existing users and audios.'
+
+    BATCH_SIZE = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help='drops indexes before building, removes stale documents.')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            ProfileIndex.index.clear()
+            UsernameIndex.clear()
+            AudioIndex.index.clear()
+
+        users = User.objects.only('uid', 'is_admin', 'follower_count', *ProfileIndex.WEIGHTS.keys()).order_by('uid')
+        count = 0
+        batch = []
+        for user in users.iterator(chunk_size=self.BATCH_SIZE):
+            batch.append(user)
+            if len(batch) >= self.BATCH_SIZE:
+                ProfileIndex.add_many(batch)
+                count += len(batch)
+                batch = []
+        ProfileIndex.add_many(batch)
+        count += len(batch)
+        self.stdout.write(f'{count} users indexed.')
+
+        audios = Audio.objects.select_related('user').order_by('id')
+        count = 0
+        batch = []
+        for audio in audios.iterator(chunk_size=self.BATCH_SIZE):
+            batch.append(audio)
+            if len(batch) >= self.BATCH_SIZE:
+                AudioIndex.add_many(batch)
+                count += len(batch)
+                batch = []
+        AudioIndex.add_many(batch)
+        count += len(batch)
+        self.stdout.write(f'{count} audios indexed.')
+
+        self.stdout.write(self.style.SUCCESS('Search index built.'))
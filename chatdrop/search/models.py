@@ -1,3 +1,42 @@
 from django.db import models
 
-# Create your models here.
+
+# HashTag
+class HashTag(models.Model):
+    tag = models.CharField(max_length=100, unique=True)
+    posts_count = models.IntegerField(default=0)
+    reels_count = models.IntegerField(default=0)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'#{self.tag}'
+
+
+# HashTag Post
+class HashTagPost(models.Model):
+    hashtag = models.ForeignKey(HashTag, on_delete=models.CASCADE)
+    post = models.ForeignKey('post.Post', on_delete=models.CASCADE)
+    posted_on = models.DateTimeField(default=None)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hashtag', 'post'], name='unique_hashtag_post'),
+        ]
+        indexes = [
+            models.Index(fields=['hashtag', '-posted_on']),
+        ]
+
+
+# HashTag Reel
+class HashTagReel(models.Model):
+    hashtag = models.ForeignKey(HashTag, on_delete=models.CASCADE)
+    reel = models.ForeignKey('reel.Reel', on_delete=models.CASCADE)
+    posted_on = models.DateTimeField(default=None)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hashtag', 'reel'], name='unique_hashtag_reel'),
+        ]
+        indexes = [
+            models.Index(fields=['hashtag', '-posted_on']),
+        ]
@@ -1,61 +1,119 @@
 import reel.services as reel_services
 
-from django.db.models import Q
+from django.conf import settings
 from account.models import User
 from reel.models import Audio
-from django.core.paginator import Paginator
-from privacy.services import BlockedUserService
+from utils.pagination import Cursor, InvalidCursorError
+from friends.graph import SocialGraph
+from utils.counters import Counters
+from .models import HashTag
+from .hashtags import TrendingHashTags
+from .index import ProfileIndex, UsernameIndex, AudioIndex
 
 
 # Search
 class SearchService:
     @staticmethod
-    def query_profiles(auth_user, q, page):
-        q = q.strip()
-        query_list = q.split(' ')
-
-        profiles = User.objects.filter(
-            Q(location__in=query_list) | 
-            Q(interest__in=query_list) | 
-            Q(first_name__in=query_list) | 
-            Q(last_name__in=query_list) | 
-            Q(username__in=query_list)
+    def query_profiles(auth_user, q, page, cursor=None):
+        size = 100
+        values = Cursor.decode(cursor)
+        if values is not None:
+            if len(values) != 1 or not isinstance(values[0], int):
+                raise InvalidCursorError()
+            offset = values[0]
+        else:
+            offset = (int(page) - 1) * size if page is not None and int(page) > 1 else 0
+
+        # leaving out users who blocked the auth user before paging
+        ranked, has_next = ProfileIndex.search(
+            q, 
+            offset=offset, 
+            size=size, 
+            exclude=lambda uids: SocialGraph.has_members(auth_user, 'blocked_by', uids)
         )
 
-        pagination = Paginator(profiles, 100)
-        paginated_profiles = pagination.get_page(int(page))
+        profiles = {profile.uid: profile for profile in User.objects.filter(uid__in=[uid for uid, _ in ranked], is_admin=False)}
 
         result = []
-        for profile in paginated_profiles.object_list:
-
-            if not profile.is_admin and not BlockedUserService.is_blocked(user=profile ,blocked_user=auth_user):
-                
-                result.append({
-                    'uid': profile.uid,
-                    'name': profile.full_name,
-                    'username': profile.username,
-                    'gender': profile.gender,
-                    'photo': profile.photo_cdn_url,
-                    'message': profile.message,
-                })
+        for uid, _ in ranked:
+            if uid not in profiles:
+                continue
+
+            profile = profiles[uid]
+            result.append({
+                'uid': profile.uid,
+                'name': profile.full_name,
+                'username': profile.username,
+                'gender': profile.gender,
+                'photo': profile.photo_cdn_url,
+                'message': profile.message,
+            })
         
+        next_cursor = Cursor.encode([offset + size]) if has_next else None
+        return result, has_next, next_cursor
+    
+    @staticmethod
+    def complete_usernames(auth_user, q):
+        completions = UsernameIndex.complete(
+            q, 
+            size=settings.TYPEAHEAD_SIZE, 
+            viewer=auth_user.uid,
+            network=lambda: SocialGraph.members(auth_user, 'friends') | SocialGraph.members(auth_user, 'following'), 
+            exclude=lambda uids: SocialGraph.has_members(auth_user, 'blocked_by', uids) | {auth_user.uid}
+        )
+
+        users = {user.uid: user for user in User.objects.filter(uid__in=[uid for uid, _, _ in completions])}
+
+        result = []
+        for uid, _, is_network in completions:
+            if uid not in users:
+                continue
+
+            user = users[uid]
+            result.append({
+                'uid': user.uid,
+                'name': user.full_name,
+                'username': user.username,
+                'photo': user.photo_cdn_url,
+                'is_network': is_network,
+            })
+
         return result
     
     @staticmethod
     def query_audios(auth_user, q, page):
-        q = q.strip()
-        query_list = q.split(' ')
+        size = 100
+        offset = (int(page) - 1) * size if page is not None and int(page) > 1 else 0
 
-        audios = Audio.objects.filter(Q(name__in=query_list))
+        ranked, _ = AudioIndex.search(q, offset=offset, size=size)
 
-        pagination = Paginator(audios, 100)
-        paginated_audios = pagination.get_page(int(page))
+        audios = {str(audio.id): audio for audio in Audio.objects.filter(id__in=[audio_id for audio_id, _ in ranked]).select_related('user')}
 
         result = []
 
         audio_service = reel_services.AudioService
-        for audio in paginated_audios.object_list:
-            result.append(audio_service.to_json(audio=audio))
+        for audio_id, _ in ranked:
+            if audio_id in audios:
+                result.append(audio_service.to_json(audio=audios[audio_id]))
         
         return result
-            
\ No newline at end of file
+
+    @staticmethod
+    def trending_hashtags(count=20):
+        trending = TrendingHashTags.top(count)
+
+        hashtags = {hashtag.tag: hashtag for hashtag in Counters.merge(list(HashTag.objects.filter(tag__in=[tag for tag, _ in trending])))}
+
+        result = []
+        for tag, score in trending:
+            if tag not in hashtags:
+                continue
+
+            result.append({
+                'tag': tag,
+                'score': score,
+                'posts_count': hashtags[tag].posts_count,
+                'reels_count': hashtags[tag].reels_count,
+            })
+
+        return result
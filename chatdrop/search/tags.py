@@ -0,0 +1,52 @@
+from account.models import User
+
+
+# Tags
+class Tags:
+    '''Parsed hashtags field of a post or reel.'''
+    def __init__(self, mentioned, tags, urls):
+        self.mentioned = mentioned
+        self.tags = tags
+        self.urls = urls
+
+
+
+
+# Tag Parser
+class TagParser:
+    '''
+        Hashtags field of posts and reels, a comma separated list of '@username', '#tag' and urls.
+        1. mentions are resolved in a single username__in query, unknown usernames are dropped.
+        2. tag rows of a content are written with a single bulk_create.
+    '''
+
+    @staticmethod
+    def parse(hashtags) -> Tags:
+        usernames, tags, urls = [], [], []
+        for hashtag in str(hashtags or '').split(','):
+            hashtag = hashtag.strip()
+            if hashtag.startswith('@') and len(hashtag) > 1:
+                usernames.append(hashtag[1:])
+            elif hashtag.startswith('#') and len(hashtag) > 1:
+                tags.append(hashtag[1:])
+            elif hashtag.startswith('https://') or hashtag.startswith('http://'):
+                urls.append(hashtag)
+
+        mentioned = []
+        usernames = list(dict.fromkeys(usernames))
+        if len(usernames) > 0:
+            users = {user.username: user for user in User.objects.filter(username__in=usernames)}
+            mentioned = [users[username] for username in usernames if username in users]
+
+        return Tags(mentioned=mentioned, tags=list(dict.fromkeys(tags)), urls=list(dict.fromkeys(urls)))
+
+    @staticmethod
+    def save(model, field, content, tags: Tags):
+        '''writes tag rows of content, model is the hashtag model and field its foreign key to content.'''
+        length = model._meta.get_field('tag').max_length
+        rows = [model(**{field: content, 'type': 'USER', 'tag': f'@{user.username}::{user.uid}'[:length]}) for user in tags.mentioned]
+        rows.extend(model(**{field: content, 'type': 'TAG', 'tag': tag[:length]}) for tag in tags.tags)
+        rows.extend(model(**{field: content, 'type': 'URL', 'tag': url[:length]}) for url in tags.urls)
+
+        if len(rows) > 0:
+            model.objects.bulk_create(rows)
@@ -4,4 +4,6 @@ from . import views
 urlpatterns = [
     path('v1/search/profiles/', views.SearchProfiles.as_view(), name='search-profiles'),
     path('v1/search/audios/', views.SearchAudios.as_view(), name='search-audios'),
+    path('v1/search/usernames/', views.CompleteUsernames.as_view(), name='search-usernames'),
+    path('v1/search/hashtags/trending/', views.TrendingHashTags.as_view(), name='search-trending-hashtags'),
 ]
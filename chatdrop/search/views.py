@@ -3,7 +3,7 @@ from rest_framework.views import APIView
 from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated
 from account.permissions import IsRequestValid
-from account.throttling import AuthenticatedUserThrottling
+from account.throttling import AuthenticatedUserThrottling, TypeaheadThrottling
 from .services import SearchService
 from utils.debug import debug_print
 
@@ -19,12 +19,19 @@ class SearchProfiles(APIView):
             if request.query_params.get('q') == None:
                 return Response.error('No search query given.')
             else:
-                result = SearchService.query_profiles(request.user, request.query_params.get('q'), request.query_params.get('page'))
+                result, has_next, next_cursor = SearchService.query_profiles(
+                    request.user, 
+                    request.query_params.get('q'), 
+                    request.query_params.get('page'),
+                    cursor=request.query_params.get('cursor'),
+                )
             
             # sending response
             return Response.success({
                 'message': 'Search result.',
-                'result': result
+                'result': result,
+                'has_next': has_next,
+                'next_cursor': next_cursor,
             })
         except Exception as e:
             debug_print(e)
@@ -54,4 +61,51 @@ class SearchAudios(APIView):
             })
         except Exception as e:
             debug_print(e)
-            return Response.something_went_wrong()
\ No newline at end of file
+            return Response.something_went_wrong()
+
+
+
+
+# Trending HashTags
+class TrendingHashTags(APIView):
+    parser_classes = [JSONParser]
+    permission_classes = [IsRequestValid, IsAuthenticated]
+    throttle_classes = [AuthenticatedUserThrottling]
+
+    def get(self, request):
+        try:
+            result = SearchService.trending_hashtags()
+            
+            # sending response
+            return Response.success({
+                'message': 'Trending hashtags.',
+                'result': result
+            })
+        except Exception as e:
+            debug_print(e)
+            return Response.something_went_wrong()
+
+
+
+
+# Complete Usernames
+class CompleteUsernames(APIView):
+    parser_classes = [JSONParser]
+    permission_classes = [IsRequestValid, IsAuthenticated]
+    throttle_classes = [TypeaheadThrottling]
+
+    def get(self, request):
+        try:
+            if request.query_params.get('q') == None:
+                return Response.error('No search query given.')
+            else:
+                result = SearchService.complete_usernames(request.user, request.query_params.get('q'))
+            
+            # sending response
+            return Response.success({
+                'message': 'Usernames.',
+                'result': result
+            })
+        except Exception as e:
+            debug_print(e)
+            return Response.something_went_wrong()
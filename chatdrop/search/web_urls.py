@@ -4,4 +4,6 @@ from . import web_views
 urlpatterns = [
     path('v1/search/profiles/', web_views.SearchProfiles.as_view(), name='web-search-profiles'),
     path('v1/search/audios/', web_views.SearchAudios.as_view(), name='web-search-audios'),
+    path('v1/search/usernames/', web_views.CompleteUsernames.as_view(), name='web-search-usernames'),
+    path('v1/search/hashtags/trending/', web_views.TrendingHashTags.as_view(), name='web-search-trending-hashtags'),
 ]
@@ -14,11 +14,18 @@ class Story(models.Model):
     content_type = models.CharField(default='TEXT', choices=(('TEXT', 'Text'), ('PHOTO', 'Photo'), ('VIDEO', 'Video')), max_length=20)
     content = models.FileField(upload_to=_upload_to_path)
     text = models.CharField(default='', max_length=1000, blank=True)
+    variants = models.JSONField(default=list, blank=True)
+    placeholder = models.TextField(default='', blank=True)
     views_count = models.IntegerField(default=0)
     likes_count = models.IntegerField(default=0)
     posted_on = models.DateTimeField(default=None)
     active_until = models.DateTimeField(default=None)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-posted_on']),
+        ]
+
     @property
     def is_active(self):
         return self.active_until >= timezone.now()
@@ -33,4 +40,9 @@ class Story(models.Model):
 # Story Views
 class StoryView(models.Model):
     story = models.ForeignKey(Story, on_delete=models.CASCADE)
-    seen_by = models.ForeignKey('account.User', on_delete=models.CASCADE)
\ No newline at end of file
+    seen_by = models.ForeignKey('account.User', on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['story', 'seen_by'], name='unique_story_view'),
+        ]
\ No newline at end of file
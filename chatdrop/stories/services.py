@@ -4,6 +4,10 @@ from datetime import timedelta
 from utils import generator, time
 from account.services import UserService
 from .exceptions import StoryError
+from utils.image_processing import ImageDetection, InvalidImageError
+from utils.derivatives import ImageDerivatives, ImageDerivativeQueue
+from utils.counters import Counters
+from utils.view_tracker import ViewTracker
 from friends.services import FriendService
 from deprecated.sphinx import deprecated
 
@@ -75,6 +79,10 @@ class StoryService:
             )
             
         elif content_type == 'PHOTO':
+            prediction = ImageDetection.process(image_bytes=data.get('photo').file)
+            if not prediction.is_safe:
+                raise InvalidImageError('Nude Image found')
+
             story = Story.objects.create(
                 id=generator.generate_identity(),
                 user=auth_user, 
@@ -84,6 +92,7 @@ class StoryService:
                 posted_on=posted_on,
                 active_until=active_until
             )
+            ImageDerivativeQueue.push(story)
         
         elif content_type == 'VIDEO':
             story = Story.objects.create(
@@ -110,7 +119,7 @@ class StoryService:
     
     @staticmethod
     def list_all(user):
-        stories = Story.objects.filter(user=user).order_by('posted_on')
+        stories = Counters.merge(list(Story.objects.filter(user=user).order_by('posted_on')))
 
         story_list = []
         for story in stories:
@@ -125,6 +134,8 @@ class StoryService:
                     'id': story.id,
                     'content_type': story.content_type,
                     'content': story.content_cdn_url,
+                    'variants': ImageDerivatives.to_json(story.variants),
+                    'placeholder': story.placeholder,
                     'text': story.text,
                     'posted_on': time_ago,
                     'likes_count': story.likes_count
@@ -152,12 +163,8 @@ class StoryService:
     def add_story_view(auth_user, story_id):
         story = StoryService.get_story(story_id)
 
-        # adding view to a story
-        if not StoryView.objects.filter(story=story, seen_by=auth_user).exists():
-            StoryView.objects.create(story=story, seen_by=auth_user)
-
-            story.views_count += 1
-            story.save()
+        # recording view, written to database by flush_views command
+        ViewTracker.track('stories.Story', [story.id], auth_user)
     
     @staticmethod
     def list_all_story_views(auth_user, story_id):
@@ -0,0 +1,130 @@
+import uuid
+import datetime
+
+from django.apps import apps
+from django.utils import timezone
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django_redis import get_redis_connection
+
+
+class Counters:
+    '''
+        Counter columns incremented in redis and written to database by flush_counters command.
+        1. increments are held as pending deltas in a redis hash, so hot rows are not locked on every like or view.
+        2. pending deltas are flushed with F() expressions, counters never go below zero.
+        3. reads merge pending deltas and deltas being flushed into instances with merge, in a single round trip,
+           deltas of a batch already committed are not merged again.
+        4. every flushed batch is recorded in the same transaction as its updates, so a resumed batch is never applied twice.
+    '''
+
+    # model label: counter fields
+    FIELDS = {
+        'account.User': ('post_count', 'follower_count', 'following_count', 'friend_count', 'reel_count'),
+        'post.Post': ('likes_count', 'comments_count'),
+        'post.PostComment': ('likes_count',),
+        'reel.Reel': ('views_count', 'likes_count', 'comments_count'),
+        'reel.ReelComment': ('likes_count',),
+        'stories.Story': ('views_count', 'likes_count'),
+        'search.HashTag': ('posts_count', 'reels_count'),
+    }
+
+    KEY = 'counters:pending'
+    FLUSH_KEY = 'counters:flushing'
+    BATCH_FIELD = 'batch' # field of FLUSH_KEY holding id of the batch
+    BATCH_KEEP_DAYS = 7 # recorded batches are kept for this long
+
+    @staticmethod
+    def __field(label, pk, field):
+        return f'{label}:{pk}:{field}'
+
+    @staticmethod
+    def incr(instance, field, amount=1):
+        '''adds amount to a counter field of instance, instance must be of a model registered in FIELDS.'''
+        Counters.incr_many(instance._meta.label, [instance.pk], field, amount)
+
+    @staticmethod
+    def incr_many(label, pks, field, amount=1):
+        '''adds amount to a counter field of rows of a registered model by primary keys.'''
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        for pk in pks:
+            pipe.hincrby(Counters.KEY, Counters.__field(label, pk, field), amount)
+        pipe.execute()
+
+    @staticmethod
+    def decr(instance, field, amount=1):
+        Counters.incr(instance, field, -amount)
+
+    @staticmethod
+    def merge(instances):
+        '''adds pending deltas to counter fields of registered model instances, returns instances.'''
+        fields = [
+            (instance, field)
+            for instance in instances
+            for field in Counters.FIELDS.get(instance._meta.label, ())
+        ]
+        if len(fields) == 0:
+            return instances
+
+        keys = [Counters.__field(instance._meta.label, instance.pk, field) for instance, field in fields]
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        pipe.hmget(Counters.KEY, keys)
+        pipe.hmget(Counters.FLUSH_KEY, keys)
+        pipe.hget(Counters.FLUSH_KEY, Counters.BATCH_FIELD)
+        pending, flushing, batch = pipe.execute()
+
+        # deltas of a batch committed but not yet cleaned up are already in instances loaded from database
+        if batch is not None and apps.get_model('account.CounterFlush').objects.filter(batch=batch.decode('utf-8')).exists():
+            flushing = [None] * len(keys)
+
+        for (instance, field), delta, flushing_delta in zip(fields, pending, flushing):
+            delta = int(delta or 0) + int(flushing_delta or 0)
+            if delta != 0:
+                setattr(instance, field, max(getattr(instance, field) + delta, 0))
+
+        return instances
+
+    @staticmethod
+    def flush():
+        '''writes pending deltas to database, returns {model label: [pk]} of updated rows.'''
+        redis = get_redis_connection('default')
+
+        # moving pending deltas aside with a new batch id so new increments are not lost while flushing,
+        # a flush interrupted before completion is resumed first
+        if not redis.exists(Counters.FLUSH_KEY):
+            if not redis.exists(Counters.KEY):
+                return {}
+            pipe = redis.pipeline()
+            pipe.rename(Counters.KEY, Counters.FLUSH_KEY)
+            pipe.hset(Counters.FLUSH_KEY, Counters.BATCH_FIELD, uuid.uuid4().hex)
+            pipe.execute()
+
+        entries = redis.hgetall(Counters.FLUSH_KEY)
+        batch = entries.pop(Counters.BATCH_FIELD.encode('utf-8'), b'').decode('utf-8') or uuid.uuid4().hex
+
+        rows = {}
+        for key, delta in entries.items():
+            label, key = key.decode('utf-8').split(':', 1)
+            pk, field = key.rsplit(':', 1)
+            if int(delta) != 0:
+                rows.setdefault((label, pk), {})[field] = int(delta)
+
+        CounterFlush = apps.get_model('account.CounterFlush')
+        with transaction.atomic():
+            # skipping a batch applied before an interrupted cleanup
+            _, created = CounterFlush.objects.get_or_create(batch=batch)
+            if created:
+                for (label, pk), deltas in rows.items():
+                    apps.get_model(label).objects.filter(pk=pk).update(**{
+                        field: Greatest(F(field) + delta, 0) for field, delta in deltas.items()
+                    })
+
+            CounterFlush.objects.filter(flushed_on__lt=timezone.now() - datetime.timedelta(days=Counters.BATCH_KEEP_DAYS)).delete()
+
+        redis.delete(Counters.FLUSH_KEY)
+
+        updated = {}
+        for label, pk in rows.keys():
+            updated.setdefault(label, []).append(pk)
+        return updated
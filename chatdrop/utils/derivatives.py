@@ -0,0 +1,121 @@
+import io
+import json
+import base64
+import posixpath
+
+from PIL import Image, ImageOps, features
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django_redis import get_redis_connection
+
+
+class ImageDerivatives:
+    '''
+        Resized and re-encoded variants of uploaded images with a tiny placeholder (LQIP).
+        1. variants are encoded as webp, or jpeg where webp is not supported, at settings.IMAGE_DERIVATIVE_WIDTHS.
+        2. images are decoded at reduced scale where the format allows (jpeg draft) and downscaled progressively.
+        3. models registered in FIELDS hold the results in variants and placeholder fields.
+    '''
+
+    # model label: (image field, variants field, placeholder field)
+    FIELDS = {
+        'post.PostPhoto': ('photo', 'variants', 'placeholder'),
+        'account.ProfilePhoto': ('photo', 'variants', 'placeholder'),
+        'account.ProfileCoverPhoto': ('cover_photo', 'variants', 'placeholder'),
+        'stories.Story': ('content', 'variants', 'placeholder'),
+        'reel.ReelVideo': ('thumbnail', 'thumbnail_variants', 'thumbnail_placeholder'),
+    }
+
+    PLACEHOLDER_WIDTH = 16
+
+    @staticmethod
+    def __format():
+        return ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+
+    @staticmethod
+    def __name(name, width, extension):
+        directory, filename = posixpath.split(name)
+        return posixpath.join(directory, 'derivatives', f'{posixpath.splitext(filename)[0]}-{width}w.{extension}')
+
+    @staticmethod
+    def __encode(image, format, quality):
+        buffer = io.BytesIO()
+        image.save(buffer, format=format, quality=quality)
+        return buffer.getvalue()
+
+    @staticmethod
+    def generate(file, name):
+        '''returns (variants, placeholder) of image file, variants are [{'name', 'width', 'height'}] largest first.'''
+        format, extension = ImageDerivatives.__format()
+        widths = sorted(settings.IMAGE_DERIVATIVE_WIDTHS, reverse=True)
+
+        with Image.open(file) as image:
+            # decoding only as much resolution as the largest variant needs
+            image.draft('RGB', (widths[0], widths[0]))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+
+            variants = []
+            for width in widths:
+                if width >= image.width and len(variants) > 0:
+                    continue
+
+                image.thumbnail((width, image.height), Image.LANCZOS)
+                variant_name = ImageDerivatives.__name(name, image.width, extension)
+                variant_name = default_storage.save(variant_name, ContentFile(ImageDerivatives.__encode(image, format, 80)))
+                variants.append({'name': variant_name, 'width': image.width, 'height': image.height})
+
+            image.thumbnail((ImageDerivatives.PLACEHOLDER_WIDTH, image.height), Image.LANCZOS)
+            placeholder = base64.b64encode(ImageDerivatives.__encode(image, format, 30)).decode('ascii')
+            placeholder = f'data:image/{extension if extension != "jpg" else "jpeg"};base64,{placeholder}'
+
+        return variants, placeholder
+
+    @staticmethod
+    def process(model, id):
+        '''generates derivatives of a registered model instance and records them on it.'''
+        image_field, variants_field, placeholder_field = ImageDerivatives.FIELDS[model]
+        instance = apps.get_model(model).objects.get(id=id)
+
+        field = getattr(instance, image_field)
+        if not field:
+            return
+
+        with field.open('rb') as file:
+            variants, placeholder = ImageDerivatives.generate(file, field.name)
+
+        setattr(instance, variants_field, variants)
+        setattr(instance, placeholder_field, placeholder)
+        instance.save(update_fields=[variants_field, placeholder_field])
+
+    @staticmethod
+    def to_json(variants):
+        '''srcset style list of variants with cdn urls.'''
+        return [{
+            'url': settings.CDN_MEDIA_URL + variant['name'],
+            'width': variant['width'],
+            'height': variant['height'],
+        } for variant in variants]
+
+
+
+class ImageDerivativeQueue:
+    '''Queue of uploaded images waiting for derivatives, consumed by generate_derivatives command.'''
+
+    KEY = 'derivatives:queue'
+
+    @staticmethod
+    def push(instance):
+        '''instance must be of a model registered in ImageDerivatives.FIELDS.'''
+        job = {'model': instance._meta.label, 'id': instance.id}
+        get_redis_connection('default').rpush(ImageDerivativeQueue.KEY, json.dumps(job))
+
+    @staticmethod
+    def pop(timeout=5):
+        '''returns (model, id) of next job or None if queue stays empty for timeout seconds.'''
+        job = get_redis_connection('default').blpop(ImageDerivativeQueue.KEY, timeout=timeout)
+        if job is None:
+            return None
+        job = json.loads(job[1])
+        return job['model'], job['id']
@@ -1,5 +1,12 @@
+import io
 import json
+import hashlib
+import threading
 
+from PIL import Image
+from django.conf import settings
+from django_redis import get_redis_connection
+from django.utils.module_loading import import_string
 from google.cloud import vision
 from google.cloud.vision import Feature
 from .debug import debug_print
@@ -19,43 +26,36 @@ class ImageDetectionPrediction:
         self.labels = labels
 
 
-class ImageDetection:
-    '''Images processing using Google Vision API.'''
 
-    def __init__(self):
-        self.client = vision.ImageAnnotatorClient()
+class VisionDetectionBackend:
+    '''Image detection backend using Google Vision API with a single long lived client.'''
+
+    BATCH_SIZE = 16 # images per batch annotate request allowed by vision api
+
+    __client = None
+    __lock = threading.Lock()
 
     @staticmethod
-    def get_instance():
-        return ImageDetection()
+    def get_client():
+        if VisionDetectionBackend.__client is None:
+            with VisionDetectionBackend.__lock:
+                if VisionDetectionBackend.__client is None:
+                    VisionDetectionBackend.__client = vision.ImageAnnotatorClient()
+        return VisionDetectionBackend.__client
 
-    def __load_image(self, image_bytes):
+    def __make_request(self, image_bytes):
         image = vision.Image()
         image.content = image_bytes
-        return image
-    
-    def __make_request(self, image):
         features = [Feature(type_=Feature.Type.LABEL_DETECTION), Feature(type_=Feature.Type.SAFE_SEARCH_DETECTION)]
-        request = vision.AnnotateImageRequest(image=image, features=features)
-        return request
-    
+        return vision.AnnotateImageRequest(image=image, features=features)
+
     def __serialize_reponse(self, response: vision.AnnotateImageResponse):
         response_json = vision.AnnotateImageResponse.to_json(response)
         return json.loads(response_json)
 
-    @staticmethod
-    def process(image_bytes) -> ImageDetectionPrediction:
-        '''
-            1. requires io.bytesIO to process.
-            2. extract labels according to objects found in image.
-        '''
-        image_bytes = image_bytes.read()
-        processing = ImageDetection.get_instance()
-        image = processing.__load_image(image_bytes)
-        request = processing.__make_request(image=image)
-        response = processing.client.annotate_image(request=request)
-        response = processing.__serialize_reponse(response)
-        
+    def __predict(self, response) -> ImageDetectionPrediction:
+        response = self.__serialize_reponse(response)
+
         is_safe = True
         if response['safeSearchAnnotation']['adult'] == vision.Likelihood.VERY_LIKELY:
             is_safe = False
@@ -64,8 +64,193 @@ class ImageDetection:
         for label_dict in response['labelAnnotations']:
             if int(label_dict['score'] * 100) > 80:
                 labels.append(str(label_dict['description']).lower())
-        
+
         debug_print(is_safe)
         debug_print(labels)
-        
-        return ImageDetectionPrediction(is_safe=is_safe, labels=labels)
\ No newline at end of file
+
+        return ImageDetectionPrediction(is_safe=is_safe, labels=labels)
+
+    def detect(self, images: list) -> list:
+        '''returns prediction of every image bytes in the list, batched in a round trip per 16 images.'''
+        client = VisionDetectionBackend.get_client()
+
+        predictions = []
+        for i in range(0, len(images), VisionDetectionBackend.BATCH_SIZE):
+            requests = [self.__make_request(image_bytes) for image_bytes in images[i:i + VisionDetectionBackend.BATCH_SIZE]]
+            response = client.batch_annotate_images(requests=requests)
+            predictions += [self.__predict(res) for res in response.responses]
+
+        return predictions
+
+
+
+class StubDetectionBackend:
+    '''Local image detection backend for tests and development, marks every image with the same prediction.'''
+
+    is_safe = True
+    labels = []
+
+    def detect(self, images: list) -> list:
+        return [ImageDetectionPrediction(is_safe=self.is_safe, labels=list(self.labels)) for _ in images]
+
+
+
+class ImageDetectionCache:
+    '''
+        Detection results cached by image content so re-uploaded images skip the detection backend.
+        1. identical images are matched by sha256 of their bytes.
+        2. near identical images are matched by 64 bit difference hash (dHash) within IMAGE_DETECTION_HASH_DISTANCE bits.
+        3. dHashes are indexed by 4 bands of 16 bits, near hashes within 3 bits share at least one band.
+    '''
+
+    BANDS = 4
+
+    @staticmethod
+    def __sha_key(sha):
+        return f'detection:sha:{sha}'
+
+    @staticmethod
+    def __dhash_key(dhash):
+        return f'detection:dhash:{dhash:016x}'
+
+    @staticmethod
+    def __band_keys(dhash):
+        return [f'detection:band:{i}:{(dhash >> (16 * i)) & 0xffff:04x}' for i in range(ImageDetectionCache.BANDS)]
+
+    @staticmethod
+    def dhash(image_bytes):
+        '''difference hash of image, None if image cannot be decoded.'''
+        try:
+            image = Image.open(io.BytesIO(image_bytes)).convert('L').resize((9, 8), Image.LANCZOS)
+        except Exception:
+            return None
+
+        pixels = list(image.getdata())
+        value = 0
+        for row in range(8):
+            for col in range(8):
+                value = (value << 1) | int(pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+        return value
+
+    @staticmethod
+    def __load(verdict):
+        verdict = json.loads(verdict)
+        return ImageDetectionPrediction(is_safe=verdict['is_safe'], labels=verdict['labels'])
+
+    @staticmethod
+    def get_many(images: list):
+        '''returns (predictions, hashes) of image bytes, prediction is None for images not found.'''
+        redis = get_redis_connection('default')
+        hashes = [(hashlib.sha256(image_bytes).hexdigest(), None) for image_bytes in images]
+        predictions = [None for _ in images]
+
+        # exact matches
+        verdicts = redis.mget([ImageDetectionCache.__sha_key(sha) for sha, _ in hashes])
+        for i, verdict in enumerate(verdicts):
+            if verdict is not None:
+                predictions[i] = ImageDetectionCache.__load(verdict)
+        exact_hits = len([prediction for prediction in predictions if prediction is not None])
+
+        # near matches
+        misses = [i for i, prediction in enumerate(predictions) if prediction is None]
+        for i in misses:
+            hashes[i] = (hashes[i][0], ImageDetectionCache.dhash(images[i]))
+        misses = [i for i in misses if hashes[i][1] is not None]
+
+        pipe = redis.pipeline(transaction=False)
+        for i in misses:
+            pipe.sunion(ImageDetectionCache.__band_keys(hashes[i][1]))
+        candidates = pipe.execute()
+
+        nearest = {}
+        for i, members in zip(misses, candidates):
+            distances = [(bin(int(member, 16) ^ hashes[i][1]).count('1'), int(member, 16)) for member in members]
+            distances = [distance for distance in distances if distance[0] <= settings.IMAGE_DETECTION_HASH_DISTANCE]
+            if len(distances) > 0:
+                nearest[i] = min(distances)[1]
+
+        if len(nearest) > 0:
+            verdicts = redis.mget([ImageDetectionCache.__dhash_key(dhash) for dhash in nearest.values()])
+            for i, verdict in zip(nearest.keys(), verdicts):
+                if verdict is not None:
+                    predictions[i] = ImageDetectionCache.__load(verdict)
+        near_hits = len([prediction for prediction in predictions if prediction is not None]) - exact_hits
+
+        # hit metrics
+        pipe = redis.pipeline(transaction=False)
+        pipe.hincrby('detection:metrics', 'exact_hits', exact_hits)
+        pipe.hincrby('detection:metrics', 'near_hits', near_hits)
+        pipe.hincrby('detection:metrics', 'misses', len(images) - exact_hits - near_hits)
+        pipe.execute()
+
+        return predictions, hashes
+
+    @staticmethod
+    def set_many(hashes: list, predictions: list):
+        '''caches predictions against (sha256, dhash) of images.'''
+        timeout = settings.IMAGE_DETECTION_CACHE_SECONDS
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        for (sha, dhash), prediction in zip(hashes, predictions):
+            verdict = json.dumps({'is_safe': prediction.is_safe, 'labels': prediction.labels})
+            pipe.set(ImageDetectionCache.__sha_key(sha), verdict, ex=timeout)
+
+            if dhash is not None:
+                pipe.set(ImageDetectionCache.__dhash_key(dhash), verdict, ex=timeout)
+                for key in ImageDetectionCache.__band_keys(dhash):
+                    pipe.sadd(key, f'{dhash:016x}')
+                    pipe.expire(key, timeout)
+        pipe.execute()
+
+    @staticmethod
+    def metrics():
+        '''returns hit and miss counters with hit rate.'''
+        counters = get_redis_connection('default').hgetall('detection:metrics')
+        counters = {key.decode('utf-8'): int(value) for key, value in counters.items()}
+        metrics = {
+            'exact_hits': counters.get('exact_hits', 0),
+            'near_hits': counters.get('near_hits', 0),
+            'misses': counters.get('misses', 0),
+        }
+        total = metrics['exact_hits'] + metrics['near_hits'] + metrics['misses']
+        metrics['hit_rate'] = 0 if total == 0 else (metrics['exact_hits'] + metrics['near_hits']) / total
+        return metrics
+
+
+
+class ImageDetection:
+    '''Images processing using configured detection backend, settings.IMAGE_DETECTION_BACKEND.'''
+
+    __backend = None
+
+    @staticmethod
+    def get_backend():
+        if ImageDetection.__backend is None:
+            ImageDetection.__backend = import_string(settings.IMAGE_DETECTION_BACKEND)()
+        return ImageDetection.__backend
+
+    @staticmethod
+    def process(image_bytes) -> ImageDetectionPrediction:
+        '''
+            1. requires io.bytesIO to process.
+            2. extract labels according to objects found in image.
+        '''
+        return ImageDetection.process_many([image_bytes])[0]
+
+    @staticmethod
+    def process_many(images: list) -> list:
+        '''processes list of io.bytesIO in a single batch, returns predictions in same order.'''
+        images = [image_bytes.read() for image_bytes in images]
+        if len(images) == 0:
+            return []
+
+        # detecting only images not seen before
+        predictions, hashes = ImageDetectionCache.get_many(images)
+        misses = [i for i, prediction in enumerate(predictions) if prediction is None]
+
+        if len(misses) > 0:
+            detected = ImageDetection.get_backend().detect([images[i] for i in misses])
+            for i, prediction in zip(misses, detected):
+                predictions[i] = prediction
+            ImageDetectionCache.set_many([hashes[i] for i in misses], detected)
+
+        return predictions
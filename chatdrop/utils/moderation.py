@@ -0,0 +1,40 @@
+import json
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+
+class ModerationQueue:
+    '''
+        Queue of posts and reels published pending, consumed by moderate_media command.
+        1. failed jobs are queued again behind other jobs with their attempts counted.
+        2. jobs failing IMAGE_DETECTION_MAX_ATTEMPTS times are moved to a dead letter list, left pending for review.
+    '''
+
+    KEY = 'moderation:queue'
+    DEAD_KEY = 'moderation:dead'
+
+    @staticmethod
+    def push(type, id, attempts=0):
+        '''type is POST or REEL.'''
+        get_redis_connection('default').rpush(ModerationQueue.KEY, json.dumps({'type': type, 'id': id, 'attempts': attempts}))
+
+    @staticmethod
+    def pop(timeout=5):
+        '''returns (type, id, attempts) of next job or None if queue stays empty for timeout seconds.'''
+        job = get_redis_connection('default').blpop(ModerationQueue.KEY, timeout=timeout)
+        if job is None:
+            return None
+        job = json.loads(job[1])
+        return job['type'], job['id'], job.get('attempts', 0)
+
+    @staticmethod
+    def retry(type, id, attempts):
+        '''queues a failed job again, returns False if it was moved to dead letter list instead.'''
+        attempts += 1
+        if attempts >= settings.IMAGE_DETECTION_MAX_ATTEMPTS:
+            get_redis_connection('default').rpush(ModerationQueue.DEAD_KEY, json.dumps({'type': type, 'id': id, 'attempts': attempts}))
+            return False
+
+        ModerationQueue.push(type, id, attempts)
+        return True
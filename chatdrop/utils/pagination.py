@@ -0,0 +1,93 @@
+import json
+import base64
+
+from datetime import datetime
+from django.db.models import Q
+
+
+class InvalidCursorError(Exception):
+    '''Invalid Cursor error'''
+    def __init__(self, message='Invalid Cursor Error'):
+        self.message = message
+        super().__init__(self.message)
+
+
+
+class Cursor:
+    '''Opaque pagination cursor holding the ordering values of the last item of a page.'''
+
+    @staticmethod
+    def encode(values: list) -> str:
+        values = [{'dt': value.isoformat()} if isinstance(value, datetime) else value for value in values]
+        cursor = json.dumps(values, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(cursor).decode('ascii')
+
+    @staticmethod
+    def decode(cursor) -> list:
+        '''returns None if no cursor is given.'''
+        if cursor is None or cursor == '':
+            return None
+
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return [datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value for value in values]
+        except Exception:
+            raise InvalidCursorError()
+
+
+
+class CursorPage:
+    '''Cursor Page container, similar to django Page.'''
+    def __init__(self, object_list, has_next, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.__has_next = has_next
+
+    def has_next(self):
+        return self.__has_next
+
+
+
+class CursorPaginator:
+    '''
+        Keyset (cursor) paginator which never counts the queryset.
+        1. ordering must end with an unique field to keep pages stable, e.g. ('-posted_on', '-id').
+        2. page numbers are still served for older clients with a bounded slice and no count.
+    '''
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset.order_by(*ordering)
+        self.ordering = ordering
+        self.per_page = per_page
+
+    def __after(self, values):
+        '''filter selecting rows ordered after the given ordering values.'''
+        query = Q()
+        for i, order in enumerate(self.ordering):
+            lookup = 'lt' if order.startswith('-') else 'gt'
+            condition = Q(**{f'{order.lstrip("-")}__{lookup}': values[i]})
+            for j in range(i):
+                condition &= Q(**{self.ordering[j].lstrip('-'): values[j]})
+            query |= condition
+        return query
+
+    def get_page(self, cursor=None, page=None) -> CursorPage:
+        values = Cursor.decode(cursor)
+
+        if values is not None:
+            if len(values) != len(self.ordering):
+                raise InvalidCursorError()
+            objects = list(self.queryset.filter(self.__after(values))[:self.per_page + 1])
+        else:
+            offset = (int(page) - 1) * self.per_page if page is not None and int(page) > 1 else 0
+            objects = list(self.queryset[offset:offset + self.per_page + 1])
+
+        has_next = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+
+        next_cursor = None
+        if has_next:
+            last = objects[-1]
+            next_cursor = Cursor.encode([getattr(last, order.lstrip('-')) for order in self.ordering])
+
+        return CursorPage(objects, has_next, next_cursor)
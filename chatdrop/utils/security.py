@@ -1,13 +1,98 @@
-from AesEverywhere import aes256
+import os
+import time
+import base64
+import hashlib
+import threading
+import functools
+
+from collections import OrderedDict
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+
+def derive_key_and_iv(passphrase, salt):
+    '''openssl EVP_BytesToKey with md5, returns (key, iv) of AES-256-CBC for passphrase and salt.'''
+    passphrase = passphrase.encode('utf-8')
+    derived = block = b''
+    while len(derived) < 48:
+        block = hashlib.md5(block + passphrase + salt).digest()
+        derived += block
+    return derived[:32], derived[32:48]
+
+
+# derivations of ciphertexts decrypted again with the server key, like encrypted tokens validated on every request
+cached_derive_key_and_iv = functools.lru_cache(maxsize=1024)(derive_key_and_iv)
+
 
 class AES256:
-    def __init__(self, key):
+    '''
+        AES-256-CBC in the openssl 'Salted__' base64 format of AesEverywhere, ciphertexts of both are interchangeable.
+        1. every encryption uses a random salt, key and iv are derived from passphrase and salt.
+        2. derivations of decryptions are cached only with cached, meant for the server key,
+           so secret keys of users are never held by the cache and chat messages never evict it.
+    '''
+    def __init__(self, key, cached=False):
         self.key = key
+        self.cached = cached
 
     def encrypt(self, raw):
-        cipher = aes256.encrypt(raw, self.key)
-        return cipher.decode('utf-8')
+        salt = os.urandom(8)
+        key, iv = derive_key_and_iv(self.key, salt)
+
+        padder = padding.PKCS7(algorithms.AES.block_size).padder()
+        data = padder.update(raw.encode('utf-8')) + padder.finalize()
+
+        encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+        cipher = b'Salted__' + salt + encryptor.update(data) + encryptor.finalize()
+        return base64.b64encode(cipher).decode('utf-8')
 
     def decrypt(self, cipher):
-        raw = aes256.decrypt(cipher.encode('utf-8'), self.key)
-        return raw.decode('utf-8')
\ No newline at end of file
+        cipher = base64.b64decode(cipher.encode('utf-8'))
+        if cipher[:8] != b'Salted__':
+            raise ValueError('Invalid cipher.')
+
+        derive = cached_derive_key_and_iv if self.cached else derive_key_and_iv
+        key, iv = derive(self.key, cipher[8:16])
+
+        decryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).decryptor()
+        data = decryptor.update(cipher[16:]) + decryptor.finalize()
+
+        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+        raw = unpadder.update(data) + unpadder.finalize()
+        return raw.decode('utf-8')
+
+
+
+class TTLCache:
+    '''Bounded in-process cache of values expiring after ttl seconds, least recently used values are evicted first.'''
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        '''returns None if key is missing or expired.'''
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.__entries[key]
+                return None
+
+            self.__entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.__lock:
+            self.__entries[key] = (value, time.monotonic() + self.ttl)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.__lock:
+            self.__entries.pop(key, None)
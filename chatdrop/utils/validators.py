@@ -32,6 +32,15 @@ def is_empty(text):
         return True
     return False
 
+# check whether the prekeys are a list of {id, key} with integer ids
+def is_prekeys(prekeys):
+    if not isinstance(prekeys, list):
+        return False
+    for prekey in prekeys:
+        if not isinstance(prekey, dict) or not isinstance(prekey.get('id'), int) or isinstance(prekey.get('id'), bool) or is_empty(prekey.get('key')):
+            return False
+    return True
+
 # check whether the text contains a script or not
 def contains_script(text):
     text = str(text)
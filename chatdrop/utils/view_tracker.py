@@ -0,0 +1,110 @@
+import json
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django_redis import get_redis_connection
+from .counters import Counters
+
+
+class ViewTracker:
+    '''
+        View events of reels and stories deduplicated in redis, view rows are written later by flush_views command.
+        1. viewers of a content are held in a redis set loaded from database on first view, only first view of a viewer is recorded.
+        2. views_count of content is incremented through Counters as soon as a view is recorded.
+        3. recorded views are bulk inserted ignoring rows already present.
+        4. views are moved to a processing list while inserted and dropped only once the insert commits, so failed flushes are retried.
+    '''
+
+    # model label: (view model label, content field, viewer field)
+    MODELS = {
+        'reel.Reel': ('reel.ReelView', 'reel', 'seen_by'),
+        'stories.Story': ('stories.StoryView', 'story', 'seen_by'),
+    }
+
+    KEY = 'views:pending'
+    PROCESSING_KEY = 'views:processing'
+
+    @staticmethod
+    def __seen_key(label, pk):
+        return f'views:seen:{label}:{pk}'
+
+    @staticmethod
+    def __load(redis, label, pks):
+        '''loads viewer sets of contents not cached yet, sets hold an empty member so contents without views are cached too.'''
+        pipe = redis.pipeline(transaction=False)
+        for pk in pks:
+            pipe.exists(ViewTracker.__seen_key(label, pk))
+        missing = [pk for pk, exists in zip(pks, pipe.execute()) if not exists]
+        if len(missing) == 0:
+            return
+
+        view_label, content_field, viewer_field = ViewTracker.MODELS[label]
+        viewers = {pk: [''] for pk in missing}
+        views = apps.get_model(view_label).objects.filter(**{f'{content_field}__in': missing}).values_list(content_field, viewer_field)
+        for pk, uid in views:
+            viewers[pk].append(uid)
+
+        pipe = redis.pipeline(transaction=False)
+        for pk, uids in viewers.items():
+            pipe.sadd(ViewTracker.__seen_key(label, pk), *uids)
+            pipe.expire(ViewTracker.__seen_key(label, pk), settings.VIEW_DEDUP_SECONDS)
+        pipe.execute()
+
+    @staticmethod
+    def track(label, pks, viewer):
+        '''records views of viewer on contents of a registered model, returns primary keys of first views.'''
+        pks = list(dict.fromkeys(pks))
+        if len(pks) == 0:
+            return []
+
+        redis = get_redis_connection('default')
+        ViewTracker.__load(redis, label, pks)
+
+        pipe = redis.pipeline(transaction=False)
+        for pk in pks:
+            pipe.sadd(ViewTracker.__seen_key(label, pk), viewer.uid)
+            pipe.expire(ViewTracker.__seen_key(label, pk), settings.VIEW_DEDUP_SECONDS)
+        added = pipe.execute()[::2]
+
+        viewed = [pk for pk, new in zip(pks, added) if new]
+        if len(viewed) > 0:
+            redis.rpush(ViewTracker.KEY, *[json.dumps({'model': label, 'id': pk, 'viewer': viewer.uid}) for pk in viewed])
+            Counters.incr_many(label, viewed, 'views_count')
+
+        return viewed
+
+    @staticmethod
+    def flush(size=1000):
+        '''inserts a batch of recorded views, returns number of views taken from queue.'''
+        redis = get_redis_connection('default')
+
+        # resuming batch of an interrupted flush, otherwise moving next batch to processing list
+        entries = redis.lrange(ViewTracker.PROCESSING_KEY, 0, -1)
+        if len(entries) == 0:
+            pipe = redis.pipeline()
+            for _ in range(size):
+                pipe.lmove(ViewTracker.KEY, ViewTracker.PROCESSING_KEY, 'LEFT', 'RIGHT')
+            entries = [entry for entry in pipe.execute() if entry is not None]
+
+        views = {}
+        for entry in entries:
+            entry = json.loads(entry)
+            views.setdefault(entry['model'], []).append((entry['id'], entry['viewer']))
+
+        # batch stays in processing list for the next flush if insert fails
+        with transaction.atomic():
+            for label, pairs in views.items():
+                view_label, content_field, viewer_field = ViewTracker.MODELS[label]
+
+                # skipping contents deleted meanwhile
+                existing = set(apps.get_model(label).objects.filter(pk__in={pk for pk, _ in pairs}).values_list('pk', flat=True))
+
+                view_model = apps.get_model(view_label)
+                view_model.objects.bulk_create([
+                    view_model(**{f'{content_field}_id': pk, f'{viewer_field}_id': uid})
+                    for pk, uid in pairs if pk in existing
+                ], ignore_conflicts=True)
+
+        redis.delete(ViewTracker.PROCESSING_KEY)
+        return len(entries)